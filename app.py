@@ -1,14 +1,27 @@
-from flask import Flask, render_template, request, redirect, url_for, send_file, flash, jsonify, get_flashed_messages, current_app
+from flask import Flask, render_template, request, redirect, url_for, send_file, flash, jsonify, get_flashed_messages, current_app, g
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 import sqlite3
-from datetime import datetime
+from datetime import datetime, timedelta
 import pytz
 import csv
 import io
 import os
 import logging
+import math
+import threading
+import click
+from concurrent.futures import ThreadPoolExecutor
 from typing import NamedTuple
+from db import (Database, ShardRouter, apply_pragmas, profile_pragmas, migrate, rebuild_daily_totals, split_into_shards,
+                DEFAULT_POOL_SIZE, DEFAULT_POOL_TIMEOUT, DEFAULT_PROFILE, DEFAULT_SHARD_MODE, DEFAULT_SHARD_BUCKETS,
+                DEFAULT_SHARD_CACHE_SIZE)
+from write_queue import GroupCommitWriter, DEFAULT_MAX_BATCH, DEFAULT_MAX_DELAY
+from recommender import Food, MACRO_LIMITS, solve
+from recommendation_cache import RecommendationCache, DEFAULT_CACHE_SIZE, DEFAULT_CACHE_TTL
+from solver_state import SolverStates, DEFAULT_MAX_USERS
+from recommendation_jobs import RecommendationJobs, JobQueueFull, DEFAULT_WORKERS, DEFAULT_MAX_PENDING
+from meal_planner import plan_meals, PlanCancelled, DEFAULT_PLAN_DAYS, DEFAULT_MAX_REPEATS
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG if os.environ.get('DEBUG') else logging.INFO)
@@ -20,11 +33,19 @@ app.config['TIMEZONE'] = os.getenv('TIMEZONE')
 app.config['TESTING'] = False  # Default to False, will be set to True in test environment
 
 
-class Food(NamedTuple):
-    id: int
-    name: str = ''
-    calories: int = 0
-    protein: int = 0
+class DayData(NamedTuple):
+    """Everything a request needs about one user's day, read once and passed around"""
+    date: str
+    log: list  # (id, food_name, calories, protein) rows in logging order
+    foods: list  # the user's quick add foods as Food tuples, in id order
+    total_calories: int = 0
+    total_protein: int = 0
+    total_carbs: int = 0
+    total_fat: int = 0
+
+    @property
+    def eaten_food_names(self):
+        return {entry[1] for entry in self.log}
 
 
 # Set the database path based on the environment
@@ -38,6 +59,71 @@ else:
 # Update app configuration
 app.config['DB_PATH'] = DB_PATH
 
+# Connection settings. Writes share one connection; DB_POOL_SIZE is the number of read-only
+# connections. A pool size of 0 opens a new connection for every request instead
+app.config['DB_POOL_SIZE'] = int(os.getenv('DB_POOL_SIZE', DEFAULT_POOL_SIZE))
+app.config['DB_POOL_TIMEOUT'] = float(os.getenv('DB_POOL_TIMEOUT', DEFAULT_POOL_TIMEOUT))
+# Pragma profile ('durable', 'balanced' or 'fast', see db.PRAGMA_PROFILES) run on every connection
+app.config['DB_PROFILE'] = os.getenv('DB_PROFILE', DEFAULT_PROFILE)
+app.config['DB_PRAGMAS'] = {}  # PRAGMA name -> value pairs that override the profile
+
+# Sharding: 'none' keeps everything in DB_PATH; 'user' gives each user their own file and 'bucket'
+# one file per user_id % DB_SHARD_BUCKETS, under DB_SHARD_DIR. Logins always use DB_PATH.
+# At most DB_SHARD_CACHE_SIZE shard files are kept open at once
+app.config['DB_SHARD_MODE'] = os.getenv('DB_SHARD_MODE', DEFAULT_SHARD_MODE)
+app.config['DB_SHARD_BUCKETS'] = int(os.getenv('DB_SHARD_BUCKETS', DEFAULT_SHARD_BUCKETS))
+app.config['DB_SHARD_DIR'] = os.getenv('DB_SHARD_DIR')  # defaults to a 'shards' directory next to DB_PATH
+app.config['DB_SHARD_CACHE_SIZE'] = int(os.getenv('DB_SHARD_CACHE_SIZE', DEFAULT_SHARD_CACHE_SIZE))
+
+# Write-behind mode: food log inserts are group-committed by one writer thread.
+# Each request still waits until its row is committed before responding.
+app.config['LOG_WRITE_BEHIND'] = os.getenv('LOG_WRITE_BEHIND', '').lower() in ('1', 'true', 'yes')
+app.config['LOG_BATCH_SIZE'] = int(os.getenv('LOG_BATCH_SIZE', DEFAULT_MAX_BATCH))
+app.config['LOG_BATCH_DELAY_MS'] = float(os.getenv('LOG_BATCH_DELAY_MS', DEFAULT_MAX_DELAY * 1000))
+
+# Knapsack backend for recommendations: 'auto' (NumPy if installed), 'numpy' or 'python'
+app.config['RECOMMENDER_BACKEND'] = os.getenv('RECOMMENDER_BACKEND', 'auto')
+# Approximate recommendations count calories in buckets of RECOMMENDER_GRANULARITY kcal. 0 picks the
+# smallest bucket expected to finish within RECOMMENDER_LATENCY_MS. A request can also ask for
+# approximate=1 (and its own granularity) when this is off
+app.config['RECOMMENDER_APPROXIMATE'] = os.getenv('RECOMMENDER_APPROXIMATE', '').lower() in ('1', 'true', 'yes')
+app.config['RECOMMENDER_GRANULARITY'] = int(os.getenv('RECOMMENDER_GRANULARITY', 0))
+app.config['RECOMMENDER_LATENCY_MS'] = float(os.getenv('RECOMMENDER_LATENCY_MS', 50))
+# Suggest up to this many servings of each food, in half servings (0 suggests each food once at most).
+# A request can post its own max_servings, up to RECOMMENDER_SERVINGS_LIMIT
+app.config['RECOMMENDER_MAX_SERVINGS'] = float(os.getenv('RECOMMENDER_MAX_SERVINGS', 0))
+app.config['RECOMMENDER_SERVINGS_LIMIT'] = float(os.getenv('RECOMMENDER_SERVINGS_LIMIT', 10))
+# Answer within this many milliseconds, falling back to approximate or greedy suggestions when the exact
+# ones would take longer (0 always waits for the requested solver). A request can post its own deadline_ms,
+# up to RECOMMENDER_DEADLINE_LIMIT_MS
+app.config['RECOMMENDER_DEADLINE_MS'] = float(os.getenv('RECOMMENDER_DEADLINE_MS', 0))
+app.config['RECOMMENDER_DEADLINE_LIMIT_MS'] = float(os.getenv('RECOMMENDER_DEADLINE_LIMIT_MS', 10_000))
+# Return up to RECOMMENDER_K distinct suggestions per mode, the best with the rest as alternatives.
+# A request can post its own k, up to RECOMMENDER_MAX_K
+app.config['RECOMMENDER_K'] = int(os.getenv('RECOMMENDER_K', 1))
+app.config['RECOMMENDER_MAX_K'] = int(os.getenv('RECOMMENDER_MAX_K', 5))
+# Async mode: /get_recommendations hands the solve to a pool of RECOMMENDER_JOB_WORKERS processes and
+# returns a job id to poll at /recommendation_jobs/<id>; at most RECOMMENDER_JOB_QUEUE jobs are pending.
+# A request can post async=1 when this is off
+app.config['RECOMMENDER_ASYNC'] = os.getenv('RECOMMENDER_ASYNC', '').lower() in ('1', 'true', 'yes')
+app.config['RECOMMENDER_JOB_WORKERS'] = int(os.getenv('RECOMMENDER_JOB_WORKERS', DEFAULT_WORKERS))
+app.config['RECOMMENDER_JOB_QUEUE'] = int(os.getenv('RECOMMENDER_JOB_QUEUE', DEFAULT_MAX_PENDING))
+# Recommendation results are cached per user until their foods, log or goals change, for at most
+# RECOMMENDATION_CACHE_TTL seconds. A size of 0 turns the cache off
+app.config['RECOMMENDATION_CACHE_SIZE'] = int(os.getenv('RECOMMENDATION_CACHE_SIZE', DEFAULT_CACHE_SIZE))
+app.config['RECOMMENDATION_CACHE_TTL'] = float(os.getenv('RECOMMENDATION_CACHE_TTL', DEFAULT_CACHE_TTL))
+# Knapsack rows over each user's quick add list are kept between requests for up to
+# RECOMMENDER_STATE_USERS users (0 rebuilds the table on every request)
+app.config['RECOMMENDER_STATE_USERS'] = int(os.getenv('RECOMMENDER_STATE_USERS', DEFAULT_MAX_USERS))
+# Meal plans cover MEAL_PLAN_DAYS days (a request can ask for up to MEAL_PLAN_MAX_DAYS) with each quick add
+# food in at most MEAL_PLAN_MAX_REPEATS of them. They're planned on MEAL_PLAN_WORKERS threads, which can
+# stop a plan part way when it's cancelled, with at most MEAL_PLAN_QUEUE plans pending
+app.config['MEAL_PLAN_DAYS'] = int(os.getenv('MEAL_PLAN_DAYS', DEFAULT_PLAN_DAYS))
+app.config['MEAL_PLAN_MAX_DAYS'] = int(os.getenv('MEAL_PLAN_MAX_DAYS', 14))
+app.config['MEAL_PLAN_MAX_REPEATS'] = int(os.getenv('MEAL_PLAN_MAX_REPEATS', DEFAULT_MAX_REPEATS))
+app.config['MEAL_PLAN_WORKERS'] = int(os.getenv('MEAL_PLAN_WORKERS', 1))
+app.config['MEAL_PLAN_QUEUE'] = int(os.getenv('MEAL_PLAN_QUEUE', 8))
+
 # Default goals for new users
 DEFAULT_CALORIE_GOAL = 2000
 DEFAULT_PROTEIN_GOAL = 100
@@ -47,16 +133,23 @@ login_manager.init_app(app)
 login_manager.login_view = 'login'
 
 class User(UserMixin):
-    def __init__(self, id, username, calorie_goal=DEFAULT_CALORIE_GOAL, protein_goal=DEFAULT_PROTEIN_GOAL, weight_goal=None, weight_unit=0):
+    def __init__(self, id, username, calorie_goal=DEFAULT_CALORIE_GOAL, protein_goal=DEFAULT_PROTEIN_GOAL, weight_goal=None, weight_unit=0,
+                 carb_limit=None, fat_limit=None):
         self.id = id
         self.username = username
         self.calorie_goal = calorie_goal
         self.protein_goal = protein_goal
         self.weight_goal = weight_goal
         self.weight_unit = weight_unit  # 0 for kg, 1 for lbs
+        # Daily carb and fat limits in grams; None when the user hasn't set one
+        self.carb_limit = carb_limit
+        self.fat_limit = fat_limit
     
-    def update_goals(self, calorie_goal, protein_goal, weight_goal=None, weight_unit=None):
-        """Update the user's calorie, protein, weight goals and weight unit preference"""
+    def update_goals(self, calorie_goal, protein_goal, weight_goal=None, weight_unit=None, macro_limits=None):
+        """Update the user's calorie, protein, weight goals and weight unit preference.
+
+        macro_limits, if given, is the new (carb_limit, fat_limit), None in either for no limit.
+        """
         self.calorie_goal = calorie_goal
         self.protein_goal = protein_goal
         
@@ -66,9 +159,12 @@ class User(UserMixin):
         
         if weight_unit is not None:
             self.weight_unit = weight_unit
+
+        if macro_limits is not None:
+            self.carb_limit, self.fat_limit = macro_limits
             
         # Update the database with all settings
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_users_db()
         c = conn.cursor()
         
         # Build the SQL query and parameters based on what was provided
@@ -82,6 +178,10 @@ class User(UserMixin):
         if weight_unit is not None:
             sql_parts.append("weight_unit = ?")
             params.append(weight_unit)
+
+        if macro_limits is not None:
+            sql_parts += ["carb_limit = ?", "fat_limit = ?"]
+            params += list(macro_limits)
         
         # Complete the SQL query
         sql = f"UPDATE users SET {', '.join(sql_parts)} WHERE id = ?"
@@ -90,7 +190,6 @@ class User(UserMixin):
         # Execute the query
         c.execute(sql, params)
         conn.commit()
-        conn.close()
         
         return True
     
@@ -100,30 +199,22 @@ class User(UserMixin):
         if date is None:
             date = get_local_date().isoformat()
         
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_db(self.id)
         c = conn.cursor()
         
-        # Check if there's already a weight log for this date
-        c.execute("SELECT id, weight FROM weight_logs WHERE date = ? AND user_id = ?", (date, self.id))
-        existing_log = c.fetchone()
-        
-        if existing_log:
-            # Update existing log
-            c.execute("UPDATE weight_logs SET weight = ? WHERE id = ?", (weight, existing_log[0]))
-        else:
-            # Insert new log
-            c.execute("INSERT INTO weight_logs (date, weight, user_id) VALUES (?, ?, ?)", 
-                     (date, weight, self.id))
+        # Insert the log, or overwrite the weight if this date already has one
+        c.execute("""INSERT INTO weight_logs (date, weight, user_id) VALUES (?, ?, ?)
+                     ON CONFLICT (user_id, date) DO UPDATE SET weight = excluded.weight""", 
+                  (date, weight, self.id))
         
         conn.commit()
-        conn.close()
         
         return True
     
     def get_weight_logs(self, limit=30):
         """Get the user's weight logs, limited to the most recent entries"""
         
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_read_db(self.id)
         c = conn.cursor()
         
         c.execute("""SELECT date, weight FROM weight_logs 
@@ -141,25 +232,15 @@ class User(UserMixin):
             else:
                 converted_logs.append((date, weight))
         
-        conn.close()
         return converted_logs
 
 @login_manager.user_loader
 def load_user(user_id):
-    from flask import current_app
-    # Use the shared connection if in testing mode
-    if current_app.config['TESTING']:
-        conn = current_app.config['DB_CONNECTION']
-    else:
-        conn = sqlite3.connect(current_app.config['DB_PATH'])
-        
+    conn = get_users_read_db()
     c = conn.cursor()
     c.execute("SELECT * FROM users WHERE id = ?", (user_id,))
     user = c.fetchone()
     
-    if not current_app.config['TESTING']:
-        conn.close()
-    
     if user:
         # Explicitly map the database columns to User constructor arguments
         return User(
@@ -168,13 +249,17 @@ def load_user(user_id):
             calorie_goal=user[3],
             protein_goal=user[4],
             weight_goal=user[5],
-            weight_unit=user[6]
+            weight_unit=user[6],
+            carb_limit=user[7],
+            fat_limit=user[8]
         )
     return None
 
-def init_db():
-    """Initialize the database with the required tables."""
-    conn = sqlite3.connect(DB_PATH)
+def init_db(db_path=None):
+    """Initialize the database (DB_PATH, or a shard file) with the required tables."""
+    conn = sqlite3.connect(db_path or DB_PATH)
+    # journal_mode=WAL is stored in the database file, so setting it here switches it for every later connection
+    apply_pragmas(conn, profile_pragmas(app.config['DB_PROFILE'], app.config['DB_PRAGMAS']))
     c = conn.cursor()
     
     # Create users table
@@ -228,17 +313,289 @@ def init_db():
                   FOREIGN KEY (user_id) REFERENCES users(id))''')
     
     conn.commit()
+    
+    # Bring indexes and later schema changes up to date
+    migrate(conn)
     conn.close()
 
 
+_database = None
+_database_lock = threading.Lock()
+
+def get_database():
+    """Return the writer/reader connections for the current DB_PATH, replacing them if the path changed"""
+    global _database
+    with _database_lock:
+        if _database is None or _database.db_path != DB_PATH:
+            if _database is not None:
+                _database.close()
+            _database = Database(DB_PATH,
+                                 reader_pool_size=current_app.config['DB_POOL_SIZE'],
+                                 timeout=current_app.config['DB_POOL_TIMEOUT'],
+                                 pragmas=profile_pragmas(current_app.config['DB_PROFILE'],
+                                                         current_app.config['DB_PRAGMAS']))
+        return _database
+
+_shards = None
+
+def get_shards():
+    """Return the shard router for the current settings, or None when sharding is off"""
+    global _shards
+    config = current_app.config
+    if config['DB_SHARD_MODE'] == 'none':
+        return None
+    shard_dir = config['DB_SHARD_DIR'] or os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), 'shards')
+    with _database_lock:
+        if (_shards is None or _shards.shard_dir != shard_dir or _shards.mode != config['DB_SHARD_MODE']
+                or _shards.buckets != config['DB_SHARD_BUCKETS']):
+            if _shards is not None:
+                _shards.close()
+            _shards = ShardRouter(shard_dir, config['DB_SHARD_MODE'],
+                                  buckets=config['DB_SHARD_BUCKETS'],
+                                  cache_size=config['DB_SHARD_CACHE_SIZE'],
+                                  reader_pool_size=config['DB_POOL_SIZE'],
+                                  timeout=config['DB_POOL_TIMEOUT'],
+                                  pragmas=profile_pragmas(config['DB_PROFILE'], config['DB_PRAGMAS']),
+                                  setup=init_db)
+        return _shards
+
+def _checkout(role, user_data=True, user_id=None):
+    """Check a connection out once per app context and database; role is 'write' or 'read'.
+
+    With user_data the connection is to the database holding a user's data (the current
+    user's unless user_id is given), which is the main database unless sharding is on.
+    Otherwise it is to the main database, where the users table lives.
+    """
+    shards = get_shards() if user_data else None
+    if shards is not None and user_id is None:
+        user_id = current_user.id
+    path = shards.path_for(user_id) if shards is not None else DB_PATH
+    connections = g.setdefault('db_connections', {})
+    if (path, role) not in connections:
+        if shards is not None:
+            connections[path, role] = shards.acquire(user_id, role)
+        else:
+            pool = get_database().pool(role)
+            connections[path, role] = (pool, pool.acquire())
+    return connections[path, role][1]
+
+def get_db(user_id=None):
+    """Get this app context's read-write connection for a user's data (the current user's by default).
+
+    Use this in any route that writes, for its reads as well, so they see its uncommitted changes.
+    There is one writer per database file, so the first call may wait for another request.
+    """
+    return _checkout('write', user_id=user_id)
+
+def get_read_db(user_id=None):
+    """Get this app context's read-only connection for a user's data (the current user's by default)"""
+    return _checkout('read', user_id=user_id)
+
+def get_users_db():
+    """Get this app context's read-write connection to the main database, where the users table lives"""
+    return _checkout('write', user_data=False)
+
+def get_users_read_db():
+    """Get this app context's read-only connection to the main database"""
+    return _checkout('read', user_data=False)
+
+_log_writer = None
+
+def get_log_writer():
+    """Return the running write-behind writer for the current DB_PATH, starting it if needed"""
+    global _log_writer
+    database = get_database()
+    with _database_lock:
+        if _log_writer is None or _log_writer.db_path != DB_PATH or _log_writer.pool is not database.writer:
+            if _log_writer is not None:
+                _log_writer.stop()
+            # Batches are committed on the app's one writer connection, checked out per batch
+            _log_writer = GroupCommitWriter(DB_PATH,
+                                            max_batch=current_app.config['LOG_BATCH_SIZE'],
+                                            max_delay=current_app.config['LOG_BATCH_DELAY_MS'] / 1000,
+                                            pool=database.writer).start()
+        return _log_writer
+
+_recommendation_cache = None
+_recommendation_cache_path = None  # the DB_PATH whose results are in the cache
+
+def get_recommendation_cache():
+    """Return the recommendation cache for the current DB_PATH, creating it if needed"""
+    global _recommendation_cache, _recommendation_cache_path
+    with _database_lock:
+        if _recommendation_cache is None or _recommendation_cache_path != DB_PATH:
+            _recommendation_cache = RecommendationCache(current_app.config['RECOMMENDATION_CACHE_SIZE'],
+                                                        current_app.config['RECOMMENDATION_CACHE_TTL'])
+            _recommendation_cache_path = DB_PATH
+        return _recommendation_cache
+
+_solver_states = None
+_solver_states_path = None  # the DB_PATH whose catalogs are in the solver states
+
+def get_solver_states():
+    """Return the per-user solver states for the current DB_PATH, creating them if needed"""
+    global _solver_states, _solver_states_path
+    with _database_lock:
+        if _solver_states is None or _solver_states_path != DB_PATH:
+            _solver_states = SolverStates(current_app.config['RECOMMENDER_BACKEND'],
+                                          current_app.config['RECOMMENDER_STATE_USERS'])
+            _solver_states_path = DB_PATH
+        return _solver_states
+
+_recommendation_jobs = None
+
+def get_recommendation_jobs():
+    """Return the recommendation job pool, starting it if needed"""
+    global _recommendation_jobs
+    with _database_lock:
+        if _recommendation_jobs is None:
+            _recommendation_jobs = RecommendationJobs(current_app.config['RECOMMENDER_JOB_WORKERS'],
+                                                      current_app.config['RECOMMENDER_JOB_QUEUE'])
+        return _recommendation_jobs
+
+_meal_plan_jobs = None
+
+def get_meal_plan_jobs():
+    """Return the meal plan job pool, starting it if needed"""
+    global _meal_plan_jobs
+    with _database_lock:
+        if _meal_plan_jobs is None:
+            # Threads rather than processes, so a plan can share the user's solver state and be stopped part way
+            workers = current_app.config['MEAL_PLAN_WORKERS']
+            _meal_plan_jobs = RecommendationJobs(workers, current_app.config['MEAL_PLAN_QUEUE'],
+                                                 executor=ThreadPoolExecutor(workers, thread_name_prefix='meal-plan'))
+        return _meal_plan_jobs
+
+def invalidate_recommendations(user_id):
+    """Drop a user's cached recommendations after a change to their foods, log or goals"""
+    get_recommendation_cache().invalidate(user_id)
+
+def log_write_behind():
+    """Whether log inserts go through the write-behind writer.
+
+    The log writer only covers the main database file, so sharded layouts insert directly.
+    """
+    return current_app.config['LOG_WRITE_BEHIND'] and current_app.config['DB_SHARD_MODE'] == 'none'
+
+def get_log_db():
+    """Get the connection a route that logs food reads and inserts through.
+
+    In write-behind mode this is a reader: the log writer checks the one writer connection
+    out for each batch, so a route holding it while waiting on the queue would keep every
+    other request's insert out of the batch.
+    """
+    return get_read_db() if log_write_behind() else get_db()
+
+def insert_log_entry(conn, date, food_name, calories, protein, user_id, carbs=0, fat=0):
+    """Add a daily_log row and return its id.
+
+    In write-behind mode the row is committed by the log writer before this returns and
+    ``conn`` (from get_log_db()) isn't written to; otherwise it is inserted on ``conn`` and
+    the caller commits.
+    """
+    return insert_log_entries(conn, [(date, food_name, calories, protein, carbs, fat, user_id)])[0]
+
+def insert_log_entries(conn, rows):
+    """Add daily_log rows, each (date, food_name, calories, protein, carbs, fat, user_id), all or none, and
+    return their ids. As insert_log_entry(); in write-behind mode they go to the log writer as one write"""
+    sql = "INSERT INTO daily_log (date, food_name, calories, protein, carbs, fat, user_id) VALUES (?, ?, ?, ?, ?, ?, ?)"
+    if log_write_behind():
+        held = g.get('db_connections', {}).get((DB_PATH, 'write'))
+        if held is None:
+            return get_log_writer().execute_many(sql, rows)
+        # This app context already has the writer checked out, which the log writer would
+        # wait on forever, so insert and commit on it here instead
+        writer = held[1]
+        try:
+            log_ids = [writer.execute(sql, params).lastrowid for params in rows]
+        except sqlite3.Error:
+            writer.rollback()
+            raise
+        writer.commit()
+        return log_ids
+    return [conn.execute(sql, params).lastrowid for params in rows]
+
+@app.teardown_appcontext
+def close_db(exception=None):
+    """Return the app context's connections to the pools they came from"""
+    for pool, conn in g.pop('db_connections', {}).values():
+        pool.release(conn)
+
+
 def get_local_date():
     tz = pytz.timezone(os.environ.get('TIMEZONE', 'UTC'))
     return datetime.now(tz).date()
 
+def get_daily_totals(conn, user_id, date):
+    """Return (calories, protein, carbs, fat) logged by a user on a date, read from the trigger-maintained daily_totals"""
+    row = conn.execute("SELECT calories, protein, carbs, fat FROM daily_totals WHERE user_id = ? AND date = ?",
+                       (user_id, date)).fetchone()
+    return row if row else (0, 0, 0, 0)
+
+def request_macros():
+    """The optional (carbs, fat) grams of a posted food, 0 when left blank, or None if either isn't a whole number"""
+    return parse_macros(request.form.get('carbs', ''), request.form.get('fat', ''))
+
+def parse_macros(*values):
+    """Whole grams from form values as a tuple, 0 for a blank one, or None if any isn't a whole number"""
+    macros = []
+    for value in values:
+        value = value.strip()
+        if not value:
+            macros.append(0)
+        elif value.isdigit():
+            macros.append(int(value))
+        else:
+            return None
+    return tuple(macros)
+
+def load_day_data(conn, user_id, date):
+    """Read a user's log, quick add foods and totals for a date with one query per table"""
+    c = conn.cursor()
+    c.execute("""SELECT id, food_name, calories, protein 
+                 FROM daily_log 
+                 WHERE date = ? AND user_id = ?
+                 ORDER BY id""", (date, user_id))
+    log = c.fetchall()
+    
+    c.execute("SELECT id, name, calories, protein, carbs, fat FROM foods WHERE user_id = ? ORDER BY id", (user_id,))
+    foods = [Food(food_id, name, calories, protein, carbs=carbs, fat=fat)
+             for food_id, name, calories, protein, carbs, fat in c.fetchall()]
+    
+    return DayData(date, log, foods, *get_daily_totals(conn, user_id, date))
+
+@app.cli.command('rebuild-totals')
+def rebuild_totals_command():
+    """Recompute the daily_totals table from daily_log."""
+    shards = get_shards()
+    rows = 0
+    for db_path in [DB_PATH] + (shards.paths() if shards is not None else []):
+        conn = sqlite3.connect(db_path)
+        rows += rebuild_daily_totals(conn)
+        conn.commit()
+        conn.close()
+    click.echo(f"Rebuilt daily totals ({rows} user-days)")
+
+@app.cli.command('split-shards')
+def split_shards_command():
+    """Copy per-user data from DB_PATH into the shard files for DB_SHARD_MODE."""
+    shards = get_shards()
+    if shards is None:
+        raise click.UsageError("Set DB_SHARD_MODE to 'user' or 'bucket' before splitting the database")
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        copied = split_into_shards(conn, shards)
+    finally:
+        conn.close()
+    for table, rows in copied.items():
+        click.echo(f"{table}: {rows} rows copied")
+    click.echo(f"Shards are in {shards.shard_dir}; {DB_PATH} still holds the original rows")
+
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    conn = sqlite3.connect(DB_PATH)
+    # Read-only routes use a reader connection so they never queue behind the writer
+    conn = get_read_db()
     c = conn.cursor()
     
     # Get today's date in the user's timezone
@@ -251,26 +608,24 @@ def dashboard():
     has_summary = c.fetchone() is not None
     
     # Get today's log
-    c.execute("""SELECT id, food_name, calories, protein 
+    c.execute("""SELECT id, food_name, calories, protein, carbs, fat 
                  FROM daily_log 
                  WHERE date = ? AND user_id = ?""", 
               (today, current_user.id))
     daily_log = c.fetchall()
     
-    # Calculate totals
-    total_calories = sum(log[2] for log in daily_log)
-    total_protein = sum(log[3] for log in daily_log)
+    total_calories, total_protein, total_carbs, total_fat = get_daily_totals(conn, current_user.id, today)
     
     # Get quick add foods for the current user
     c.execute("SELECT id, name, calories, protein FROM foods WHERE user_id = ? ORDER BY name", (current_user.id,))
     foods = c.fetchall()
     
-    conn.close()
-    
     return render_template('dashboard.html', 
                           daily_log=daily_log,
                           total_calories=total_calories,
                           total_protein=total_protein,
+                          total_carbs=total_carbs,
+                          total_fat=total_fat,
                           foods=foods,
                           calorie_goal=current_user.calorie_goal,
                           protein_goal=current_user.protein_goal,
@@ -279,14 +634,14 @@ def dashboard():
 @app.route('/api/dashboard-stats')
 @login_required
 def dashboard_stats():
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_read_db()
     c = conn.cursor()
     
     # Get today's date in the user's timezone
     today = get_local_date().isoformat()
     
     # Get today's log
-    c.execute("""SELECT id, food_name, calories, protein 
+    c.execute("""SELECT id, food_name, calories, protein, carbs, fat 
                  FROM daily_log 
                  WHERE date = ? AND user_id = ?""", 
               (today, current_user.id))
@@ -298,24 +653,26 @@ def dashboard_stats():
             'id': entry[0],
             'food_name': entry[1],
             'calories': entry[2],
-            'protein': entry[3]
+            'protein': entry[3],
+            'carbs': entry[4],
+            'fat': entry[5]
         }
         for entry in daily_log
     ]
     
-    # Calculate totals
-    total_calories = sum(log[2] for log in daily_log)
-    total_protein = sum(log[3] for log in daily_log)
-    
-    conn.close()
+    total_calories, total_protein, total_carbs, total_fat = get_daily_totals(conn, current_user.id, today)
     
     return jsonify({
         'daily_log': formatted_log,
         'stats': {
             'total_calories': total_calories,
             'total_protein': total_protein,
+            'total_carbs': total_carbs,
+            'total_fat': total_fat,
             'calorie_goal': current_user.calorie_goal,
-            'protein_goal': current_user.protein_goal
+            'protein_goal': current_user.protein_goal,
+            'carb_limit': current_user.carb_limit,
+            'fat_limit': current_user.fat_limit
         }
     })
 
@@ -332,14 +689,15 @@ def edit_history():
         flash('Invalid date format. Please use YYYY-MM-DD.', 'error')
         return redirect(url_for('dashboard'))
     
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_read_db()
     c = conn.cursor()
     
     # Fetch the daily log for the selected date
-    c.execute("""SELECT id, food_name, calories, protein 
+    c.execute("""SELECT id, food_name, calories, protein, carbs, fat
                  FROM daily_log
                  WHERE date = ? AND user_id = ?""", (date_str, current_user.id))
-    daily_log = [{"id": row[0], "name": row[1], "calories": row[2], "protein": row[3]} for row in c.fetchall()]
+    daily_log = [{"id": row[0], "name": row[1], "calories": row[2], "protein": row[3], "carbs": row[4], "fat": row[5]}
+                 for row in c.fetchall()]
     
     # Fetch the daily summary for the selected date
     c.execute("""SELECT total_calories, total_protein, summary, calorie_goal, protein_goal 
@@ -347,8 +705,6 @@ def edit_history():
                  WHERE date = ? AND user_id = ?""", (date_str, current_user.id))
     summary = c.fetchone()
     
-    conn.close()
-    
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return jsonify({
             'daily_log': daily_log,
@@ -370,8 +726,17 @@ def update_history():
     new_food_names = request.form.getlist('new_food_name[]')
     new_food_calories = request.form.getlist('new_food_calories[]')
     new_food_protein = request.form.getlist('new_food_protein[]')
-
-    conn = sqlite3.connect(DB_PATH)
+    # Carbs and fat are optional, so rows may leave them out
+    new_food_carbs = request.form.getlist('new_food_carbs[]')
+    new_food_fat = request.form.getlist('new_food_fat[]')
+    new_food_macros = [parse_macros(new_food_carbs[i] if i < len(new_food_carbs) else '',
+                                    new_food_fat[i] if i < len(new_food_fat) else '')
+                       for i in range(len(new_food_names))]
+    if None in new_food_macros:
+        flash('Carbs and fat must be whole numbers of grams', 'error')
+        return redirect(url_for('edit_history', date=edit_date))
+
+    conn = get_db()
     c = conn.cursor()
 
     # Remove foods that were deleted on the edit page
@@ -380,10 +745,11 @@ def update_history():
               [edit_date, current_user.id] + existing_food_ids)
 
     # Add new foods
-    for name, calories, protein in zip(new_food_names, new_food_calories, new_food_protein):
-        c.execute("""INSERT INTO daily_log (date, food_name, calories, protein, user_id)
-                     VALUES (?, ?, ?, ?, ?)""", 
-                  (edit_date, name, calories, protein, current_user.id))
+    for name, calories, protein, (carbs, fat) in zip(new_food_names, new_food_calories, new_food_protein,
+                                                     new_food_macros):
+        c.execute("""INSERT INTO daily_log (date, food_name, calories, protein, carbs, fat, user_id)
+                     VALUES (?, ?, ?, ?, ?, ?, ?)""", 
+                  (edit_date, name, calories, protein, carbs, fat, current_user.id))
 
     # Fetch all foods for the day after updating
     c.execute("""SELECT food_name, calories, protein
@@ -399,43 +765,27 @@ def update_history():
     total_calories = sum(int(food[1]) for food in foods)
     total_protein = sum(int(food[2]) for food in foods)
 
-    # Check if there's a daily summary for the current date
-    c.execute("""SELECT id, calorie_goal, protein_goal FROM daily_summary 
-                 WHERE date = ? AND user_id = ?""", 
-              (edit_date, current_user.id))
-    existing_summary = c.fetchone()
-
-    if existing_summary:
-        # Update the existing summary, preserving the calorie_goal and protein_goal
-        c.execute("""UPDATE daily_summary 
-                     SET total_calories = ?, total_protein = ?, summary = ?
-                     WHERE date = ? AND user_id = ?""", 
-                  (total_calories, total_protein, summary, edit_date, current_user.id))
-    else:
-        # For a new summary of a past date, find the most recent previous summary
-        # and use its goal values
-        calorie_goal = current_user.calorie_goal
-        protein_goal = current_user.protein_goal
-        
-        # Find the most recent summary before the edit date
-        c.execute("""SELECT calorie_goal, protein_goal FROM daily_summary 
-                     WHERE date < ? AND user_id = ? 
-                     ORDER BY date DESC LIMIT 1""", 
-                  (edit_date, current_user.id))
-        previous_summary = c.fetchone()
-        
-        if previous_summary:
-            # Use the goals from the previous summary
-            calorie_goal, protein_goal = previous_summary
-        
-        # Insert a new summary with the determined goal values
-        c.execute("""INSERT INTO daily_summary 
-                     (date, total_calories, total_protein, summary, user_id, calorie_goal, protein_goal)
-                     VALUES (?, ?, ?, ?, ?, ?, ?)""", 
-                  (edit_date, total_calories, total_protein, summary, current_user.id, calorie_goal, protein_goal))
+    # Insert or update the summary in one statement. An existing summary keeps its
+    # calorie_goal and protein_goal; a new summary for a past date takes the goals of
+    # the most recent earlier summary, falling back to the user's current goals
+    c.execute("""INSERT INTO daily_summary 
+                 (date, total_calories, total_protein, summary, user_id, calorie_goal, protein_goal)
+                 VALUES (?, ?, ?, ?, ?,
+                         COALESCE((SELECT calorie_goal FROM daily_summary
+                                   WHERE date < ? AND user_id = ? ORDER BY date DESC LIMIT 1), ?),
+                         COALESCE((SELECT protein_goal FROM daily_summary
+                                   WHERE date < ? AND user_id = ? ORDER BY date DESC LIMIT 1), ?))
+                 ON CONFLICT (date, user_id) DO UPDATE SET
+                     total_calories = excluded.total_calories,
+                     total_protein = excluded.total_protein,
+                     summary = excluded.summary""", 
+              (edit_date, total_calories, total_protein, summary, current_user.id,
+               edit_date, current_user.id, current_user.calorie_goal,
+               edit_date, current_user.id, current_user.protein_goal))
 
     conn.commit()
-    conn.close()
+    # The edited day may be today
+    invalidate_recommendations(current_user.id)
 
     flash(f'Daily log for {edit_date} updated!', 'success')
     return redirect(url_for('edit_history'))
@@ -452,6 +802,7 @@ def quick_add_food():
     name = request.form.get('name')
     calories = request.form.get('calories', type=int)
     protein = request.form.get('protein', type=int)
+    macros = request_macros()
     
     if not name or not calories or not protein:
         return jsonify({
@@ -461,19 +812,30 @@ def quick_add_food():
                 'category': 'error'
             }
         })
+
+    if macros is None:
+        return jsonify({
+            'success': False,
+            'toast': {
+                'message': 'Carbs and fat must be whole numbers of grams',
+                'category': 'error'
+            }
+        })
+    carbs, fat = macros
     
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_db()
     c = conn.cursor()
     
     # Insert the food with the current user's ID
-    c.execute("INSERT INTO foods (name, calories, protein, user_id) VALUES (?, ?, ?, ?)", 
-              (name, calories, protein, current_user.id))
+    c.execute("INSERT INTO foods (name, calories, protein, carbs, fat, user_id) VALUES (?, ?, ?, ?, ?, ?)", 
+              (name, calories, protein, carbs, fat, current_user.id))
     
     # Get the ID of the newly inserted food
     food_id = c.lastrowid
     
     conn.commit()
-    conn.close()
+    invalidate_recommendations(current_user.id)
+    get_solver_states().add_food(current_user.id, Food(food_id, name, calories, protein, carbs=carbs, fat=fat))
     
     # Return the food data including the ID
     return jsonify({
@@ -486,7 +848,9 @@ def quick_add_food():
             'id': food_id,
             'name': name,
             'calories': calories,
-            'protein': protein
+            'protein': protein,
+            'carbs': carbs,
+            'fat': fat
         }
     })
 
@@ -498,24 +862,32 @@ def log_food():
     calories = int(request.form['calories'])
     protein = int(request.form['protein'])
     servings = float(request.form['servings'])
+    macros = request_macros()
+    if macros is None:
+        return jsonify({
+            "success": False,
+            "toast": {
+                "message": "Carbs and fat must be whole numbers of grams",
+                "category": "error"
+            }
+        }), 400
     
     total_calories = int(calories * servings)
     total_protein = int(protein * servings)
+    total_carbs = int(macros[0] * servings)
+    total_fat = int(macros[1] * servings)
     
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    conn = get_log_db()
     
     today = get_local_date().isoformat()
-    c.execute("INSERT INTO daily_log (date, food_name, calories, protein, user_id) VALUES (?, ?, ?, ?, ?)", 
-              (today, name, total_calories, total_protein, current_user.id))
-    log_id = c.lastrowid
+    log_id = insert_log_entry(conn, today, name, total_calories, total_protein, current_user.id,
+                              carbs=total_carbs, fat=total_fat)
     
-    # Calculate new totals
-    c.execute("SELECT SUM(calories), SUM(protein) FROM daily_log WHERE date = ? AND user_id = ?", (today, current_user.id))
-    total_calories_sum, total_protein_sum = c.fetchone()
+    # New totals, already updated by the daily_log trigger in this transaction (or the log writer's)
+    total_calories_sum, total_protein_sum, total_carbs_sum, total_fat_sum = get_daily_totals(conn, current_user.id, today)
     
     conn.commit()
-    conn.close()
+    invalidate_recommendations(current_user.id)
     
     # Return a standard JSON response with toast data
     return jsonify({
@@ -528,11 +900,15 @@ def log_food():
             "id": log_id,
             "food_name": name,
             "calories": total_calories,
-            "protein": total_protein
+            "protein": total_protein,
+            "carbs": total_carbs,
+            "fat": total_fat
         },
         "totals": {
             "calories": total_calories_sum,
-            "protein": total_protein_sum
+            "protein": total_protein_sum,
+            "carbs": total_carbs_sum,
+            "fat": total_fat_sum
         }
     })
 
@@ -545,27 +921,25 @@ def log_quick_food():
     if not food_id:
         return jsonify({'success': False, 'message': 'No food ID provided'})
     
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_log_db()
     c = conn.cursor()
     
     # Get the food details, ensuring it belongs to the current user
-    c.execute("SELECT name, calories, protein FROM foods WHERE id = ? AND user_id = ?", (food_id, current_user.id))
+    c.execute("SELECT name, calories, protein, carbs, fat FROM foods WHERE id = ? AND user_id = ?",
+              (food_id, current_user.id))
     food = c.fetchone()
     
     if not food:
-        conn.close()
         return jsonify({'success': False, 'message': 'Food not found or you do not have permission to log it'})
     
-    name, calories, protein = food
+    name, calories, protein, carbs, fat = food
     today = get_local_date().isoformat()
     
     # Insert into daily log
-    c.execute("INSERT INTO daily_log (date, food_name, calories, protein, user_id) VALUES (?, ?, ?, ?, ?)",
-             (today, name, calories, protein, current_user.id))
-    log_id = c.lastrowid
+    log_id = insert_log_entry(conn, today, name, calories, protein, current_user.id, carbs=carbs, fat=fat)
     
     conn.commit()
-    conn.close()
+    invalidate_recommendations(current_user.id)
     
     # Return the log entry and updated totals
     return jsonify({
@@ -578,11 +952,15 @@ def log_quick_food():
             'id': log_id,
             'food_name': name,
             'calories': calories,
-            'protein': protein
+            'protein': protein,
+            'carbs': carbs,
+            'fat': fat
         },
         'totals': {
             'calories': request.form.get('total_calories', type=int, default=0) + calories,
-            'protein': request.form.get('total_protein', type=int, default=0) + protein
+            'protein': request.form.get('total_protein', type=int, default=0) + protein,
+            'carbs': request.form.get('total_carbs', type=int, default=0) + carbs,
+            'fat': request.form.get('total_fat', type=int, default=0) + fat
         }
     })
 
@@ -590,19 +968,18 @@ def log_quick_food():
 @app.route('/remove_food/<int:log_id>', methods=['POST'])
 @login_required
 def remove_food(log_id):
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_db()
     c = conn.cursor()
     
     # Delete the log entry
     c.execute("DELETE FROM daily_log WHERE id = ? AND user_id = ?", (log_id, current_user.id))
     
-    # Calculate new totals
+    # New totals, already updated by the daily_log trigger in this transaction
     today = get_local_date().isoformat()
-    c.execute("SELECT SUM(calories), SUM(protein) FROM daily_log WHERE date = ? AND user_id = ?", (today, current_user.id))
-    total_calories, total_protein = c.fetchone()
+    total_calories, total_protein, total_carbs, total_fat = get_daily_totals(conn, current_user.id, today)
     
     conn.commit()
-    conn.close()
+    invalidate_recommendations(current_user.id)
     
     return jsonify({
         "success": True,
@@ -611,8 +988,10 @@ def remove_food(log_id):
             "category": "success"
         },
         "totals": {
-            "calories": total_calories or 0,
-            "protein": total_protein or 0
+            "calories": total_calories,
+            "protein": total_protein,
+            "carbs": total_carbs,
+            "fat": total_fat
         }
     })
 
@@ -633,7 +1012,7 @@ def remove_quick_add_food():
         flash('No food ID provided', 'error')
         return redirect(url_for('settings'))
     
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_db()
     try:
         c = conn.cursor()
         # First check if the food belongs to the current user
@@ -653,6 +1032,8 @@ def remove_quick_add_food():
         # Delete the food
         c.execute("DELETE FROM foods WHERE id = ? AND user_id = ?", (food_id, current_user.id))
         conn.commit()
+        invalidate_recommendations(current_user.id)
+        get_solver_states().remove_food(current_user.id, int(food_id))
         
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             return jsonify({
@@ -678,56 +1059,45 @@ def remove_quick_add_food():
             })
         flash('Database error occurred', 'error')
         return redirect(url_for('settings'))
-    finally:
-        conn.close()
 
 @app.route('/save_summary', methods=['POST'])
 @login_required
 def save_summary():
     today = get_local_date().isoformat()
     
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_db()
     c = conn.cursor()
     
     # Fetch all foods logged for today
-    c.execute("""SELECT food_name, calories, protein
+    c.execute("""SELECT food_name, calories, protein, carbs, fat
                  FROM daily_log
                  WHERE date = ? AND user_id = ?
                  ORDER BY id""", (today, current_user.id))
     foods = c.fetchall()
     
     # Create the summary string
-    summary = ", ".join([f"{name} {calories} ({protein})" for name, calories, protein in foods])
+    summary = ", ".join([f"{name} {calories} ({protein})" for name, calories, protein, _, _ in foods])
     
-    # Calculate total calories and protein
+    # Calculate total calories and protein, and the carbs and fat the dashboard shows beside them
     total_calories = sum(food[1] for food in foods)
     total_protein = sum(food[2] for food in foods)
-    
-    # Check if a summary already exists for today
-    c.execute("""SELECT id FROM daily_summary 
-                 WHERE date = ? AND user_id = ?""", 
-              (today, current_user.id))
-    existing_summary = c.fetchone()
-    
-    if existing_summary:
-        # Update existing summary
-        c.execute("""UPDATE daily_summary 
-                     SET total_calories = ?, total_protein = ?, summary = ?, 
-                         calorie_goal = ?, protein_goal = ?
-                     WHERE date = ? AND user_id = ?""", 
-                  (total_calories, total_protein, summary, 
-                   current_user.calorie_goal, current_user.protein_goal,
-                   today, current_user.id))
-    else:
-        # Insert new summary
-        c.execute("""INSERT INTO daily_summary 
-                     (date, total_calories, total_protein, summary, user_id, calorie_goal, protein_goal)
-                     VALUES (?, ?, ?, ?, ?, ?, ?)""", 
-                  (today, total_calories, total_protein, summary, 
-                   current_user.id, current_user.calorie_goal, current_user.protein_goal))
+    total_carbs = sum(food[3] for food in foods)
+    total_fat = sum(food[4] for food in foods)
+    
+    # Insert today's summary, or overwrite it (including today's goals) if one exists
+    c.execute("""INSERT INTO daily_summary 
+                 (date, total_calories, total_protein, summary, user_id, calorie_goal, protein_goal)
+                 VALUES (?, ?, ?, ?, ?, ?, ?)
+                 ON CONFLICT (date, user_id) DO UPDATE SET
+                     total_calories = excluded.total_calories,
+                     total_protein = excluded.total_protein,
+                     summary = excluded.summary,
+                     calorie_goal = excluded.calorie_goal,
+                     protein_goal = excluded.protein_goal""", 
+              (today, total_calories, total_protein, summary, 
+               current_user.id, current_user.calorie_goal, current_user.protein_goal))
     
     conn.commit()
-    conn.close()
     
     # Check if this is an AJAX request
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -736,7 +1106,9 @@ def save_summary():
             'message': 'Daily summary updated!',
             'totals': {
                 'calories': total_calories,
-                'protein': total_protein
+                'protein': total_protein,
+                'carbs': total_carbs,
+                'fat': total_fat
             }
         })
     
@@ -747,14 +1119,13 @@ def save_summary():
 @app.route('/export_csv')
 @login_required
 def export_csv():
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_read_db()
     c = conn.cursor()
     c.execute("""SELECT date, summary, total_calories, total_protein, calorie_goal, protein_goal 
                  FROM daily_summary
                  WHERE user_id = ?
                  ORDER BY date""", (current_user.id,))
     data = c.fetchall()
-    conn.close()
     
     output = io.StringIO()
     writer = csv.writer(output)
@@ -779,54 +1150,50 @@ def login():
         username = request.form['username']
         password = request.form['password']
 
-        conn = current_app.config['DB_CONNECTION'] if current_app.config.get('TESTING') else sqlite3.connect(current_app.config['DB_PATH'])
+        conn = get_users_read_db()
+        c = conn.cursor()
+        # Use COLLATE NOCASE to make the username search case-insensitive
+        c.execute("SELECT * FROM users WHERE username COLLATE NOCASE = ?", (username,))
+        user = c.fetchone()
         
-        try:
-            c = conn.cursor()
-            # Use COLLATE NOCASE to make the username search case-insensitive
-            c.execute("SELECT * FROM users WHERE username COLLATE NOCASE = ?", (username,))
-            user = c.fetchone()
-            
-            # First check if user exists and password matches
-            if user is None or not check_password_hash(user[2], password):
-                # Failed login - wrong username or password
-                if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-                    return jsonify({
-                        'success': False,
-                        'message': 'Invalid username or password'
-                    }), 401
-                flash('Invalid username or password', 'error')
-                return render_template('login.html'), 401
-
-            # If we get here, login is successful
-            # Create user object with all attributes
-            user_obj = User(
-                id=user[0],
-                username=user[1],
-                calorie_goal=user[3],
-                protein_goal=user[4],
-                weight_goal=user[5],
-                weight_unit=user[6]
-            )
-            login_user(user_obj)
-            
+        # First check if user exists and password matches
+        if user is None or not check_password_hash(user[2], password):
+            # Failed login - wrong username or password
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 return jsonify({
-                    'success': True,
-                    'redirect_url': url_for('dashboard'),
-                    'user': {
-                        'username': user_obj.username,
-                        'calorie_goal': user_obj.calorie_goal,
-                        'protein_goal': user_obj.protein_goal,
-                        'weight_goal': user_obj.weight_goal,
-                        'weight_unit': user_obj.weight_unit
-                    }
-                })
-            return redirect(url_for('dashboard'))
-            
-        finally:
-            if not current_app.config.get('TESTING'):
-                conn.close()
+                    'success': False,
+                    'message': 'Invalid username or password'
+                }), 401
+            flash('Invalid username or password', 'error')
+            return render_template('login.html'), 401
+
+        # If we get here, login is successful
+        # Create user object with all attributes
+        user_obj = User(
+            id=user[0],
+            username=user[1],
+            calorie_goal=user[3],
+            protein_goal=user[4],
+            weight_goal=user[5],
+            weight_unit=user[6],
+            carb_limit=user[7],
+            fat_limit=user[8]
+        )
+        login_user(user_obj)
+        
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return jsonify({
+                'success': True,
+                'redirect_url': url_for('dashboard'),
+                'user': {
+                    'username': user_obj.username,
+                    'calorie_goal': user_obj.calorie_goal,
+                    'protein_goal': user_obj.protein_goal,
+                    'weight_goal': user_obj.weight_goal,
+                    'weight_unit': user_obj.weight_unit
+                }
+            })
+        return redirect(url_for('dashboard'))
     
     # GET request
     return render_template('login.html')
@@ -846,22 +1213,18 @@ def register():
         # Check if there's already a user in the database
         # Skip this check if we're in testing mode
         if not app.config['TESTING']:
-            conn = sqlite3.connect(app.config['DB_PATH'])
-            try:
-                c = conn.cursor()
-                c.execute("SELECT COUNT(*) FROM users")
-                user_count = c.fetchone()[0]
-                if user_count > 1:
-                    flash('Only one user (the creator) is allowed in this application.', 'error')
-                    return redirect(url_for('index'))
-            finally:
-                conn.close()
+            c = get_users_read_db().cursor()
+            c.execute("SELECT COUNT(*) FROM users")
+            user_count = c.fetchone()[0]
+            if user_count > 1:
+                flash('Only one user (the creator) is allowed in this application.', 'error')
+                return redirect(url_for('index'))
         
         username = request.form['username']
         password = request.form['password']
         hashed_password = generate_password_hash(password)
         
-        conn = sqlite3.connect(app.config['DB_PATH'])
+        conn = get_users_db()
         try:
             c = conn.cursor()
             # First check if username exists
@@ -880,8 +1243,6 @@ def register():
             conn.rollback()
             flash('An error occurred during registration. Please try again.', 'error')
             return redirect(url_for('register'))
-        finally:
-            conn.close()
 
     return render_template('register.html')
 
@@ -904,132 +1265,340 @@ def internal_server_error(error):
 @app.route('/get_recommendations', methods=['POST'])
 @login_required
 def get_recommendations():
-    today = get_local_date().isoformat()
-    
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    day = load_day_data(get_read_db(), current_user.id, get_local_date().isoformat())
     
     # First check if user has at least 5 foods in their Quick Add section
-    c.execute("SELECT COUNT(*) FROM foods WHERE user_id = ?", (current_user.id,))
-    food_count = c.fetchone()[0]
+    food_count = len(day.foods)
     
     if food_count < 5:
-        conn.close()
         return jsonify({
             'insufficient_foods': True,
             'message': f'Please add at least 5 foods to your Quick Add section to get recommendations. You currently have {food_count} food{"s" if food_count != 1 else ""}.'
         })
     
-    c.execute("SELECT SUM(calories) FROM daily_log WHERE date = ? AND user_id = ?", (today, current_user.id))
-    total_calories = c.fetchone()[0] or 0
-    
-    c.execute("SELECT SUM(protein) FROM daily_log WHERE date = ? AND user_id = ?", (today, current_user.id))
-    total_protein = c.fetchone()[0] or 0
-    
-    conn.close()
-    
-    recommendations = food_recommendation(total_calories, total_protein)
+    options = {
+        'approximate': (app.config['RECOMMENDER_APPROXIMATE']
+                        or request.values.get('approximate', '').lower() in ('1', 'true', 'yes')),
+        'granularity': max(request.values.get('granularity', app.config['RECOMMENDER_GRANULARITY'], type=int) or 0, 0),
+        'max_servings': request.values.get('max_servings', app.config['RECOMMENDER_MAX_SERVINGS'], type=float),
+        'deadline_ms': request.values.get('deadline_ms', app.config['RECOMMENDER_DEADLINE_MS'], type=float),
+        'k': min(max(request.values.get('k', app.config['RECOMMENDER_K'], type=int) or 1, 1),
+                 app.config['RECOMMENDER_MAX_K']),
+    }
+    # nan and inf parse as floats too; they count as not given, and the rest are capped like k
+    for name, limit in (('max_servings', app.config['RECOMMENDER_SERVINGS_LIMIT']),
+                        ('deadline_ms', app.config['RECOMMENDER_DEADLINE_LIMIT_MS'])):
+        value = options[name]
+        options[name] = min(value, limit) if value and math.isfinite(value) and value > 0 else None
+
+    if app.config['RECOMMENDER_ASYNC'] or request.values.get('async', '').lower() in ('1', 'true', 'yes'):
+        return submit_recommendation_job(day, options)
+    recommendations, solve_info = food_recommendation(day, **options)
+    return jsonify(recommendation_response(recommendations, solve_info, day, options))
+
+@app.route('/recommendation_jobs/<job_id>')
+@login_required
+def recommendation_job(job_id):
+    """Poll an async recommendation job: pending, cancelled, failed, or done with the usual response"""
+    job = get_recommendation_jobs().get(current_user.id, job_id)
+    if job is None:
+        return jsonify({'status': 'missing', 'message': 'No such recommendation job'}), 404
+    if not job.future.done():
+        return jsonify({'status': 'pending', 'job_id': job_id})
+    if job.future.cancelled():
+        return jsonify({'status': 'cancelled', 'job_id': job_id})
+    if job.future.exception() is not None:
+        logger.error(f"Recommendation job {job_id} failed: {job.future.exception()!r}")
+        return jsonify({'status': 'failed', 'message': 'Error getting recommendations'}), 500
+    day, options = job.context
+    recommendations, solve_info = result = job.future.result()
+    if solve_info.method != 'greedy':
+        get_recommendation_cache().put(job.key, result)
+    return jsonify({'status': 'done', 'job_id': job_id,
+                    **recommendation_response(recommendations, solve_info, day, options)})
+
+@app.route('/meal_plan', methods=['POST'])
+@login_required
+def meal_plan():
+    """Start planning the next days' meals from the quick add list; poll the returned URL for the plan"""
+    foods = load_day_data(get_read_db(), current_user.id, get_local_date().isoformat()).foods
+    if len(foods) < 5:
+        return jsonify({
+            'insufficient_foods': True,
+            'message': f'Please add at least 5 foods to your Quick Add section to plan meals. You currently have {len(foods)} food{"s" if len(foods) != 1 else ""}.'
+        })
 
-    formatted_recommendations = {}
+    days = min(max(request.values.get('days', app.config['MEAL_PLAN_DAYS'], type=int) or 1, 1),
+               app.config['MEAL_PLAN_MAX_DAYS'])
+    max_repeats = max(request.values.get('max_repeats', app.config['MEAL_PLAN_MAX_REPEATS'], type=int) or 1, 1)
+    # Plans start tomorrow, so every day has the whole of its goals to fill
+    start = get_local_date() + timedelta(days=1)
+    calorie_goal, protein_goal = current_user.calorie_goal, current_user.protein_goal
+    key = ('meal_plan', start.isoformat(), days, max_repeats, calorie_goal, protein_goal,
+           tuple((food.id, food.calories, food.protein) for food in foods))
+    cancel = threading.Event()
+    try:
+        job_id = get_meal_plan_jobs().submit(
+            current_user.id, key, plan_meals, foods, calorie_goal, protein_goal, days=days, max_repeats=max_repeats,
+            backend=app.config['RECOMMENDER_BACKEND'], state=get_solver_states().get(current_user.id, foods),
+            cancel=cancel, context=(start, calorie_goal, protein_goal, max_repeats), cancel_event=cancel)
+    except JobQueueFull:
+        return jsonify({'status': 'busy', 'message': 'Too many meal plan requests, please try again'}), 503
+    return jsonify({'status': 'pending', 'job_id': job_id,
+                    'poll_url': url_for('meal_plan_job', job_id=job_id),
+                    'cancel_url': url_for('cancel_meal_plan_job', job_id=job_id)}), 202
+
+@app.route('/meal_plan_jobs/<job_id>')
+@login_required
+def meal_plan_job(job_id):
+    """Poll a meal plan: pending, cancelled, failed, or done with the plan"""
+    job = get_meal_plan_jobs().get(current_user.id, job_id)
+    if job is None:
+        return jsonify({'status': 'missing', 'message': 'No such meal plan'}), 404
+    if not job.future.done():
+        return jsonify({'status': 'pending', 'job_id': job_id})
+    if job.future.cancelled() or isinstance(job.future.exception(), PlanCancelled):
+        return jsonify({'status': 'cancelled', 'job_id': job_id})
+    if job.future.exception() is not None:
+        logger.error(f"Meal plan job {job_id} failed: {job.future.exception()!r}")
+        return jsonify({'status': 'failed', 'message': 'Error planning meals'}), 500
+    start, calorie_goal, protein_goal, max_repeats = job.context
+    return jsonify({'status': 'done', 'job_id': job_id,
+                    'plan': format_meal_plan(job.future.result(), start, calorie_goal, protein_goal, max_repeats)})
+
+@app.route('/meal_plan_jobs/<job_id>/cancel', methods=['POST'])
+@login_required
+def cancel_meal_plan_job(job_id):
+    """Stop a meal plan that is still being worked out"""
+    if not get_meal_plan_jobs().cancel(current_user.id, job_id):
+        return jsonify({'success': False, 'message': 'No meal plan in progress with that id'}), 404
+    return jsonify({'success': True, 'job_id': job_id})
 
-    for key, foods in recommendations.items():
-        if foods:
-            total_calories_rec = sum(food.calories for food in foods)
-            total_protein_rec = sum(food.protein for food in foods)
-            formatted_recommendations[key] = {
-                "foods": [
-                    {"name": food.name, "calories": food.calories, "protein": food.protein}
-                    for food in foods
-                ],
-                "total_calories": total_calories_rec,
-                "total_protein": total_protein_rec,
-                "day_total_calories": total_calories + total_calories_rec,
-                "day_total_protein": total_protein + total_protein_rec,
-            }
-        else:
-            formatted_recommendations[key] = None
+@app.route('/log_meal_plan', methods=['POST'])
+@login_required
+def log_meal_plan():
+    """Log a planned day's quick add foods (food_id[] with servings[]) on its date in one go"""
+    try:
+        date = datetime.strptime(request.form['date'], '%Y-%m-%d').date().isoformat()
+    except (KeyError, ValueError):
+        return jsonify({'success': False, 'message': 'A date (YYYY-MM-DD) is required'}), 400
+    food_ids = request.form.getlist('food_id[]', type=int)
+    servings = request.form.getlist('servings[]', type=float) or [1.0] * len(food_ids)
+    if not food_ids or len(servings) != len(food_ids):
+        return jsonify({'success': False, 'message': 'No foods to log'}), 400
+
+    conn = get_log_db()
+    rows = conn.execute("SELECT id, name, calories, protein, carbs, fat FROM foods WHERE user_id = ? AND id IN ({})".format(
+                            ','.join(['?'] * len(food_ids))), [current_user.id] + food_ids).fetchall()
+    owned = {row[0]: row[1:] for row in rows}
+    if set(food_ids) - set(owned):
+        return jsonify({'success': False, 'message': 'Food not found or you do not have permission to log it'}), 404
+
+    # One write for the whole day, so a failure part way logs none of it
+    entries = []
+    for food_id, count in zip(food_ids, servings):
+        name, calories, protein, carbs, fat = owned[food_id]
+        entries.append((date, name, int(calories * count), int(protein * count), int(carbs * count),
+                        int(fat * count), current_user.id))
+    insert_log_entries(conn, entries)
+    total_calories, total_protein, total_carbs, total_fat = get_daily_totals(conn, current_user.id, date)
+    conn.commit()
+    invalidate_recommendations(current_user.id)
 
-    return jsonify(formatted_recommendations)
+    return jsonify({
+        'success': True,
+        'toast': {
+            'message': f"Logged {len(food_ids)} planned food{'s' if len(food_ids) != 1 else ''} for {date}",
+            'category': 'success'
+        },
+        'logged': len(food_ids),
+        'totals': {'date': date, 'calories': total_calories, 'protein': total_protein, 'carbs': total_carbs,
+                   'fat': total_fat}
+    })
 
-def food_recommendation(total_calories, total_protein): 
-    """    Compare to pre-set calorie/protein goals; determine remaining calories/protein for the day 
-    Recommend based on remaining calories/protein
-    Return a list of recommended foods"""
-    # TODO: update this algorithm 
+def format_meal_plan(plan, start, calorie_goal, protein_goal, max_repeats):
+    """The JSON for a plan_meals() plan, each day dated from ``start`` with its foods ready for /log_meal_plan"""
+    return {
+        'calorie_goal': calorie_goal,
+        'protein_goal': protein_goal,
+        'max_repeats': max_repeats,
+        'days': [
+            {
+                'date': (start + timedelta(days=i)).isoformat(),
+                'mode': day.mode,
+                'foods': [{'food_id': food.id, 'name': food.name, 'calories': food.calories,
+                           'protein': food.protein, 'carbs': food.carbs, 'fat': food.fat,
+                           'servings': food.servings} for food in day.foods],
+                'total_calories': day.total_calories,
+                'total_protein': day.total_protein,
+            }
+            for i, day in enumerate(plan)
+        ],
+    }
 
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+def recommendation_response(recommendations, solve_info, day, options):
+    """The JSON body for a set of recommendations and the options they were asked for"""
+    # Macro-limited suggestions don't come with alternatives
+    if options['k'] > 1 and not solve_info.buckets:
+        response = format_alternatives(recommendations, day)
+    else:
+        response = format_recommendations(recommendations, day)
+    if solve_info.buckets:
+        if solve_info.method == 'approximate':
+            # Foods are rounded up to whole buckets, so suggestions keep to every limit but may leave
+            # up to the bucket less 1 of each unused per food in them
+            response['approximation'] = {'max_unused_per_food': {
+                name: bucket - 1 for name, bucket in zip(MACRO_LIMITS, solve_info.buckets) if bucket is not None}}
+    elif options['approximate'] or solve_info.method == 'approximate':
+        # Suggestions can go over the calorie limit by up to this much per food in them
+        response['approximation'] = {'granularity': solve_info.granularity,
+                                     'max_extra_calories_per_food': solve_info.granularity - 1}
+    if solve_info.buckets:
+        remaining_carbs, remaining_fat = macro_limits_left(day)
+        # Each limit is counted in buckets, 1 where it's exact
+        response['macro_limits'] = {
+            'remaining_carbs': remaining_carbs,
+            'remaining_fat': remaining_fat,
+            'buckets': dict(zip(MACRO_LIMITS, solve_info.buckets)),
+        }
+    if options['deadline_ms']:
+        response['solver'] = {'method': solve_info.method, 'exact': solve_info.exact,
+                              'solve_ms': round(solve_info.solve_ms, 3), 'gap': round(solve_info.gap, 4),
+                              'pruned': solve_info.pruned}
+    return response
 
-    # Get today's date
-    today = get_local_date().isoformat()
+def submit_recommendation_job(day, options):
+    """Answer from the cache if possible, otherwise start (or join) a job and return its id"""
+    available_foods, eaten_foods, remaining_calories, remaining_protein = recommendation_inputs(day)
+    remaining_carbs, remaining_fat = macro_limits_left(day)
+    key = recommendation_key(eaten_foods, remaining_calories, remaining_protein, options, (remaining_carbs, remaining_fat),
+                             day.foods)
+    cached = get_recommendation_cache().get(key)
+    if cached is not None:
+        return jsonify({'status': 'done', **recommendation_response(*cached, day, options)})
+    try:
+        job_id = get_recommendation_jobs().submit(
+            current_user.id, key, solve, available_foods, remaining_calories, remaining_protein,
+            backend=app.config['RECOMMENDER_BACKEND'], latency_budget_ms=app.config['RECOMMENDER_LATENCY_MS'],
+            remaining_carbs=remaining_carbs, remaining_fat=remaining_fat, context=(day, options), **options)
+    except JobQueueFull:
+        return jsonify({'status': 'busy', 'message': 'Too many recommendation requests, please try again'}), 503
+    return jsonify({'status': 'pending', 'job_id': job_id,
+                    'poll_url': url_for('recommendation_job', job_id=job_id)}), 202
+
+def format_recommendations(recommendations, day):
+    """Shape food_recommendation's output for the JSON response, adding the day's running totals"""
+    formatted_recommendations = {}
 
-    # Fetch foods eaten today from the daily log
-    c.execute("SELECT DISTINCT food_name FROM daily_log WHERE date = ? AND user_id = ?", (today, current_user.id))
-    eaten_foods = [row[0] for row in c.fetchall()] # a list of tuples in fetchall, extract the food name into list
+    for key, foods in recommendations.items():
+        formatted_recommendations[key] = format_suggestion(foods, day)
 
-    # Fetch all foods and filter out the ones eaten today
-    foods = c.execute("SELECT * FROM foods WHERE user_id = ?", (current_user.id,)).fetchall()
-    available_foods = [Food(id=row[0], name=row[1], calories=row[2], protein=row[3]) for row in foods if row[1] not in eaten_foods]  # row[1] is the food name
-    n = len(available_foods)
+    return formatted_recommendations
 
-    conn.close()
+def format_alternatives(recommendations, day):
+    """Like format_recommendations for k suggestions per mode: the best, with the others as its alternatives"""
+    formatted_recommendations = {}
 
-    # Calculate remaining calories/protein for the day 
-    remaining_calories = max(0, current_user.calorie_goal - total_calories)
-    remaining_protein = max(0, current_user.protein_goal - total_protein)
-
-    def knapsack(n, W, wt, val):
-        K = [[0 for _ in range(W + 1)] for _ in range(n + 1)]
-        for i in range(n + 1):
-            for w in range(W + 1):
-                if i == 0 or w == 0:
-                    K[i][w] = 0
-                elif wt[i-1] <= w:
-                    K[i][w] = max(val[i-1] + K[i-1][w-wt[i-1]], K[i-1][w])
-                else:
-                    K[i][w] = K[i-1][w]
-        return K
-
-    def backtrack(K, wt, val, n, W):
-        res = []
-        w = W
-        for i in range(n, 0, -1):
-            if K[i][w] != K[i-1][w]:
-                res.append(available_foods[i-1])
-                w -= wt[i-1]
-        return res
-
-    weights = [food.calories for food in available_foods]
-    values = [food.protein for food in available_foods]
-    n = len(available_foods)
-
-    hit_both = None
-    prioritize_protein = None
-    prioritize_calories = None
-
-    # Priority 1: hit_both
-    K = knapsack(n, remaining_calories, weights, values)
-    if K[n][remaining_calories] >= remaining_protein:
-        hit_both = backtrack(K, weights, values, n, remaining_calories)
-
-    # Priority 2: prioritize_protein (protein_first)
-    max_calories = sum(weights)
-    K = knapsack(n, max_calories, weights, values)
-    for cal in range(remaining_calories, max_calories + 1):
-        if K[n][cal] >= remaining_protein:
-            prioritize_protein = backtrack(K, weights, values, n, cal)
-            break
-
-    # Priority 3: prioritize_calories (calorie_first)
-    K = knapsack(n, remaining_calories, weights, values)
-    prioritize_calories = backtrack(K, weights, values, n, remaining_calories)
+    for key, suggestions in recommendations.items():
+        if suggestions:
+            formatted_recommendations[key] = {
+                **format_suggestion(suggestions[0], day),
+                "alternatives": [format_suggestion(foods, day) for foods in suggestions[1:]],
+            }
+        else:
+            formatted_recommendations[key] = None
 
+    return formatted_recommendations
+
+def format_suggestion(foods, day):
+    """One suggested list of foods with its totals, or None if it's empty"""
+    if not foods:
+        return None
+    total_calories_rec = sum(food.calories for food in foods)
+    total_protein_rec = sum(food.protein for food in foods)
+    total_carbs_rec = sum(food.carbs for food in foods)
+    total_fat_rec = sum(food.fat for food in foods)
     return {
-        "hit_both": hit_both,
-        "protein_first": prioritize_protein,
-        "calorie_first": prioritize_calories
+        "foods": [
+            {"name": food.name, "calories": food.calories, "protein": food.protein,
+             "carbs": food.carbs, "fat": food.fat, "servings": food.servings}
+            for food in foods
+        ],
+        "total_calories": total_calories_rec,
+        "total_protein": total_protein_rec,
+        "total_carbs": total_carbs_rec,
+        "total_fat": total_fat_rec,
+        "day_total_calories": day.total_calories + total_calories_rec,
+        "day_total_protein": day.total_protein + total_protein_rec,
+        "day_total_carbs": day.total_carbs + total_carbs_rec,
+        "day_total_fat": day.total_fat + total_fat_rec,
     }
 
+def recommendation_inputs(day):
+    """The foods not eaten yet, the names eaten, and the calories/protein left for the day"""
+    # Skip foods already eaten today
+    eaten_foods = day.eaten_food_names
+    available_foods = [food for food in day.foods if food.name not in eaten_foods]
+
+    # Calculate remaining calories/protein for the day 
+    remaining_calories = max(0, current_user.calorie_goal - day.total_calories)
+    remaining_protein = max(0, current_user.protein_goal - day.total_protein)
+    return available_foods, eaten_foods, remaining_calories, remaining_protein
+
+def macro_limits_left(day):
+    """The (carbs, fat) grams left under the user's daily limits, None for a limit they haven't set"""
+    return tuple(None if limit is None else max(0, limit - total)
+                 for limit, total in ((current_user.carb_limit, day.total_carbs),
+                                      (current_user.fat_limit, day.total_fat)))
+
+def recommendation_key(eaten_foods, remaining_calories, remaining_protein, options, macro_limits=(None, None),
+                       catalog=()):
+    # The catalog's food ids tie the entry to the list it was solved from: the version is read after
+    # the foods were loaded, so a quick add in between would otherwise file an old result under it
+    return get_recommendation_cache().key(current_user.id, eaten_foods, remaining_calories, remaining_protein,
+                                          app.config['RECOMMENDER_BACKEND'], options['approximate'],
+                                          options['granularity'], options['max_servings'], options['deadline_ms'],
+                                          options['k'], macro_limits, tuple(food.id for food in catalog))
+
+def food_recommendation(day, approximate=False, granularity=0, max_servings=None, deadline_ms=None, k=1):
+    """    Compare to pre-set calorie/protein goals; determine remaining calories/protein for the day 
+    Recommend based on remaining calories/protein
+    Return a list of recommended foods, and a recommender.Solve saying how they were found.
+    When approximate, a granularity of 0 is chosen from RECOMMENDER_LATENCY_MS.
+    With max_servings, foods can be recommended in half servings up to that many.
+    With deadline_ms, the answer may be approximate or greedy to arrive in time.
+    With k above 1, each mode has a list of up to k suggestions instead, best first.
+    With a carb or fat limit set, suggestions keep to what is left of those too (hit_both and calorie_first only)"""
+    # TODO: update this algorithm 
+    available_foods, eaten_foods, remaining_calories, remaining_protein = recommendation_inputs(day)
+    remaining_carbs, remaining_fat = macro_limits_left(day)
+
+    cache = get_recommendation_cache()
+    key = recommendation_key(eaten_foods, remaining_calories, remaining_protein,
+                             {'approximate': approximate, 'granularity': granularity,
+                              'max_servings': max_servings, 'deadline_ms': deadline_ms, 'k': k},
+                             (remaining_carbs, remaining_fat), day.foods)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    # Exact single-serving tables come from the rows kept for the user's whole list, with today's
+    # foods left out
+    uses_state = max_servings is None and k == 1 and remaining_carbs is None and remaining_fat is None
+    state = get_solver_states().get(current_user.id, day.foods) if uses_state else None
+    result = solve(available_foods, remaining_calories, remaining_protein, backend=app.config['RECOMMENDER_BACKEND'],
+                   approximate=approximate, granularity=granularity, max_servings=max_servings,
+                   deadline_ms=deadline_ms, latency_budget_ms=app.config['RECOMMENDER_LATENCY_MS'], state=state, k=k,
+                   remaining_carbs=remaining_carbs, remaining_fat=remaining_fat)
+    solve_info = result[1]
+    logger.info(f"Recommendations for user {current_user.id}: {solve_info.method} in {solve_info.solve_ms:.1f} ms, "
+                f"gap {solve_info.gap:.1%}, {solve_info.pruned} foods pruned")
+
+    # Best-effort answers aren't cached, so the next request can try again for a better one
+    if solve_info.method != 'greedy':
+        cache.put(key, result)
+    return result
+
 @app.route('/api/testimonials')
 def get_testimonials():
     testimonials = [
@@ -1068,7 +1637,7 @@ def settings():
     today_calories = 0
     today_protein = 0
     
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_read_db()
     c = conn.cursor()
     today = get_local_date().isoformat()
     
@@ -1082,15 +1651,8 @@ def settings():
     if summary:
         today_calories, today_protein = summary
     else:
-        # If no summary, calculate from daily log
-        c.execute("""SELECT SUM(calories), SUM(protein) 
-                     FROM daily_log 
-                     WHERE date = ? AND user_id = ?""", 
-                  (today, current_user.id))
-        log_totals = c.fetchone()
-        
-        if log_totals[0] is not None:
-            today_calories, today_protein = log_totals
+        # If no summary, use the running totals of the daily log
+        today_calories, today_protein = get_daily_totals(conn, current_user.id, today)[:2]
     
     # Get weight logs
     weight_logs = current_user.get_weight_logs(limit=10)
@@ -1099,8 +1661,6 @@ def settings():
     c.execute("SELECT id, name, calories, protein FROM foods WHERE user_id = ? ORDER BY name", (current_user.id,))
     foods = c.fetchall()
     
-    conn.close()
-    
     # If this is an AJAX request, return only the quick add foods section
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return render_template('settings.html', 
@@ -1189,6 +1749,24 @@ def update_settings():
             })
         flash('Calorie and protein goals must be positive numbers.', 'error')
         return redirect(url_for('settings'))
+
+    # Carb and fat limits are optional: left blank means no limit, and forms without the
+    # fields leave the current limits alone
+    macro_limits = None
+    if 'carb_limit' in request.form or 'fat_limit' in request.form:
+        values = [request.form.get(field, '').strip() for field in ('carb_limit', 'fat_limit')]
+        if not all(value == '' or value.isdigit() for value in values):
+            if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+                return jsonify({
+                    'success': False,
+                    'toast': {
+                        'message': 'Carb and fat limits must be whole numbers of grams, or blank for no limit.',
+                        'category': 'error'
+                    }
+                })
+            flash('Carb and fat limits must be whole numbers of grams, or blank for no limit.', 'error')
+            return redirect(url_for('settings'))
+        macro_limits = tuple(int(value) if value else None for value in values)
     
     # Handle weight goal conversion - the frontend now sends the raw input value
     # and a display unit indicator, so we always need to convert if the unit is pounds
@@ -1217,18 +1795,21 @@ def update_settings():
     
     # Debug the final values before updating
     logger.debug(f"Updating user goals: calorie_goal={calorie_goal}, protein_goal={protein_goal}, " +
-                f"weight_goal={weight_goal}, weight_unit={form_weight_unit}")
+                f"weight_goal={weight_goal}, weight_unit={form_weight_unit}, macro_limits={macro_limits}")
     
     current_user.update_goals(
         calorie_goal, 
         protein_goal, 
         weight_goal=weight_goal, 
-        weight_unit=form_weight_unit  # This will be None if not provided in the form
+        weight_unit=form_weight_unit,  # This will be None if not provided in the form
+        macro_limits=macro_limits
     )
     
     # Log the current weight if provided (now in kg)
     if current_weight is not None and current_weight > 0:
         current_user.log_weight(current_weight)
+
+    invalidate_recommendations(current_user.id)
     
     # Check if this is an AJAX request
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -1249,7 +1830,7 @@ def update_settings():
 @app.route('/history')
 @login_required
 def history():
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_read_db()
     c = conn.cursor()
     
     # Get all data for the user for charts (ascending order for proper timeline)
@@ -1297,8 +1878,6 @@ def history():
         if current_user.weight_unit == 1:  # If user prefers lbs and goal is stored in kg
             weight_goal = round(weight_goal * 2.20462, 1)  # Convert kg to lbs
     
-    conn.close()
-    
     return render_template('history.html', 
                           weekly_summaries=weekly_summaries,  # This is now in descending order
                           chart_dates=dates,
@@ -1336,6 +1915,23 @@ def update_weight_unit():
             'message': 'Failed to update weight unit preference.'
         }), 400
 
+@app.route('/api/recommendation-cache-stats')
+@login_required
+def recommendation_cache_stats():
+    """Counters for the recommendation cache, the per-user solver state, async jobs and meal plans"""
+    return jsonify({'enabled': app.config['RECOMMENDATION_CACHE_SIZE'] > 0, **get_recommendation_cache().stats(),
+                    'solver_state': get_solver_states().stats(),
+                    'jobs': _recommendation_jobs.stats() if _recommendation_jobs is not None else None,
+                    'meal_plans': _meal_plan_jobs.stats() if _meal_plan_jobs is not None else None})
+
+@app.route('/api/write-queue-stats')
+@login_required
+def write_queue_stats():
+    """Metrics for the write-behind log writer"""
+    if not app.config['LOG_WRITE_BEHIND']:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **get_log_writer().stats()})
+
 # TODO
 @app.after_request
 def add_header(response):
@@ -1346,21 +1942,6 @@ def add_header(response):
         response.headers['Expires'] = '0'
     return response
 
-def get_db_connection():
-    """Get a database connection - uses test connection if available"""
-    # Check if we're in a test environment with a pre-configured connection
-    if current_app.config.get('TESTING') and 'DB_CONNECTION' in current_app.config:
-        return current_app.config['DB_CONNECTION']
-        
-    # Normal database connection logic for production/development
-    conn = sqlite3.connect(current_app.config['DB_PATH'])
-    conn.row_factory = sqlite3.Row
-    return conn
-
-    
-    # Redirect to the index page to see the flashed messages
-    return redirect(url_for('index'))
-
 if __name__ == '__main__':
     init_db()
     app.run(debug=True)
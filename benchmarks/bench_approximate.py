@@ -0,0 +1,54 @@
+"""Latency and error of approximate recommendations at each calorie granularity versus the exact frontier.
+
+Error is the worst case over the catalogs: protein short of the exact hit_both suggestion (never above 0)
+and calories over the remaining budget, next to the stated bound of granularity - 1 kcal per food.
+
+    python -m benchmarks.bench_approximate [iterations]
+"""
+import random
+import sys
+
+from benchmarks.common import time_calls, summarize
+from recommender import Food, choose_granularity, recommend
+
+CATALOG_SIZE = 200
+REMAINING_CALORIES = 6000
+REMAINING_PROTEIN = 300
+GRANULARITIES = (1, 5, 10, 25, 50)
+LATENCY_BUDGETS_MS = (200, 50, 10)
+CATALOGS = 5
+
+
+def make_catalog(n, seed=0):
+    rng = random.Random(seed)
+    return [Food(i, f'Food {i}', rng.randint(50, 600), rng.randint(0, 45)) for i in range(n)]
+
+
+def main(iterations=3):
+    catalogs = [make_catalog(CATALOG_SIZE, seed) for seed in range(CATALOGS)]
+    exact = [recommend(foods, REMAINING_CALORIES, REMAINING_PROTEIN)['hit_both'] for foods in catalogs]
+
+    print(f"{CATALOG_SIZE} foods, {REMAINING_CALORIES} kcal / {REMAINING_PROTEIN} g left")
+    print(f"{'granularity':>11} {'mean ms':>8} {'p95 ms':>8} {'protein short':>13} {'kcal over':>9} {'bound':>6}")
+    for granularity in GRANULARITIES:
+        short = over = bound = 0
+        for foods, expected in zip(catalogs, exact):
+            chosen = recommend(foods, REMAINING_CALORIES, REMAINING_PROTEIN, granularity=granularity)['hit_both']
+            short = max(short, sum(f.protein for f in expected) - sum(f.protein for f in chosen))
+            over = max(over, sum(f.calories for f in chosen) - REMAINING_CALORIES)
+            bound = max(bound, len(chosen) * (granularity - 1))
+        stats = summarize(time_calls(lambda: recommend(catalogs[0], REMAINING_CALORIES, REMAINING_PROTEIN,
+                                                       granularity=granularity), iterations))
+        print(f"{granularity:11d} {stats['mean_ms']:8.1f} {stats['p95_ms']:8.1f} {short:13d} {over:9d} {bound:6d}")
+
+    print()
+    print(f"{'budget ms':>9} {'granularity':>11} {'mean ms':>8}")
+    for budget in LATENCY_BUDGETS_MS:
+        granularity = choose_granularity(catalogs[0], REMAINING_CALORIES, REMAINING_PROTEIN, budget)
+        stats = summarize(time_calls(lambda: recommend(catalogs[0], REMAINING_CALORIES, REMAINING_PROTEIN,
+                                                       granularity=granularity), iterations))
+        print(f"{budget:9d} {granularity:11d} {stats['mean_ms']:8.1f}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
@@ -0,0 +1,41 @@
+"""Per-request cost of the hot JSON endpoints with and without connection pooling.
+
+A pool size of 0 reproduces the old behaviour of opening a connection per call.
+
+    python -m benchmarks.bench_connection_pool [iterations]
+"""
+import sys
+
+from benchmarks.common import bench_app, logged_in_client, time_calls, summarize
+
+FOOD = {'name': 'Oats', 'calories': '150', 'protein': '5', 'servings': '1'}
+
+
+def run_endpoints(client, iterations):
+    results = {}
+    results['GET /api/dashboard-stats'] = time_calls(lambda: client.get('/api/dashboard-stats'), iterations)
+    results['POST /log_food'] = time_calls(lambda: client.post('/log_food', data=FOOD), iterations)
+
+    log_ids = [entry['id'] for entry in client.get('/api/dashboard-stats').get_json()['daily_log']]
+    ids = iter(log_ids)
+    results['POST /remove_food'] = time_calls(lambda: client.post(f'/remove_food/{next(ids)}'),
+                                              min(iterations, len(log_ids)))
+    return results
+
+
+def main(iterations=500):
+    rows = {}
+    for label, pool_size in (('before (no pool)', 0), ('after (pool of 5)', 5)):
+        with bench_app(DB_POOL_SIZE=pool_size) as flask_app:
+            client = logged_in_client(flask_app)
+            for endpoint, samples in run_endpoints(client, iterations).items():
+                rows.setdefault(endpoint, {})[label] = summarize(samples)
+
+    print(f"{'endpoint':28} {'mode':20} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for endpoint, modes in rows.items():
+        for label, stats in modes.items():
+            print(f"{endpoint:28} {label:20} {stats['mean_ms']:8.3f} {stats['p50_ms']:8.3f} {stats['p95_ms']:8.3f}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
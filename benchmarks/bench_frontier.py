@@ -0,0 +1,52 @@
+"""DP work per recommendation: three separate tables versus one shared frontier.
+
+The original solver fills two (n+1) x (remaining kcal + 1) tables and one
+(n+1) x (catalog kcal + 1) table. The frontier fills one table sized from the
+goals, plus a small protein-indexed DP that sizes it. Cells are DP entries filled;
+times are for the pure-Python backend so the two are directly comparable.
+
+    python -m benchmarks.bench_frontier [iterations]
+"""
+import random
+import sys
+
+from benchmarks.common import time_calls, summarize
+from recommender import Food, Frontier, recommend, reference_recommend
+
+CATALOG_SIZES = (20, 60)
+GOALS = ((500, 30), (1500, 90), (3000, 150))
+ORIGINAL_MODES = ('hit_both', 'protein_first', 'calorie_first')
+
+
+def make_catalog(n, seed=0):
+    rng = random.Random(seed)
+    return [Food(i, f'Food {i}', rng.randint(50, 600), rng.randint(0, 45)) for i in range(n)]
+
+
+def reference_cells(foods, remaining_calories):
+    rows = len(foods) + 1
+    return rows * (2 * (remaining_calories + 1) + sum(food.calories for food in foods) + 1)
+
+
+def main(iterations=3):
+    print(f"{'foods':>5} {'kcal/g left':>11} {'3-table cells':>13} {'frontier cells':>14} "
+          f"{'3-table ms':>10} {'frontier ms':>11}")
+    for n in CATALOG_SIZES:
+        foods = make_catalog(n)
+        for remaining_calories, remaining_protein in GOALS:
+            expected = reference_recommend(foods, remaining_calories, remaining_protein)
+            got = recommend(foods, remaining_calories, remaining_protein, backend='python', modes=ORIGINAL_MODES)
+            assert got == expected, f"frontier disagrees for {n} foods, {remaining_calories} kcal"
+
+            frontier = Frontier(foods, remaining_calories, remaining_protein, backend='python')
+            frontier_cells = frontier.cells + len(foods) * remaining_protein
+            old = summarize(time_calls(lambda: reference_recommend(foods, remaining_calories, remaining_protein),
+                                       iterations))
+            new = summarize(time_calls(lambda: recommend(foods, remaining_calories, remaining_protein,
+                                                         backend='python'), iterations))
+            print(f"{n:5d} {remaining_calories:6d}/{remaining_protein:<4d} {reference_cells(foods, remaining_calories):13d} "
+                  f"{frontier_cells:14d} {old['mean_ms']:10.1f} {new['mean_ms']:11.1f}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
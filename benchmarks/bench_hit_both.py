@@ -0,0 +1,51 @@
+"""The hit_both pre-check against building the frontier table to answer hit_both.
+
+``hit_both_feasible()`` runs a bitset DP over protein levels, one big int of calorie
+totals per level, after two bounds that turn down clear no's. Each row times it and the
+table approach (a ``Frontier`` and its hit_both) for protein goals around the most that
+fits in the calories: half of it, all of it, 1 g more (just out of reach) and twice it.
+The ``steps`` column is foods x protein levels; past BITSET_MAX_STEPS the bitset DP is
+skipped, so the 'dp' column times the DP alone to show where that limit comes from.
+
+    python -m benchmarks.bench_hit_both [iterations]
+"""
+import random
+import sys
+
+from benchmarks.common import time_calls, summarize
+import recommender
+from recommender import Food, Frontier, KnapsackTable, hit_both_feasible
+
+CATALOG_SIZES = (10, 50, 200)
+REMAINING_CALORIES = (500, 2000, 6000)
+
+
+def make_catalog(n, seed=0):
+    rng = random.Random(seed)
+    return [Food(i, f'Food {i}', rng.randint(20, 900), rng.randint(0, 60)) for i in range(n)]
+
+
+def main(iterations=5):
+    print(f"BITSET_MAX_STEPS = {recommender.BITSET_MAX_STEPS}")
+    print(f"{'foods':>5} {'kcal':>5} {'goal g':>6} {'reachable':>9} {'steps':>7} "
+          f"{'check ms':>9} {'dp ms':>8} {'table ms':>9}")
+    limit = recommender.BITSET_MAX_STEPS
+    for n in CATALOG_SIZES:
+        foods = make_catalog(n, seed=n)
+        for kcal in REMAINING_CALORIES:
+            most = KnapsackTable(foods, kcal).best[kcal]
+            for protein in (most // 2, most, most + 1, most * 2):
+                steps = sum(1 for food in foods if food.calories <= kcal and food.protein > 0) * protein
+                check = summarize(time_calls(lambda: hit_both_feasible(foods, kcal, protein), iterations))
+                recommender.BITSET_MAX_STEPS = float('inf')
+                try:
+                    dp = summarize(time_calls(lambda: hit_both_feasible(foods, kcal, protein), iterations))
+                finally:
+                    recommender.BITSET_MAX_STEPS = limit
+                table = summarize(time_calls(lambda: Frontier(foods, kcal, protein).hit_both(), iterations))
+                print(f"{n:5d} {kcal:5d} {protein:6d} {str(protein <= most):>9} {steps:7d} "
+                      f"{check['p50_ms']:9.3f} {dp['p50_ms']:8.3f} {table['p50_ms']:9.3f}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,47 @@
+"""Recommendation latency for each knapsack backend across remaining budgets and catalog sizes.
+
+Both backends must return identical recommendations; the run stops if they don't.
+Needs NumPy installed to compare against the pure-Python backend.
+
+    python -m benchmarks.bench_knapsack_backends [iterations]
+"""
+import random
+import sys
+
+from benchmarks.common import time_calls, summarize
+from recommender import KNAPSACK_BACKENDS, Food, recommend
+
+CATALOG_SIZES = (20, 60)
+REMAINING_CALORIES = (500, 1500, 3000)
+REMAINING_PROTEIN = 80
+
+
+def make_catalog(n, seed=0):
+    rng = random.Random(seed)
+    return [Food(i, f'Food {i}', rng.randint(50, 600), rng.randint(0, 45)) for i in range(n)]
+
+
+def main(iterations=5):
+    backends = sorted(KNAPSACK_BACKENDS)
+    if 'numpy' not in backends:
+        print("NumPy is not installed; only the pure-Python backend is available")
+
+    print(f"{'foods':>5} {'kcal left':>9} " + ' '.join(f"{name + ' ms':>10}" for name in backends)
+          + (f" {'speedup':>8}" if len(backends) > 1 else ''))
+    for n in CATALOG_SIZES:
+        foods = make_catalog(n)
+        for remaining in REMAINING_CALORIES:
+            results = {name: recommend(foods, remaining, REMAINING_PROTEIN, backend=name) for name in backends}
+            assert all(result == results['python'] for result in results.values()), \
+                f"backends disagree for {n} foods, {remaining} kcal"
+            means = {name: summarize(time_calls(lambda: recommend(foods, remaining, REMAINING_PROTEIN, backend=name),
+                                                iterations))['mean_ms']
+                     for name in backends}
+            line = f"{n:5d} {remaining:9d} " + ' '.join(f"{means[name]:10.2f}" for name in backends)
+            if 'numpy' in means:
+                line += f" {means['python'] / means['numpy']:7.1f}x"
+            print(line)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
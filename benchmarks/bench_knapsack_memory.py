@@ -0,0 +1,43 @@
+"""Peak memory and latency of the recommendation DP: full (n+1) x (W+1) table versus one rolling row.
+
+Catalogs are random quick add lists (50-600 kcal per food); the remaining budget is 1,200 kcal / 80 g.
+The full table's protein_first pass is as wide as the whole catalog's calories, which dominates it.
+
+    python -m benchmarks.bench_knapsack_memory [iterations]
+"""
+import random
+import sys
+
+from benchmarks.common import time_calls, summarize, peak_kib
+from recommender import Food, recommend, reference_recommend
+
+ORIGINAL_MODES = ('hit_both', 'protein_first', 'calorie_first')
+
+CATALOG_SIZES = (10, 30, 60, 120)
+REMAINING_CALORIES = 1200
+REMAINING_PROTEIN = 80
+
+
+def make_catalog(n, seed=0):
+    rng = random.Random(seed)
+    return [Food(i, f'Food {i}', rng.randint(50, 600), rng.randint(0, 45)) for i in range(n)]
+
+
+def main(iterations=3):
+    solvers = (('full table', reference_recommend),
+               ('rolling row', lambda *args: recommend(*args, backend='python', modes=ORIGINAL_MODES)))
+    print(f"{'foods':>5} {'W (kcal)':>8} {'solver':12} {'peak KiB':>10} {'mean ms':>9} {'p95 ms':>9}")
+    for n in CATALOG_SIZES:
+        foods = make_catalog(n)
+        width = sum(food.calories for food in foods)
+        expected = reference_recommend(foods, REMAINING_CALORIES, REMAINING_PROTEIN)
+        for label, solver in solvers:
+            run = lambda: solver(foods, REMAINING_CALORIES, REMAINING_PROTEIN)
+            assert run() == expected, f"{label} disagrees with the full table for {n} foods"
+            peak = peak_kib(run)
+            stats = summarize(time_calls(run, iterations))
+            print(f"{n:5d} {width:8d} {label:12} {peak:10.0f} {stats['mean_ms']:9.1f} {stats['p95_ms']:9.1f}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
@@ -0,0 +1,59 @@
+"""Latency of carb- and fat-limited recommendations, and the buckets the latency budget picks.
+
+Each row is a catalog with 2,000 kcal, 250 g carbs and 70 g fat left. For each latency budget
+macro_recommend() chooses its buckets from the table's fixed cells_per_ms; the row reports them,
+the table size against the exact one (every bucket 1, far too big to build here), the time taken,
+the protein of the calorie first suggestion and how far it goes over each limit (always 0, as
+foods are rounded up to whole buckets). A p50 well over the budget means cells_per_ms is set too
+high for this machine, unless every bucket is already at MACRO_MAX_BUCKETS.
+
+    python -m benchmarks.bench_macro_solver [iterations]
+"""
+import random
+import sys
+
+from benchmarks.common import time_calls, summarize
+from recommender import KNAPSACK_BACKENDS, Food, macro_recommend
+
+CATALOG_SIZES = (10, 50, 200, 500)
+LIMITS = (2000, 250, 70)
+LATENCY_BUDGETS_MS = (200, 50, 10)
+
+
+def make_catalog(n, seed=0):
+    rng = random.Random(seed)
+    return [Food(i, f'Food {i}', rng.randint(20, 900), rng.randint(0, 60), carbs=rng.randint(0, 90),
+                 fat=rng.randint(0, 40)) for i in range(n)]
+
+
+def table_cells(foods, buckets):
+    cells = len(foods)
+    for limit, bucket in zip(LIMITS, buckets):
+        cells *= limit // bucket + 1
+    return cells
+
+
+def totals(chosen):
+    return [sum(getattr(food, name) for food in chosen) for name in ('protein', 'calories', 'carbs', 'fat')]
+
+
+def main(iterations=5):
+    calories, carbs, fat = LIMITS
+    print(f"{calories} kcal, {carbs} g carbs, {fat} g fat left; backends: {', '.join(sorted(KNAPSACK_BACKENDS))}")
+    print(f"{'foods':>5} {'budget ms':>9} {'buckets':>12} {'cells':>10} {'exact cells':>12} {'p50 ms':>8} "
+          f"{'p95 ms':>8} {'protein':>7} {'over kcal/carbs/fat':>19}")
+    for n in CATALOG_SIZES:
+        foods = make_catalog(n, seed=n)
+        for budget in LATENCY_BUDGETS_MS:
+            run = lambda: macro_recommend(foods, calories, 0, carbs, fat, latency_budget_ms=budget)
+            results, buckets = run()
+            stats = summarize(time_calls(run, iterations))
+            protein, *used = totals(results['calorie_first'])
+            over = '/'.join(str(max(total - limit, 0)) for total, limit in zip(used, LIMITS))
+            print(f"{n:5d} {budget:9d} {'x'.join(map(str, buckets)):>12} {table_cells(foods, buckets):10d} "
+                  f"{table_cells(foods, (1, 1, 1)):12d} {stats['p50_ms']:8.1f} {stats['p95_ms']:8.1f} {protein:7d} "
+                  f"{over:>19}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,50 @@
+"""Time to plan a week of meals against the quick add list size.
+
+Each row plans 7 days (at most 2 of any food) three ways:
+
+    fresh     a frontier built from scratch for each day, the way seven recommendation requests would
+    planner   plan_meals(), which builds one CatalogState and replays only the rows each day changes
+    warm      plan_meals() given the list's CatalogState already filled, as the app keeps it
+
+    python -m benchmarks.bench_meal_plan [iterations]
+"""
+import sys
+
+from benchmarks.bench_pruning import make_catalog
+from benchmarks.common import time_calls, summarize
+from meal_planner import DEFAULT_MAX_REPEATS, DEFAULT_PLAN_DAYS, plan_meals
+from recommender import CatalogState, Frontier
+
+CATALOG_SIZES = (10, 50, 200, 500, 1000)
+GOALS = ((1800, 90), (2500, 150))
+
+
+def plan_fresh(foods, calorie_goal, protein_goal):
+    used = {food.id: 0 for food in foods}
+    for _ in range(DEFAULT_PLAN_DAYS):
+        frontier = Frontier([food for food in foods if used[food.id] < DEFAULT_MAX_REPEATS],
+                            calorie_goal, protein_goal)
+        chosen = frontier.hit_both()
+        if chosen is None:
+            chosen = frontier.closest()
+        for food in chosen:
+            used[food.id] += 1
+
+
+def main(iterations=5):
+    print(f"{'foods':>5} {'kcal':>5} {'fresh ms':>9} {'planner ms':>10} {'warm ms':>8} {'speedup':>7}")
+    for n in CATALOG_SIZES:
+        foods = make_catalog(n, seed=n)
+        for calorie_goal, protein_goal in GOALS:
+            fresh = summarize(time_calls(lambda: plan_fresh(foods, calorie_goal, protein_goal), iterations))
+            planner = summarize(time_calls(lambda: plan_meals(foods, calorie_goal, protein_goal), iterations))
+            state = CatalogState(foods)
+            plan_meals(foods, calorie_goal, protein_goal, state=state)  # fill the state to the goal
+            warm = summarize(time_calls(lambda: plan_meals(foods, calorie_goal, protein_goal, state=state),
+                                        iterations))
+            print(f"{n:5d} {calorie_goal:5d} {fresh['p50_ms']:9.1f} {planner['p50_ms']:10.1f} "
+                  f"{warm['p50_ms']:8.1f} {fresh['p50_ms'] / max(warm['p50_ms'], 1e-6):6.1f}x")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,70 @@
+"""Mixed read/write throughput for each database pragma profile.
+
+Reader threads poll /api/dashboard-stats while writer threads call /log_food,
+all against one user's data, for a fixed wall-clock duration per profile. The
+"rollback journal" row is the pre-WAL default (journal_mode=DELETE, synchronous=FULL).
+
+    python -m benchmarks.bench_pragma_profiles [seconds] [readers] [writers]
+"""
+import sys
+import threading
+import time
+
+from benchmarks.common import bench_app, logged_in_client
+from db import PRAGMA_PROFILES
+
+FOOD = {'name': 'Oats', 'calories': '150', 'protein': '5', 'servings': '1'}
+
+CONFIGURATIONS = [('rollback journal', 'durable', {'journal_mode': 'DELETE', 'synchronous': 'FULL'})]
+CONFIGURATIONS += [(profile, profile, {}) for profile in PRAGMA_PROFILES]
+
+
+def run_mixed_load(flask_app, seconds, readers, writers):
+    counts = {'reads': 0, 'writes': 0, 'errors': 0}
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    # Log in up front so password hashing isn't counted against the measured window
+    clients = {kind: [logged_in_client(flask_app) for _ in range(n)]
+               for kind, n in (('reads', readers), ('writes', writers))}
+
+    def worker(kind, client):
+        done = errors = 0
+        while not stop.is_set():
+            if kind == 'reads':
+                response = client.get('/api/dashboard-stats')
+            else:
+                response = client.post('/log_food', data=FOOD)
+            if response.status_code == 200:
+                done += 1
+            else:
+                errors += 1
+        with lock:
+            counts[kind] += done
+            counts['errors'] += errors
+
+    threads = [threading.Thread(target=worker, args=(kind, client))
+               for kind, kind_clients in clients.items() for client in kind_clients]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return counts
+
+
+def main(seconds=3.0, readers=4, writers=2):
+    print(f"{seconds:.0f}s per profile, {readers} reader and {writers} writer threads")
+    print(f"{'profile':18} {'reads/s':>9} {'writes/s':>9} {'errors':>7}")
+    for label, profile, overrides in CONFIGURATIONS:
+        with bench_app(DB_PROFILE=profile, DB_PRAGMAS=overrides, DB_POOL_SIZE=readers + writers) as flask_app:
+            counts = run_mixed_load(flask_app, seconds, readers, writers)
+        print(f"{label:18} {counts['reads'] / seconds:9.0f} {counts['writes'] / seconds:9.0f} {counts['errors']:7d}")
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(float(args[0]) if args else 3.0,
+         int(args[1]) if len(args) > 1 else 4,
+         int(args[2]) if len(args) > 2 else 2)
@@ -0,0 +1,68 @@
+"""Foods pruned before the knapsack runs, and what that saves, on realistic quick add lists.
+
+Real lists repeat foods (the same thing added twice, or in another portion), and hold
+drinks and snacks with little or no protein, so ``prune_foods()`` has plenty to drop. The
+lists here draw from everyday foods, half of them in a half, 1.5x or double portion. Each
+row builds the frontier table for the width ``Frontier`` would use, over every food and over
+the foods kept (pruning included in the time), on each backend.
+
+    python -m benchmarks.bench_pruning [iterations]
+"""
+import random
+import sys
+
+from benchmarks.common import time_calls, summarize
+from recommender import KNAPSACK_BACKENDS, Food, Frontier, knapsack_backend, prune_foods
+
+CATALOG_SIZES = (20, 50, 200, 500)
+REMAINING_CALORIES = (500, 2000, 6000)
+
+EVERYDAY_FOODS = [
+    ('Oats', 150, 5), ('Greek Yogurt', 100, 17), ('Chicken Breast', 165, 31), ('Rice', 200, 4),
+    ('Protein Shake', 120, 24), ('Banana', 105, 1), ('Apple', 95, 0), ('Eggs', 140, 12), ('Salmon', 280, 39),
+    ('Almonds', 170, 6), ('Cola', 140, 0), ('Bagel', 270, 10), ('Tuna', 120, 26), ('Pasta', 350, 12),
+    ('Cheddar', 115, 7), ('Orange Juice', 110, 2), ('Steak', 420, 46), ('Tofu', 90, 10), ('Pizza Slice', 285, 12),
+    ('Latte', 190, 12), ('Chocolate Bar', 230, 3), ('Cottage Cheese', 180, 24), ('Burrito', 650, 28),
+    ('Protein Bar', 210, 20), ('Peanut Butter', 190, 8), ('Turkey Sandwich', 360, 24), ('Salad', 120, 3),
+    ('Beef Jerky', 80, 13), ('Milk', 150, 8), ('Lentil Soup', 230, 14),
+]
+
+
+def make_catalog(n, seed=0):
+    rng = random.Random(seed)
+    foods = []
+    for i in range(n):
+        name, calories, protein = rng.choice(EVERYDAY_FOODS)
+        if rng.random() < 0.5:
+            portion = rng.choice([0.5, 1.5, 2])
+            name, calories, protein = f'{name} x{portion}', round(calories * portion), int(protein * portion)
+        foods.append(Food(i, name, calories, protein))
+    return foods
+
+
+def main(iterations=5):
+    backends = sorted(KNAPSACK_BACKENDS)
+    print(f"{'foods':>5} {'kcal':>5} {'width':>5} {'kept':>4} {'over':>4} {'no p':>4} {'dup':>4} {'dom':>4} "
+          + ' '.join(f"{name + ' all ms':>13} {name + ' kept ms':>14}" for name in backends))
+    for n in CATALOG_SIZES:
+        foods = make_catalog(n, seed=n)
+        for kcal in REMAINING_CALORIES:
+            protein = kcal // 20
+            width = Frontier(foods, kcal, protein).width
+            kept, pruned = prune_foods(foods, width)
+            row = (f"{n:5d} {kcal:5d} {width:5d} {len(kept):4d} {pruned['over_budget']:4d} "
+                   f"{pruned['no_protein']:4d} {pruned['duplicate']:4d} {pruned['dominated']:4d}")
+            for name in backends:
+                table_class = knapsack_backend(name)
+                every = summarize(time_calls(lambda: table_class(foods, width), iterations))
+
+                def pruned_table():
+                    indices, _ = prune_foods(foods, width)
+                    return table_class([foods[i] for i in indices], width)
+                only_kept = summarize(time_calls(pruned_table, iterations))
+                row += f" {every['p50_ms']:13.2f} {only_kept['p50_ms']:14.2f}"
+            print(row)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,118 @@
+"""Dashboard read throughput by reader thread count while a writer keeps logging food.
+
+"split" reads on the read-only pool (one connection per reader thread); "writer only"
+sends the same reads through the single writer connection, as if there were no readers.
+The writer logs and removes an entry every WRITE_INTERVAL seconds throughout. Reads only
+scale with threads on a multi-core machine; on one core the interesting column is writes/s,
+which collapses in "writer only" mode because the readers hog the one connection.
+
+    python -m benchmarks.bench_read_scaling [seconds per run]
+"""
+import sys
+import threading
+import time
+
+from benchmarks.common import bench_app
+from db import Database, profile_pragmas
+
+DAYS = 60
+ENTRIES_PER_DAY = 20
+THREAD_COUNTS = (1, 2, 4, 8)
+TODAY = f'2024-01-{DAYS % 28 + 1:02d}'
+WRITE_INTERVAL = 0.002  # seconds between writes
+
+
+def seed(db_path):
+    """Give the benchmark user a couple of months of food log and summaries"""
+    database = Database(db_path, reader_pool_size=1, pragmas=profile_pragmas('balanced'))
+    conn = database.writer.acquire()
+    user_id = conn.execute("SELECT id FROM users").fetchone()[0]
+    for day in range(DAYS):
+        date = f'2024-{day // 28 + 1:02d}-{day % 28 + 1:02d}'
+        conn.executemany("INSERT INTO daily_log (date, food_name, calories, protein, user_id) VALUES (?, ?, ?, ?, ?)",
+                         [(date, f'Food {i}', 100 + i, 5 + i, user_id) for i in range(ENTRIES_PER_DAY)])
+        conn.execute("""INSERT INTO daily_summary (date, total_calories, total_protein, summary, user_id,
+                                                   calorie_goal, protein_goal)
+                        VALUES (?, ?, ?, ?, ?, 2000, 150)""", (date, 2500, 200, 'benchmark', user_id))
+    conn.executemany("INSERT INTO foods (name, calories, protein, user_id) VALUES (?, ?, ?, ?)",
+                     [(f'Quick {i}', 50 * i, 3 * i, user_id) for i in range(1, 21)])
+    conn.commit()
+    database.writer.release(conn)
+    database.close()
+    return user_id
+
+
+def dashboard_reads(conn, user_id):
+    """The queries behind /dashboard, /api/dashboard-stats and /history"""
+    conn.execute("SELECT id FROM daily_summary WHERE date = ? AND user_id = ?", (TODAY, user_id)).fetchone()
+    conn.execute("SELECT id, food_name, calories, protein FROM daily_log WHERE date = ? AND user_id = ?",
+                 (TODAY, user_id)).fetchall()
+    conn.execute("SELECT calories, protein FROM daily_totals WHERE user_id = ? AND date = ?",
+                 (user_id, TODAY)).fetchone()
+    conn.execute("SELECT id, name, calories, protein FROM foods WHERE user_id = ? ORDER BY name",
+                 (user_id,)).fetchall()
+    conn.execute("""SELECT date, total_calories, total_protein, summary, calorie_goal, protein_goal
+                    FROM daily_summary WHERE user_id = ? ORDER BY date DESC""", (user_id,)).fetchall()
+
+
+def run(database, read_pool, user_id, threads, seconds):
+    """Return (reads per second, writes per second) over ``seconds`` of concurrent load"""
+    stop = threading.Event()
+    reads = [0] * threads
+    writes = [0]
+
+    def reader(index):
+        while not stop.is_set():
+            conn = read_pool.acquire()
+            try:
+                dashboard_reads(conn, user_id)
+            finally:
+                read_pool.release(conn)
+            reads[index] += 1
+
+    def writer():
+        while not stop.is_set():
+            conn = database.writer.acquire()
+            try:
+                # Log and remove an entry, like log_food followed by remove_food, so today's log keeps its size
+                log_id = conn.execute(
+                    "INSERT INTO daily_log (date, food_name, calories, protein, user_id) VALUES (?, ?, ?, ?, ?)",
+                    (TODAY, 'Snack', 120, 4, user_id)).lastrowid
+                conn.commit()
+                conn.execute("DELETE FROM daily_log WHERE id = ? AND user_id = ?", (log_id, user_id))
+                conn.commit()
+            finally:
+                database.writer.release(conn)
+            writes[0] += 2
+            stop.wait(WRITE_INTERVAL)
+
+    workers = [threading.Thread(target=reader, args=(i,)) for i in range(threads)]
+    workers.append(threading.Thread(target=writer))
+    for worker in workers:
+        worker.start()
+    time.sleep(seconds)
+    stop.set()
+    for worker in workers:
+        worker.join()
+    return sum(reads) / seconds, writes[0] / seconds
+
+
+def main(seconds=2.0):
+    with bench_app() as flask_app:
+        db_path = flask_app.config['DB_PATH']
+        user_id = seed(db_path)
+        pragmas = profile_pragmas('balanced')
+
+        print(f"{'mode':12} {'readers':>7} {'reads/s':>10} {'writes/s':>10}")
+        for label in ('writer only', 'split'):
+            for threads in THREAD_COUNTS:
+                # The writer pool has one connection, so a timeout long enough for the whole run
+                database = Database(db_path, reader_pool_size=threads, timeout=seconds * 10, pragmas=pragmas)
+                read_pool = database.readers if label == 'split' else database.writer
+                reads_per_s, writes_per_s = run(database, read_pool, user_id, threads, seconds)
+                database.close()
+                print(f"{label:12} {threads:7d} {reads_per_s:10.0f} {writes_per_s:10.0f}")
+
+
+if __name__ == '__main__':
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 2.0)
@@ -0,0 +1,165 @@
+"""Latency percentiles and peak memory of every recommendation solver over a grid of catalogs and budgets.
+
+Synthetic quick add lists of 5 to 500 foods meet remaining budgets of 0 to 6,000 kcal (and a protein goal
+of 1 g per 20 kcal). Each solver mode runs on every case:
+
+    exact         the frontier on the default backend ('auto')
+    exact-python  the frontier on the pure-Python backend (skipped above --max-python-cells DP cells)
+    approximate   the bucketed frontier, granularity chosen for a 50 ms latency budget
+    anytime       recommend within a 50 ms deadline
+    greedy        protein-per-calorie picks
+    servings      the exact frontier with up to 2 servings per food in half servings
+    top-k         3 alternatives per mode from the k-best DP (pure Python, skipped like exact-python)
+
+Results go to a JSON file to compare across commits. Given a baseline file from an earlier run, any case
+whose p50 latency or peak memory grew past the allowed ratio is reported and the run exits with status 1:
+
+    python -m benchmarks.bench_recommender_suite --output before.json
+    python -m benchmarks.bench_recommender_suite --baseline before.json --max-slowdown 1.5
+"""
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+
+from benchmarks.common import time_calls, summarize, peak_kib
+from recommender import KNAPSACK_BACKENDS, Food, Frontier, greedy_recommend, solve
+
+CATALOG_SIZES = (5, 50, 200, 500)
+REMAINING_CALORIES = (0, 500, 2000, 6000)
+QUICK_CATALOG_SIZES = (5, 50)
+QUICK_REMAINING_CALORIES = (0, 2000)
+LATENCY_BUDGET_MS = 50
+DEADLINE_MS = 50
+
+SOLVERS = {
+    'exact': lambda foods, kcal, protein: solve(foods, kcal, protein),
+    'exact-python': lambda foods, kcal, protein: solve(foods, kcal, protein, backend='python'),
+    'approximate': lambda foods, kcal, protein: solve(foods, kcal, protein, approximate=True,
+                                                      latency_budget_ms=LATENCY_BUDGET_MS),
+    'anytime': lambda foods, kcal, protein: solve(foods, kcal, protein, deadline_ms=DEADLINE_MS),
+    'greedy': lambda foods, kcal, protein: greedy_recommend(foods, kcal, protein),
+    'servings': lambda foods, kcal, protein: solve(foods, kcal, protein, max_servings=2),
+    'top-k': lambda foods, kcal, protein: solve(foods, kcal, protein, k=3),
+}
+# Solvers that always run in pure Python, skipped above --max-python-cells
+PYTHON_SOLVERS = ('exact-python', 'top-k')
+
+
+def make_catalog(n, seed=0):
+    rng = random.Random(seed)
+    return [Food(i, f'Food {i}', rng.randint(20, 900), rng.randint(0, 60)) for i in range(n)]
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(catalog_sizes, budgets, solvers, iterations, max_python_cells):
+    """Time and profile every (catalog size, budget, solver) case; returns a list of result dicts"""
+    results = []
+    for n in catalog_sizes:
+        foods = make_catalog(n, seed=n)
+        for kcal in budgets:
+            protein = kcal // 20
+            cells = Frontier.estimate_cells(foods, kcal, protein)
+            for name in solvers:
+                case = {'foods': n, 'remaining_calories': kcal, 'remaining_protein': protein, 'solver': name,
+                        'exact_cells': cells}
+                if name in PYTHON_SOLVERS and cells > max_python_cells:
+                    results.append({**case, 'skipped': f'more than {max_python_cells} DP cells'})
+                    continue
+                run = lambda: SOLVERS[name](foods, kcal, protein)
+                run()  # warm up (calibrates seconds_per_cell on first use)
+                stats = summarize(time_calls(run, iterations))
+                results.append({**case, **{key: round(value, 3) for key, value in stats.items()},
+                                'peak_kib': round(peak_kib(run), 1)})
+    return results
+
+
+def case_key(result):
+    return result['foods'], result['remaining_calories'], result['solver']
+
+
+def regressions(results, baseline, max_slowdown, max_memory_growth, min_ms):
+    """Cases that got slower or bigger than allowed compared with a baseline run"""
+    before = {case_key(result): result for result in baseline['results'] if 'skipped' not in result}
+    found = []
+    for result in results:
+        old = before.get(case_key(result))
+        if old is None or 'skipped' in result:
+            continue
+        # Sub-millisecond cases are mostly timer noise
+        if result['p50_ms'] > max(old['p50_ms'], min_ms) * max_slowdown:
+            found.append(f"{case_key(result)}: p50 {old['p50_ms']:.2f} -> {result['p50_ms']:.2f} ms")
+        if result['peak_kib'] > max(old['peak_kib'], 1) * max_memory_growth:
+            found.append(f"{case_key(result)}: peak {old['peak_kib']:.0f} -> {result['peak_kib']:.0f} KiB")
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--solvers', default=','.join(SOLVERS), help='comma-separated solver modes')
+    parser.add_argument('--quick', action='store_true', help='a small grid, for a smoke test')
+    parser.add_argument('--max-python-cells', type=int, default=2_000_000)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to check for regressions')
+    parser.add_argument('--max-slowdown', type=float, default=1.5, help='allowed p50 latency ratio')
+    parser.add_argument('--max-memory-growth', type=float, default=1.25, help='allowed peak memory ratio')
+    parser.add_argument('--min-ms', type=float, default=1.0, help='latency below which slowdowns are ignored')
+    args = parser.parse_args(argv)
+
+    solvers = [name for name in args.solvers.split(',') if name]
+    unknown = set(solvers) - set(SOLVERS)
+    if unknown:
+        parser.error(f"unknown solvers: {', '.join(sorted(unknown))}")
+    sizes, budgets = ((QUICK_CATALOG_SIZES, QUICK_REMAINING_CALORIES) if args.quick
+                      else (CATALOG_SIZES, REMAINING_CALORIES))
+
+    results = run_suite(sizes, budgets, solvers, args.iterations, args.max_python_cells)
+
+    print(f"{'foods':>5} {'kcal':>5} {'solver':13} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'peak KiB':>9}")
+    for result in results:
+        if 'skipped' in result:
+            print(f"{result['foods']:5d} {result['remaining_calories']:5d} {result['solver']:13} "
+                  f"skipped: {result['skipped']}")
+        else:
+            print(f"{result['foods']:5d} {result['remaining_calories']:5d} {result['solver']:13} "
+                  f"{result['p50_ms']:9.2f} {result['p95_ms']:9.2f} {result['p99_ms']:9.2f} {result['peak_kib']:9.0f}")
+
+    report = {
+        'commit': git_commit(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'backends': sorted(KNAPSACK_BACKENDS),
+        'iterations': args.iterations,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        found = regressions(results, baseline, args.max_slowdown, args.max_memory_growth, args.min_ms)
+        if found:
+            print(f"{len(found)} regression(s) against {args.baseline} ({baseline.get('commit')}):")
+            for line in found:
+                print(f"  {line}")
+            return 1
+        print(f"No regressions against {args.baseline} ({baseline.get('commit')})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
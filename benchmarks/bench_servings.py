@@ -0,0 +1,41 @@
+"""Cost of multi-serving recommendations as the most servings per food (k) grows.
+
+Binary splitting turns up to k servings in half steps (2k steps) into about log2(2k) items per
+food, so DP cells and latency should grow with log k. The unary column is what one item per half
+serving would cost in cells.
+
+    python -m benchmarks.bench_servings [iterations]
+"""
+import random
+import sys
+
+from benchmarks.common import time_calls, summarize
+from recommender import Food, Frontier, recommend, split_servings
+
+CATALOG_SIZE = 30
+REMAINING_CALORIES = 1500
+REMAINING_PROTEIN = 100
+MAX_SERVINGS = (1, 2, 4, 8, 16, 32)
+
+
+def make_catalog(n, seed=0):
+    rng = random.Random(seed)
+    return [Food(i, f'Food {i}', rng.randint(50, 600), rng.randint(0, 45)) for i in range(n)]
+
+
+def main(iterations=5):
+    foods = make_catalog(CATALOG_SIZE)
+    print(f"{CATALOG_SIZE} foods, {REMAINING_CALORIES} kcal / {REMAINING_PROTEIN} g left")
+    print(f"{'k':>3} {'items':>6} {'cells':>9} {'unary cells':>12} {'mean ms':>8} {'p95 ms':>8}")
+    for k in MAX_SERVINGS:
+        items = [item for food in foods for item in split_servings(food, k)]
+        frontier = Frontier(items, REMAINING_CALORIES, REMAINING_PROTEIN)
+        unary_cells = CATALOG_SIZE * 2 * k * (frontier.width + 1)
+        stats = summarize(time_calls(lambda: recommend(foods, REMAINING_CALORIES, REMAINING_PROTEIN,
+                                                       max_servings=k), iterations))
+        print(f"{k:3d} {len(items):6d} {frontier.cells:9d} {unary_cells:12d} "
+              f"{stats['mean_ms']:8.2f} {stats['p95_ms']:8.2f}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
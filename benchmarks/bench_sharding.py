@@ -0,0 +1,126 @@
+"""Concurrent food logging by 1,000 users: one database file versus sharded layouts.
+
+Each worker thread repeatedly picks a random user and logs a food for them (insert and
+commit on that user's writer connection). With one file every commit queues on the same
+writer; with shards only users in the same file contend. Uses the 'durable' profile,
+where each commit waits for an fsync, since that is the time other writers queue behind.
+
+    python -m benchmarks.bench_sharding [writes] [threads]
+"""
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import app as app_module
+from benchmarks.common import summarize
+from db import Database, ShardRouter, profile_pragmas
+
+USERS = 1000
+PROFILE = 'durable'
+
+
+class SingleFile:
+    """The unsharded layout, behind the same acquire() interface as ShardRouter"""
+
+    def __init__(self, db_path, pragmas):
+        self.database = Database(db_path, reader_pool_size=1, timeout=60, pragmas=pragmas)
+
+    def acquire(self, user_id, role):
+        pool = self.database.pool(role)
+        return pool, pool.acquire()
+
+    def stats(self):
+        return {}
+
+    def close(self):
+        self.database.close()
+
+
+def run(layout, writes, threads):
+    """Log ``writes`` foods from ``threads`` threads; returns (writes per second, per-write latencies)"""
+    per_thread = writes // threads
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(seed):
+        rng = random.Random(seed)
+        samples = []
+        for _ in range(per_thread):
+            user_id = rng.randint(1, USERS)
+            start = time.perf_counter()
+            pool, conn = layout.acquire(user_id, 'write')
+            try:
+                conn.execute("INSERT INTO daily_log (date, food_name, calories, protein, user_id) VALUES (?, ?, ?, ?, ?)",
+                             ('2024-01-01', 'Oats', 150, 5, user_id))
+                conn.commit()
+            finally:
+                pool.release(conn)
+            samples.append((time.perf_counter() - start) * 1000)
+        with lock:
+            latencies.extend(samples)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    return len(latencies) / elapsed, latencies
+
+
+def main(writes=4000, threads=32):
+    workdir = tempfile.mkdtemp(prefix='bench_sharding_')
+    original_db_path = app_module.DB_PATH
+    app_module.DB_PATH = os.path.join(workdir, 'food_tracker.db')
+    app_module.app.config['DB_PROFILE'] = PROFILE
+    pragmas = profile_pragmas(PROFILE)
+    try:
+        app_module.init_db()
+        conn = app_module.sqlite3.connect(app_module.DB_PATH)
+        conn.executemany("INSERT INTO users (username, password) VALUES (?, ?)",
+                         [(f'user{i}', 'x') for i in range(1, USERS + 1)])
+        conn.commit()
+        conn.close()
+
+        layouts = [
+            ('single file', lambda: SingleFile(app_module.DB_PATH, pragmas)),
+            ('16 buckets', lambda: ShardRouter(os.path.join(workdir, 'buckets'), 'bucket', buckets=16,
+                                               cache_size=16, reader_pool_size=1, timeout=60,
+                                               pragmas=pragmas, setup=app_module.init_db)),
+            ('per user, 64 open', lambda: ShardRouter(os.path.join(workdir, 'users'), 'user', cache_size=64,
+                                                      reader_pool_size=1, timeout=60,
+                                                      pragmas=pragmas, setup=app_module.init_db)),
+            ('per user, all open', lambda: ShardRouter(os.path.join(workdir, 'users'), 'user', cache_size=USERS,
+                                                       reader_pool_size=1, timeout=60,
+                                                       pragmas=pragmas, setup=app_module.init_db)),
+        ]
+
+        print(f"{USERS} users, {threads} threads, {writes} writes, '{PROFILE}' profile")
+        print(f"{'layout':20} {'writes/s':>9} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'evictions':>9}")
+        for label, make in layouts:
+            layout = make()
+            # Open every user's writer once up front (creating shard files) so the timed run
+            # measures steady-state writes rather than schema setup
+            for user_id in range(1, USERS + 1):
+                pool, conn = layout.acquire(user_id, 'write')
+                pool.release(conn)
+            writes_per_s, latencies = run(layout, writes, threads)
+            stats = summarize(latencies)
+            evictions = layout.stats().get('evictions', '-')  # including the warm-up pass
+            layout.close()
+            print(f"{label:20} {writes_per_s:9.0f} {stats['mean_ms']:8.2f} {stats['p50_ms']:8.2f} "
+                  f"{stats['p95_ms']:8.2f} {evictions:>9}")
+    finally:
+        app_module.DB_PATH = original_db_path
+        app_module.app.config['DB_PROFILE'] = os.getenv('DB_PROFILE', app_module.DEFAULT_PROFILE)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:3]]
+    main(*args)
@@ -0,0 +1,42 @@
+"""Subset search against the knapsack DP, to place the 'auto' solver cutoff.
+
+``recommender.select_table_class`` uses ``SubsetSearchTable`` under 'auto' for catalogs of up to
+SUBSET_SEARCH_MAX_FOODS foods. The subset search costs about one entry per Pareto-optimal
+subset, which doubles with each food until the budget caps it; the DP costs a cell per food
+per calorie. Each row here times one frontier build (``Frontier``) with each solver forced.
+
+    python -m benchmarks.bench_solver_selection [iterations]
+"""
+import random
+import sys
+
+from benchmarks.common import time_calls, summarize
+from recommender import KNAPSACK_BACKENDS, SUBSET_SEARCH_MAX_FOODS, Food, Frontier
+
+CATALOG_SIZES = (5, 10, 20, 40, 60, 120, 240)
+REMAINING_CALORIES = (500, 2000, 6000)
+
+
+def make_catalog(n, seed=0):
+    rng = random.Random(seed)
+    return [Food(i, f'Food {i}', rng.randint(20, 900), rng.randint(0, 60)) for i in range(n)]
+
+
+def main(iterations=5):
+    backends = ['subset'] + sorted(KNAPSACK_BACKENDS)
+    print(f"'auto' uses subset search up to {SUBSET_SEARCH_MAX_FOODS['numpy']} foods with NumPy, "
+          f"{SUBSET_SEARCH_MAX_FOODS['python']} without")
+    print(f"{'foods':>5} {'kcal':>5} " + ' '.join(f'{name + " ms":>10}' for name in backends) + f" {'fastest':>8}")
+    for n in CATALOG_SIZES:
+        foods = make_catalog(n, seed=n)
+        for kcal in REMAINING_CALORIES:
+            protein = kcal // 20
+            times = {name: summarize(time_calls(lambda: Frontier(foods, kcal, protein, backend=name).points(),
+                                                iterations))['p50_ms']
+                     for name in backends}
+            print(f"{n:5d} {kcal:5d} " + ' '.join(f'{times[name]:10.2f}' for name in backends)
+                  + f" {min(times, key=times.get):>8}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
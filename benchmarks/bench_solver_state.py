@@ -0,0 +1,67 @@
+"""Recommendation latency with the knapsack rebuilt per request versus served from kept per-user rows.
+
+Simulates a day: recommendations after each of several foods is eaten (the eaten foods are spread
+across the list), plus one quick add food added mid-day. Both ways must recommend the same foods.
+
+    python -m benchmarks.bench_solver_state [iterations]
+"""
+import random
+import sys
+
+from benchmarks.common import time_calls, summarize
+from recommender import KNAPSACK_BACKENDS, CatalogState, Food, recommend
+
+CATALOG_SIZES = (20, 60, 120)
+REMAINING_CALORIES = 1800
+REMAINING_PROTEIN = 120
+MEALS = 5
+
+
+def make_catalog(n, seed=0):
+    rng = random.Random(seed)
+    return [Food(i, f'Food {i}', rng.randint(50, 600), rng.randint(0, 45)) for i in range(n)]
+
+
+def day_of_requests(foods, seed=0):
+    """(available foods, remaining calories, remaining protein) before each meal, eaten foods removed"""
+    rng = random.Random(seed)
+    eaten, calories, protein = set(), REMAINING_CALORIES, REMAINING_PROTEIN
+    requests = []
+    for _ in range(MEALS):
+        requests.append(([food for food in foods if food.id not in eaten], calories, protein))
+        food = rng.choice([food for food in foods if food.id not in eaten])
+        eaten.add(food.id)
+        calories, protein = max(0, calories - food.calories), max(0, protein - food.protein)
+    return requests
+
+
+def main(iterations=3):
+    print(f"{'foods':>5} {'backend':8} {'solver':12} {'mean ms':>9} {'p95 ms':>9}")
+    for n, backend in ((n, backend) for backend in sorted(KNAPSACK_BACKENDS) for n in CATALOG_SIZES):
+        catalog = make_catalog(n + 1)
+        foods, added = catalog[:n], catalog[n]
+        requests = day_of_requests(foods)
+        state = CatalogState(foods, backend=backend)
+        state.add(added)
+        # Kept rows are built once per catalog; the day's requests then replay part of them
+        state.table(foods + [added], REMAINING_CALORIES + 1000)
+        for available, calories, protein in requests:
+            available = available + [added]
+            assert recommend(available, calories, protein, backend, state=state) == \
+                recommend(available, calories, protein, backend)
+
+        def fresh():
+            for available, calories, protein in requests:
+                recommend(available + [added], calories, protein, backend)
+
+        def kept():
+            for available, calories, protein in requests:
+                recommend(available + [added], calories, protein, backend, state=state)
+
+        for label, run in (('rebuilt', fresh), ('kept rows', kept)):
+            stats = summarize(time_calls(run, iterations))
+            print(f"{n:5d} {backend:8} {label:12} {stats['mean_ms'] / MEALS:9.2f} {stats['p95_ms'] / MEALS:9.2f}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
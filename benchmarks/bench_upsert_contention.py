@@ -0,0 +1,106 @@
+"""Contention on one user's day: SELECT-then-write versus a single upsert.
+
+Threads log a weight for the same user at the same moment, moving to a new date
+every round (a barrier lines them up), so every round races on the first write
+of a day. Three write paths are compared:
+
+- select-then-write: the old User.log_weight against a table without
+  UNIQUE(user_id, date); races show up as duplicate rows
+- locked select-then-write: the same two statements made safe with BEGIN IMMEDIATE
+- upsert: one INSERT ... ON CONFLICT DO UPDATE, what User.log_weight does now
+
+    python -m benchmarks.bench_upsert_contention [threads] [rounds]
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+from db import profile_pragmas, apply_pragmas
+
+SCHEMA = """CREATE TABLE weight_logs (id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT NOT NULL,
+            weight REAL NOT NULL, user_id INTEGER NOT NULL)"""
+
+
+def select_then_write(conn, date, weight):
+    c = conn.cursor()
+    c.execute("SELECT id, weight FROM weight_logs WHERE date = ? AND user_id = ?", (date, 1))
+    existing_log = c.fetchone()
+    if existing_log:
+        c.execute("UPDATE weight_logs SET weight = ? WHERE id = ?", (weight, existing_log[0]))
+    else:
+        c.execute("INSERT INTO weight_logs (date, weight, user_id) VALUES (?, ?, ?)", (date, weight, 1))
+    conn.commit()
+
+
+def locked_select_then_write(conn, date, weight):
+    conn.execute("BEGIN IMMEDIATE")
+    select_then_write(conn, date, weight)
+
+
+def upsert(conn, date, weight):
+    conn.execute("""INSERT INTO weight_logs (date, weight, user_id) VALUES (?, ?, ?)
+                    ON CONFLICT (user_id, date) DO UPDATE SET weight = excluded.weight""",
+                 (date, weight, 1))
+    conn.commit()
+
+
+WRITE_PATHS = [
+    ('select-then-write', select_then_write, False),
+    ('locked select-then-write', locked_select_then_write, False),
+    ('upsert', upsert, True),
+]
+
+
+def run(write, unique_index, threads, rounds):
+    db_fd, db_path = tempfile.mkstemp(suffix='.db')
+    setup = sqlite3.connect(db_path)
+    apply_pragmas(setup, profile_pragmas('balanced'))
+    setup.execute(SCHEMA)
+    if unique_index:
+        setup.execute("CREATE UNIQUE INDEX idx_weight_logs_user_date_unique ON weight_logs(user_id, date)")
+    setup.commit()
+
+    barrier = threading.Barrier(threads)
+    busy_time = [0.0] * threads
+
+    def worker(n):
+        conn = sqlite3.connect(db_path, timeout=30)
+        apply_pragmas(conn, profile_pragmas('balanced'))
+        for day in range(rounds):
+            barrier.wait()
+            start = time.perf_counter()
+            write(conn, f'day-{day:05d}', 70 + n / 10)
+            busy_time[n] += time.perf_counter() - start
+        conn.close()
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+    rows = setup.execute("SELECT COUNT(*) FROM weight_logs").fetchone()[0]
+    setup.close()
+    os.close(db_fd)
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.unlink(db_path + suffix)
+    # Throughput over time spent writing, so barrier waits don't count
+    writes = threads * rounds
+    return writes / (sum(busy_time) / threads), rows - rounds
+
+
+def main(threads=8, rounds=300):
+    print(f"{threads} threads writing the same user/day, {rounds} days")
+    print(f"{'path':28} {'writes/s':>9} {'duplicate rows':>15}")
+    for label, write, unique_index in WRITE_PATHS:
+        rate, duplicates = run(write, unique_index, threads, rounds)
+        print(f"{label:28} {rate:9.0f} {duplicates:15d}")
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 8, int(args[1]) if len(args) > 1 else 300)
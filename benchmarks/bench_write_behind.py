@@ -0,0 +1,54 @@
+"""Bursty multi-user log_food traffic with and without the write-behind writer.
+
+Uses the durable profile (an fsync on every commit) so the cost group commit saves is visible.
+
+    python -m benchmarks.bench_write_behind [threads] [requests_per_thread]
+"""
+import sys
+import threading
+import time
+
+import app as app_module
+from benchmarks.common import bench_app, logged_in_client
+
+FOOD = {'name': 'Oats', 'calories': '150', 'protein': '5', 'servings': '1'}
+
+
+def run(flask_app, threads, requests_per_thread):
+    clients = [logged_in_client(flask_app) for _ in range(threads)]
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(client):
+        barrier.wait()
+        for _ in range(requests_per_thread):
+            client.post('/log_food', data=FOOD)
+
+    workers = [threading.Thread(target=worker, args=(client,)) for client in clients]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    stats = clients[0].get('/api/write-queue-stats').get_json()
+    return threads * requests_per_thread / elapsed, stats
+
+
+def main(threads=8, requests_per_thread=100):
+    print(f"{threads} threads x {requests_per_thread} log_food requests, durable profile")
+    for label, write_behind in (('direct commits', False), ('write-behind', True)):
+        with bench_app(DB_PROFILE='durable', DB_POOL_SIZE=threads, LOG_WRITE_BEHIND=write_behind) as flask_app:
+            rate, stats = run(flask_app, threads, requests_per_thread)
+            if app_module._log_writer is not None:
+                app_module._log_writer.stop()
+                app_module._log_writer = None
+        print(f"{label:16} {rate:8.0f} requests/s")
+        if stats['enabled']:
+            print(f"{'':16} avg batch {stats['avg_batch_size']}, max batch {stats['max_batch_size']}, "
+                  f"avg commit {stats['avg_commit_ms']} ms")
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 8, int(args[1]) if len(args) > 1 else 100)
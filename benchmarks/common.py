@@ -0,0 +1,92 @@
+"""Shared setup for the benchmark scripts.
+
+Run benchmarks from the repository root, e.g. ``python -m benchmarks.bench_connection_pool``.
+"""
+import os
+import tempfile
+import time
+import statistics
+import tracemalloc
+from contextlib import contextmanager
+
+from werkzeug.security import generate_password_hash
+
+import app as app_module
+
+BENCH_USERNAME = 'benchuser'
+BENCH_PASSWORD = 'password'
+
+
+@contextmanager
+def bench_app(**config):
+    """Yield the Flask app pointed at a fresh temporary database with one user in it"""
+    db_fd, db_path = tempfile.mkstemp(suffix='.db')
+    original_db_path = app_module.DB_PATH
+    original_config = dict(app_module.app.config)
+
+    app_module.DB_PATH = db_path
+    app_module.app.config.update({
+        'TESTING': False,
+        'SECRET_KEY': 'benchmark',
+        'DB_PATH': db_path,
+        **config,
+    })
+    app_module.init_db()
+
+    conn = app_module.sqlite3.connect(db_path)
+    conn.execute("INSERT INTO users (username, password) VALUES (?, ?)",
+                 (BENCH_USERNAME, generate_password_hash(BENCH_PASSWORD)))
+    conn.commit()
+    conn.close()
+
+    try:
+        yield app_module.app
+    finally:
+        with app_module.app.app_context():
+            app_module.get_database().close()
+        app_module.DB_PATH = original_db_path
+        app_module.app.config.clear()
+        app_module.app.config.update(original_config)
+        os.close(db_fd)
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.unlink(db_path + suffix)
+
+
+def logged_in_client(flask_app):
+    """Return a test client with the benchmark user logged in"""
+    client = flask_app.test_client()
+    client.post('/login', data={'username': BENCH_USERNAME, 'password': BENCH_PASSWORD})
+    return client
+
+
+def time_calls(fn, iterations):
+    """Call ``fn`` ``iterations`` times and return the per-call latencies in milliseconds"""
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def summarize(samples):
+    """Mean, median, p95, p99 and max of a list of millisecond samples"""
+    ordered = sorted(samples)
+    return {
+        'mean_ms': statistics.fmean(ordered),
+        'p50_ms': ordered[len(ordered) // 2],
+        'p95_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        'p99_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))],
+        'max_ms': ordered[-1],
+    }
+
+
+def peak_kib(fn):
+    """Peak traced allocation while running ``fn`` once, in KiB"""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
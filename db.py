@@ -0,0 +1,537 @@
+"""SQLite connection handling for the food tracker.
+
+Each database file gets one writer connection, handed out to one request at
+a time, and a small pool of read-only connections. Flask code should not use
+the pools directly: ``app.get_db()`` (writer) and ``app.get_read_db()``
+(reader) check a connection out once per app context and return it on teardown.
+"""
+import os
+import queue
+import sqlite3
+import threading
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Defaults used when the app config doesn't override them
+DEFAULT_POOL_SIZE = 5
+DEFAULT_POOL_TIMEOUT = 5.0
+DEFAULT_PROFILE = 'balanced'
+DEFAULT_SHARD_MODE = 'none'
+DEFAULT_SHARD_BUCKETS = 16
+DEFAULT_SHARD_CACHE_SIZE = 64
+
+# How per-user data is laid out on disk. The users table always stays in the main database:
+#   none   - everything in the main database file
+#   user   - one file per user
+#   bucket - one file per user_id % DB_SHARD_BUCKETS
+SHARD_MODES = ('none', 'user', 'bucket')
+
+# Tables whose rows belong to one user and move into that user's shard
+SHARDED_TABLES = ('foods', 'daily_log', 'daily_summary', 'weight_logs')
+
+# Named pragma sets applied to every connection. All of them use WAL so a
+# log_food write doesn't block concurrent dashboard reads; they differ in how
+# much durability they trade for speed:
+#   durable  - fsync on every commit, nothing lost on power failure
+#   balanced - fsync at checkpoints only; a power cut can lose the last commits but never corrupts
+#   fast     - no fsync at all, bigger caches; for throwaway or easily rebuilt databases
+PRAGMA_PROFILES = {
+    'durable': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'cache_size': -2000,  # negative values are KiB
+        'mmap_size': 0,
+        'temp_store': 'DEFAULT',
+        'busy_timeout': 5000,
+    },
+    'balanced': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -16000,
+        'mmap_size': 64 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+    },
+    'fast': {
+        'journal_mode': 'WAL',
+        'synchronous': 'OFF',
+        'cache_size': -64000,
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 10000,
+    },
+}
+
+
+class PoolTimeout(sqlite3.OperationalError):
+    """Raised when no pooled connection becomes free within the checkout timeout."""
+
+
+class PoolClosed(sqlite3.ProgrammingError):
+    """Raised when checking a connection out of a pool that has been closed."""
+
+
+def profile_pragmas(profile, overrides=None):
+    """Return the pragmas for a named profile, with ``overrides`` taking precedence"""
+    if profile not in PRAGMA_PROFILES:
+        raise ValueError(f"Unknown database profile {profile!r}; expected one of {', '.join(PRAGMA_PROFILES)}")
+    return {**PRAGMA_PROFILES[profile], **(overrides or {})}
+
+
+def apply_pragmas(conn, pragmas):
+    """Run ``PRAGMA name = value`` on a connection for every item in ``pragmas``"""
+    for name, value in (pragmas or {}).items():
+        try:
+            conn.execute(f"PRAGMA {name} = {value}")
+        except sqlite3.OperationalError:
+            # Changing the journal mode needs an exclusive lock; it is persistent and init_db sets it,
+            # so a busy database shouldn't stop the connection from being used
+            if name != 'journal_mode':
+                raise
+            logger.warning("Could not set journal_mode=%s on a busy database; keeping the current mode", value)
+
+
+class ConnectionPool:
+    """A bounded pool of SQLite connections to one database file.
+
+    ``size`` is the most connections the pool will ever have open. A size of
+    0 disables pooling: every checkout opens a fresh connection and every
+    release closes it, which is how the app behaved before pooling existed.
+    """
+
+    def __init__(self, db_path, size=DEFAULT_POOL_SIZE, timeout=DEFAULT_POOL_TIMEOUT, pragmas=None):
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = dict(pragmas or {})
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._closed = False
+
+    def _connect(self):
+        # Connections move between request threads, so sqlite3's same-thread check is off;
+        # the pool guarantees only one thread uses a connection at a time
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        apply_pragmas(conn, self.pragmas)
+        return conn
+
+    def acquire(self):
+        """Check a connection out of the pool, opening one if the pool isn't full yet"""
+        if self._closed:
+            raise PoolClosed("Connection pool is closed")
+
+        if self.size <= 0:
+            return self._connect()
+
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._opened -= 1
+                    raise
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise PoolTimeout(
+                f"No database connection available after {self.timeout}s (pool size {self.size})"
+            ) from None
+
+    def release(self, conn):
+        """Return a connection to the pool, discarding any uncommitted work"""
+        if self.size <= 0 or self._closed:
+            conn.close()
+            return
+
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # A broken connection is dropped instead of being handed to the next request
+            logger.warning("Discarding broken pooled connection to %s", self.db_path)
+            with self._lock:
+                self._opened -= 1
+            conn.close()
+            return
+
+        self._idle.put(conn)
+
+    def close(self):
+        """Close every idle connection; checked-out connections are closed when released"""
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+        with self._lock:
+            self._opened = 0
+
+
+# daily_log columns that daily_totals sums per user and day
+TOTAL_COLUMNS = ('calories', 'protein', 'carbs', 'fat')
+
+
+def rebuild_daily_totals(conn, user_id=None):
+    """Recompute daily_totals from daily_log, for one user or everyone; returns the number of rows written.
+
+    The triggers from migration 2 keep daily_totals current on every write, so this is only needed
+    after repairing data by hand or restoring a backup taken without them.
+    """
+    where = "" if user_id is None else " WHERE user_id = ?"
+    params = () if user_id is None else (user_id,)
+    # Migration 2 runs this before migration 4 adds carbs and fat, so sum the columns the table has
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(daily_totals)")}
+    totals = [column for column in TOTAL_COLUMNS if column in columns]
+    conn.execute("DELETE FROM daily_totals" + where, params)
+    cursor = conn.execute(f"""INSERT INTO daily_totals (user_id, date, {', '.join(totals)}, entry_count)
+                              SELECT user_id, date, {', '.join(f'SUM({column})' for column in totals)}, COUNT(*)
+                              FROM daily_log{where}
+                              GROUP BY user_id, date""", params)
+    return cursor.rowcount
+
+
+class Database:
+    """Single-writer / multi-reader connections to one database file.
+
+    All writes go through one connection (a pool of size 1, so the pool's queue
+    serializes writers and its checkout timeout applies). Reads go through a pool
+    of ``PRAGMA query_only`` connections, which in WAL mode never wait on the writer.
+    A ``reader_pool_size`` of 0 turns pooling off for both, giving every checkout
+    its own connection as the app did before pooling.
+    """
+
+    def __init__(self, db_path, reader_pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_POOL_TIMEOUT, pragmas=None):
+        self.db_path = db_path
+        pragmas = dict(pragmas or {})
+        self.writer = ConnectionPool(db_path, size=1 if reader_pool_size > 0 else 0,
+                                     timeout=timeout, pragmas=pragmas)
+        self.readers = ConnectionPool(db_path, size=reader_pool_size, timeout=timeout,
+                                      pragmas={**pragmas, 'query_only': 'ON'})
+
+    def pool(self, role):
+        """The writer pool for role 'write', the reader pool for role 'read'"""
+        return self.writer if role == 'write' else self.readers
+
+    def close(self):
+        self.writer.close()
+        self.readers.close()
+
+
+def shard_filename(user_id, mode, buckets=DEFAULT_SHARD_BUCKETS):
+    """Name of the shard file holding a user's data"""
+    if mode == 'user':
+        return f"user_{int(user_id)}.db"
+    if mode == 'bucket':
+        return f"bucket_{int(user_id) % buckets:04d}.db"
+    raise ValueError(f"Unknown shard mode {mode!r}; expected one of {', '.join(SHARD_MODES[1:])}")
+
+
+class ShardRouter:
+    """Maps users to shard files and keeps an LRU of open shard handles.
+
+    Each open shard is a ``Database`` (one writer plus readers). At most ``cache_size``
+    shards stay open; opening another closes the least recently used one. ``setup`` is
+    called with a shard's path the first time this process opens it, to create the
+    schema and run migrations. It runs outside the router's lock, under one per shard,
+    so other users' lookups don't wait on it.
+    """
+
+    def __init__(self, shard_dir, mode, buckets=DEFAULT_SHARD_BUCKETS, cache_size=DEFAULT_SHARD_CACHE_SIZE,
+                 reader_pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_POOL_TIMEOUT, pragmas=None, setup=None):
+        shard_filename(0, mode, buckets)  # validate the mode up front
+        self.shard_dir = shard_dir
+        self.mode = mode
+        self.buckets = buckets
+        self.cache_size = max(1, cache_size)
+        self.reader_pool_size = reader_pool_size
+        self.timeout = timeout
+        self.pragmas = dict(pragmas or {})
+        self.setup = setup
+        self._open = OrderedDict()
+        self._prepared = set()
+        self._setup_locks = {}  # path -> lock held while that shard is set up
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        os.makedirs(shard_dir, exist_ok=True)
+
+    def path_for(self, user_id):
+        return os.path.join(self.shard_dir, shard_filename(user_id, self.mode, self.buckets))
+
+    def prepare(self, path):
+        """Create and migrate a shard file unless this process already has"""
+        with self._lock:
+            setup_lock = self._setup_locks.setdefault(path, threading.Lock())
+        # Only requests for this shard wait here, and only until it's set up once
+        with setup_lock:
+            if path not in self._prepared:
+                if self.setup is not None:
+                    self.setup(path)
+                self._prepared.add(path)
+
+    def get(self, user_id):
+        """Return the open Database for a user's shard, opening it (and evicting the oldest) if needed"""
+        path = self.path_for(user_id)
+        with self._lock:
+            database = self._open.get(path)
+            if database is not None:
+                self._open.move_to_end(path)
+                self._hits += 1
+                return database
+            self._misses += 1
+
+        self.prepare(path)
+        database = Database(path, reader_pool_size=self.reader_pool_size, timeout=self.timeout,
+                            pragmas=self.pragmas)
+        with self._lock:
+            opened = self._open.get(path)
+            if opened is not None:
+                # Another request opened the shard meanwhile; use that one
+                self._open.move_to_end(path)
+                database.close()
+                return opened
+            self._open[path] = database
+            while len(self._open) > self.cache_size:
+                _, evicted = self._open.popitem(last=False)
+                # Connections still checked out are closed when their request releases them
+                evicted.close()
+                self._evictions += 1
+            return database
+
+    def acquire(self, user_id, role):
+        """Check a writer ('write') or reader ('read') connection out of a user's shard; returns (pool, conn)"""
+        while True:
+            pool = self.get(user_id).pool(role)
+            try:
+                return pool, pool.acquire()
+            except PoolClosed:
+                # Evicted between get() and acquire(); the next get() reopens it
+                continue
+
+    def paths(self):
+        """Every shard file currently on disk"""
+        return sorted(os.path.join(self.shard_dir, name) for name in os.listdir(self.shard_dir)
+                      if name.endswith('.db'))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'open_shards': len(self._open),
+                'cache_size': self.cache_size,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+            }
+
+    def close(self):
+        with self._lock:
+            while self._open:
+                _, database = self._open.popitem()
+                database.close()
+
+
+def split_into_shards(conn, router):
+    """Copy every user's rows from a single-file database into their shards.
+
+    ``conn`` is a connection to the single-file database, which is left unchanged.
+    Rows keep their ids, and rows already in a shard are skipped, so the split can be
+    re-run safely. daily_totals is rebuilt in each shard by its triggers.
+    Returns the number of rows copied per table.
+    """
+    shards = {}
+    for (user_id,) in conn.execute("SELECT id FROM users ORDER BY id"):
+        shards.setdefault(router.path_for(user_id), []).append(user_id)
+
+    copied = dict.fromkeys(SHARDED_TABLES, 0)
+    for path, user_ids in shards.items():
+        router.prepare(path)
+        conn.execute("ATTACH DATABASE ? AS shard", (path,))
+        try:
+            conn.execute("BEGIN")
+            try:
+                for table in SHARDED_TABLES:
+                    columns = ', '.join(row[1] for row in conn.execute(f"PRAGMA main.table_info({table})"))
+                    for user_id in user_ids:
+                        cursor = conn.execute(f"""INSERT OR IGNORE INTO shard.{table} ({columns})
+                                                  SELECT {columns} FROM main.{table} WHERE user_id = ?""",
+                                              (user_id,))
+                        copied[table] += cursor.rowcount
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        finally:
+            conn.execute("DETACH DATABASE shard")
+    return copied
+
+
+# Schema migrations, applied in order by migrate(). PRAGMA user_version records
+# the last one applied. Never edit a released migration; append a new one.
+# Each step is a SQL string or a callable taking the connection.
+MIGRATIONS = [
+    (1, "Add indexes for per-user and per-day lookups", [
+        # rowid (= id) is the implicit last column, so this also serves ORDER BY id
+        "CREATE INDEX IF NOT EXISTS idx_daily_log_user_date ON daily_log(user_id, date)",
+        "CREATE INDEX IF NOT EXISTS idx_weight_logs_user_date ON weight_logs(user_id, date, weight)",
+        "CREATE INDEX IF NOT EXISTS idx_daily_summary_user_date ON daily_summary(user_id, date)",
+        "CREATE INDEX IF NOT EXISTS idx_foods_user_name ON foods(user_id, name)",
+        # login looks usernames up case-insensitively, which the UNIQUE index can't serve
+        "CREATE INDEX IF NOT EXISTS idx_users_username_nocase ON users(username COLLATE NOCASE)",
+    ]),
+    (2, "Add daily_totals, maintained by triggers on daily_log", [
+        """CREATE TABLE IF NOT EXISTS daily_totals
+           (user_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            calories INTEGER NOT NULL DEFAULT 0,
+            protein INTEGER NOT NULL DEFAULT 0,
+            entry_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, date)) WITHOUT ROWID""",
+        # Triggers run inside the writing statement's transaction, so the totals can never
+        # disagree with daily_log whichever route (or test) does the write
+        """CREATE TRIGGER IF NOT EXISTS daily_totals_after_insert AFTER INSERT ON daily_log
+           BEGIN
+               INSERT INTO daily_totals (user_id, date, calories, protein, entry_count)
+               VALUES (NEW.user_id, NEW.date, NEW.calories, NEW.protein, 1)
+               ON CONFLICT (user_id, date) DO UPDATE SET
+                   calories = calories + excluded.calories,
+                   protein = protein + excluded.protein,
+                   entry_count = entry_count + 1;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS daily_totals_after_delete AFTER DELETE ON daily_log
+           BEGIN
+               UPDATE daily_totals
+               SET calories = calories - OLD.calories,
+                   protein = protein - OLD.protein,
+                   entry_count = entry_count - 1
+               WHERE user_id = OLD.user_id AND date = OLD.date;
+               DELETE FROM daily_totals
+               WHERE user_id = OLD.user_id AND date = OLD.date AND entry_count <= 0;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS daily_totals_after_update
+           AFTER UPDATE OF user_id, date, calories, protein ON daily_log
+           BEGIN
+               UPDATE daily_totals
+               SET calories = calories - OLD.calories,
+                   protein = protein - OLD.protein,
+                   entry_count = entry_count - 1
+               WHERE user_id = OLD.user_id AND date = OLD.date;
+               DELETE FROM daily_totals
+               WHERE user_id = OLD.user_id AND date = OLD.date AND entry_count <= 0;
+               INSERT INTO daily_totals (user_id, date, calories, protein, entry_count)
+               VALUES (NEW.user_id, NEW.date, NEW.calories, NEW.protein, 1)
+               ON CONFLICT (user_id, date) DO UPDATE SET
+                   calories = calories + excluded.calories,
+                   protein = protein + excluded.protein,
+                   entry_count = entry_count + 1;
+           END""",
+        rebuild_daily_totals,
+    ]),
+    (3, "Allow one weight log per user per day", [
+        # Concurrent log_weight calls could insert the same day twice; keep the latest write
+        """DELETE FROM weight_logs
+           WHERE id NOT IN (SELECT MAX(id) FROM weight_logs GROUP BY user_id, date)""",
+        "DROP INDEX IF EXISTS idx_weight_logs_user_date",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_weight_logs_user_date_unique ON weight_logs(user_id, date)",
+    ]),
+    (4, "Track carbs and fat, with optional daily limits", [
+        "ALTER TABLE foods ADD COLUMN carbs INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE foods ADD COLUMN fat INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE daily_log ADD COLUMN carbs INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE daily_log ADD COLUMN fat INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE daily_totals ADD COLUMN carbs INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE daily_totals ADD COLUMN fat INTEGER NOT NULL DEFAULT 0",
+        # NULL means no limit
+        "ALTER TABLE users ADD COLUMN carb_limit INTEGER",
+        "ALTER TABLE users ADD COLUMN fat_limit INTEGER",
+        # The triggers from migration 2, summing carbs and fat as well
+        "DROP TRIGGER IF EXISTS daily_totals_after_insert",
+        "DROP TRIGGER IF EXISTS daily_totals_after_delete",
+        "DROP TRIGGER IF EXISTS daily_totals_after_update",
+        """CREATE TRIGGER daily_totals_after_insert AFTER INSERT ON daily_log
+           BEGIN
+               INSERT INTO daily_totals (user_id, date, calories, protein, carbs, fat, entry_count)
+               VALUES (NEW.user_id, NEW.date, NEW.calories, NEW.protein, NEW.carbs, NEW.fat, 1)
+               ON CONFLICT (user_id, date) DO UPDATE SET
+                   calories = calories + excluded.calories,
+                   protein = protein + excluded.protein,
+                   carbs = carbs + excluded.carbs,
+                   fat = fat + excluded.fat,
+                   entry_count = entry_count + 1;
+           END""",
+        """CREATE TRIGGER daily_totals_after_delete AFTER DELETE ON daily_log
+           BEGIN
+               UPDATE daily_totals
+               SET calories = calories - OLD.calories,
+                   protein = protein - OLD.protein,
+                   carbs = carbs - OLD.carbs,
+                   fat = fat - OLD.fat,
+                   entry_count = entry_count - 1
+               WHERE user_id = OLD.user_id AND date = OLD.date;
+               DELETE FROM daily_totals
+               WHERE user_id = OLD.user_id AND date = OLD.date AND entry_count <= 0;
+           END""",
+        """CREATE TRIGGER daily_totals_after_update
+           AFTER UPDATE OF user_id, date, calories, protein, carbs, fat ON daily_log
+           BEGIN
+               UPDATE daily_totals
+               SET calories = calories - OLD.calories,
+                   protein = protein - OLD.protein,
+                   carbs = carbs - OLD.carbs,
+                   fat = fat - OLD.fat,
+                   entry_count = entry_count - 1
+               WHERE user_id = OLD.user_id AND date = OLD.date;
+               DELETE FROM daily_totals
+               WHERE user_id = OLD.user_id AND date = OLD.date AND entry_count <= 0;
+               INSERT INTO daily_totals (user_id, date, calories, protein, carbs, fat, entry_count)
+               VALUES (NEW.user_id, NEW.date, NEW.calories, NEW.protein, NEW.carbs, NEW.fat, 1)
+               ON CONFLICT (user_id, date) DO UPDATE SET
+                   calories = calories + excluded.calories,
+                   protein = protein + excluded.protein,
+                   carbs = carbs + excluded.carbs,
+                   fat = fat + excluded.fat,
+                   entry_count = entry_count + 1;
+           END""",
+    ]),
+]
+
+
+def schema_version(conn):
+    """Return the number of the last migration applied to the database"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """Apply every migration newer than the database's user_version, each in its own transaction"""
+    current = schema_version(conn)
+    for version, description, steps in MIGRATIONS:
+        if version <= current:
+            continue
+        logger.info("Applying migration %d: %s", version, description)
+        conn.execute("BEGIN")
+        try:
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            # PRAGMA doesn't take bound parameters
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        current = version
+    return current
@@ -0,0 +1,61 @@
+"""Multi-day meal plans from the quick add list.
+
+``plan_meals()`` picks each day's foods with the recommendation frontier against the
+full daily goals: the hit_both suggestion when there is one, otherwise the closest.
+A food goes into at most ``max_repeats`` days; once it has, it is left out of the
+days after. Every day's table comes from one ``recommender.CatalogState`` over the
+whole list, so a day only replays the rows after the first food used up, instead of
+building a table per day from scratch. Until some food reaches its limit the foods left
+don't change, and neither does the suggestion, so those days reuse the day before's.
+
+Planning can be cancelled between days through a ``threading.Event``; the planner
+then raises ``PlanCancelled``.
+"""
+from typing import NamedTuple
+
+from recommender import CatalogState, Frontier
+
+DEFAULT_PLAN_DAYS = 7
+DEFAULT_MAX_REPEATS = 2
+
+
+class PlanCancelled(Exception):
+    """Raised by ``plan_meals()`` when its cancel event is set"""
+
+
+class PlanDay(NamedTuple):
+    """One planned day: its foods, and which suggestion they are ('hit_both' or 'closest')"""
+    foods: list
+    mode: str
+    total_calories: int
+    total_protein: int
+
+
+def plan_meals(foods, calorie_goal, protein_goal, days=DEFAULT_PLAN_DAYS, max_repeats=DEFAULT_MAX_REPEATS,
+               backend='auto', state=None, cancel=None):
+    """Plan ``days`` days of ``foods`` (a quick add list in id order), returning a PlanDay per day.
+
+    ``state`` is the list's ``CatalogState`` if the caller keeps one; otherwise one is built
+    for the plan. Days for which nothing is left get no foods.
+    """
+    foods = list(foods)
+    if state is None or not state.matches(foods):
+        state = CatalogState(foods, backend=backend)
+    used = {food.id: 0 for food in foods}
+    plan = []
+    available = None
+    for _ in range(days):
+        if cancel is not None and cancel.is_set():
+            raise PlanCancelled(f"Meal plan cancelled after {len(plan)} of {days} days")
+        left = [food for food in foods if used[food.id] < max_repeats]
+        if left != available:
+            available = left
+            frontier = Frontier(available, calorie_goal, protein_goal, backend=backend, state=state)
+            chosen, mode = frontier.hit_both(), 'hit_both'
+            if chosen is None:
+                chosen, mode = frontier.closest(), 'closest'
+        for food in chosen:
+            used[food.id] += 1
+        plan.append(PlanDay(chosen, mode, sum(food.calories for food in chosen),
+                            sum(food.protein for food in chosen)))
+    return plan
@@ -0,0 +1,93 @@
+"""LRU + TTL cache of recommendation results.
+
+Entries are keyed by user, that user's catalog version, the foods already eaten
+today and the remaining calories/protein, so a repeated "Show recommendations"
+with nothing changed skips the knapsack. The routes that change a user's quick
+add list, log or goals call ``invalidate(user_id)``, which drops their entries
+and bumps their catalog version. Entries also expire after ``ttl`` seconds, so
+a write made by another process is never served stale for longer than that.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_CACHE_SIZE = 1024
+DEFAULT_CACHE_TTL = 300  # seconds
+
+
+class RecommendationCache:
+    """A thread-safe, size-bounded map of recommendation keys to results"""
+
+    def __init__(self, max_entries=DEFAULT_CACHE_SIZE, ttl=DEFAULT_CACHE_TTL, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (expires at, result), least recently used first
+        self._versions = {}  # user_id -> catalog version
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+
+    def key(self, user_id, eaten, remaining_calories, remaining_protein, *options):
+        """The cache key for one request; ``options`` holds anything else the result depends on"""
+        with self._lock:
+            version = self._versions.get(user_id, 0)
+        return (user_id, version, frozenset(eaten), remaining_calories, remaining_protein) + options
+
+    def get(self, key):
+        """The cached result for ``key``, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= self._clock():
+                del self._entries[key]
+                self._expirations += 1
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[1]
+
+    def put(self, key, result):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            # A write since the key was made means the result may already be stale
+            if key[1] != self._versions.get(key[0], 0):
+                return
+            self._entries[key] = (self._clock() + self.ttl, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, user_id):
+        """Forget everything cached for a user after their data changed"""
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            for key in [key for key in self._entries if key[0] == user_id]:
+                del self._entries[key]
+            self._invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / lookups if lookups else 0.0,
+                'evictions': self._evictions,
+                'expirations': self._expirations,
+                'invalidations': self._invalidations,
+            }
@@ -0,0 +1,135 @@
+"""Recommendation jobs run off the request thread.
+
+In async mode ``/get_recommendations`` submits the solve to a small process pool
+and answers at once with a job id; the dashboard polls ``/recommendation_jobs/<id>``
+until the result is ready. A heavy knapsack then holds a worker process instead of
+a WSGI thread. Submitting the same work for a user while an identical job is still
+running returns that job instead of starting another, and at most ``max_pending``
+jobs wait or run at once.
+
+A job that hasn't started can be cancelled outright. One already running stops only
+if its function watches the ``cancel_event`` it was submitted with, which needs a
+thread pool (pass ``executor``), since an event doesn't reach another process.
+"""
+import multiprocessing
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_PENDING = 32
+DEFAULT_RESULT_TTL = 300  # seconds a finished job stays available for polling
+
+
+class JobQueueFull(Exception):
+    """Raised by ``submit()`` when ``max_pending`` jobs are already waiting or running"""
+
+
+class Job:
+    def __init__(self, job_id, user_id, key, future, context, cancel_event=None):
+        self.id = job_id
+        self.user_id = user_id
+        self.key = key
+        self.future = future
+        self.context = context  # whatever the caller needs to build the response
+        self.cancel_event = cancel_event  # set by cancel(); the job's function decides when to stop
+        self.finished_at = None
+
+
+class RecommendationJobs:
+    """A bounded pool of worker processes and the jobs submitted to it"""
+
+    def __init__(self, max_workers=DEFAULT_WORKERS, max_pending=DEFAULT_MAX_PENDING, ttl=DEFAULT_RESULT_TTL,
+                 executor=None, clock=time.monotonic):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self._clock = clock
+        # 'spawn' starts clean workers rather than forking a threaded web server
+        self._executor = executor or ProcessPoolExecutor(max_workers, mp_context=multiprocessing.get_context('spawn'))
+        self._jobs = {}  # job id -> Job
+        self._in_flight = {}  # (user_id, key) -> job id
+        self._lock = threading.Lock()
+        self._submitted = 0
+        self._deduplicated = 0
+        self._rejected = 0
+        self._completed = 0
+        self._failed = 0
+        self._cancelled = 0
+
+    def submit(self, user_id, key, fn, *args, context=None, cancel_event=None, **kwargs):
+        """Run ``fn(*args, **kwargs)`` in the pool and return the job id, reusing an identical running job"""
+        with self._lock:
+            self._prune()
+            job_id = self._in_flight.get((user_id, key))
+            if job_id is not None:
+                self._deduplicated += 1
+                return job_id
+            if len(self._in_flight) >= self.max_pending:
+                self._rejected += 1
+                raise JobQueueFull(f"{len(self._in_flight)} recommendation jobs already pending")
+            job_id = uuid.uuid4().hex
+            future = self._executor.submit(fn, *args, **kwargs)
+            self._jobs[job_id] = Job(job_id, user_id, key, future, context, cancel_event)
+            self._in_flight[(user_id, key)] = job_id
+            self._submitted += 1
+        future.add_done_callback(lambda _: self._finished(job_id))
+        return job_id
+
+    def _finished(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished_at is not None:
+                return
+            job.finished_at = self._clock()
+            if self._in_flight.get((job.user_id, job.key)) == job_id:
+                del self._in_flight[(job.user_id, job.key)]
+            if job.future.cancelled():
+                self._cancelled += 1
+            elif job.future.exception() is None:
+                self._completed += 1
+            else:
+                self._failed += 1
+
+    def _prune(self):
+        """Forget finished jobs nobody polled within the TTL"""
+        cutoff = self._clock() - self.ttl
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at is not None and job.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def get(self, user_id, job_id):
+        """The job, if it exists and belongs to ``user_id``"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return job if job is not None and job.user_id == user_id else None
+
+    def cancel(self, user_id, job_id):
+        """Cancel a user's unfinished job, or ask it to stop if it's running; False if neither is possible"""
+        job = self.get(user_id, job_id)
+        if job is None or job.future.done():
+            return False
+        if job.future.cancel():
+            return True
+        if job.cancel_event is not None:
+            job.cancel_event.set()
+            return True
+        return False
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.max_workers,
+                'max_pending': self.max_pending,
+                'pending': len(self._in_flight),
+                'submitted': self._submitted,
+                'deduplicated': self._deduplicated,
+                'rejected': self._rejected,
+                'completed': self._completed,
+                'failed': self._failed,
+                'cancelled': self._cancelled,
+            }
@@ -0,0 +1,1312 @@
+"""Food recommendations: which quick add foods fill the rest of the day's goals.
+
+Recommendations are a 0/1 knapsack over the foods not yet eaten today, with
+calories as the weight and protein as the value. One knapsack table gives the
+most protein reachable at every calorie budget, i.e. the calorie/protein Pareto
+frontier, and every suggestion on the dashboard is a point on it:
+
+    hit_both       the most protein within the remaining calories, if it meets the remaining protein
+    protein_first  the fewest calories (at least the remaining calories) that meet the remaining protein
+    calorie_first  the most protein within the remaining calories, whether or not it meets the protein goal
+    closest        of the frontier's options (none gives as much protein for fewer calories), the one
+                   with the smallest relative miss on calories (either way) plus shortfall on protein
+
+The DP runs on a pluggable backend: 'python' (always available) or 'numpy',
+which computes each row with array operations. 'auto' picks NumPy when it is
+installed, and for short lists skips the table for ``SubsetSearchTable``, which
+gives the same answers from the Pareto-optimal subsets (``select_table_class()``).
+
+For big lists and budgets, an approximate frontier counts calories in buckets
+of ``granularity`` kcal, shrinking the table by that factor. Every suggestion
+then has at least the protein the exact one would have (protein_first still
+meets the protein goal), and at most ``granularity - 1`` more calories per food
+in it. ``choose_granularity()`` picks the smallest bucket that fits a latency
+budget.
+
+Suggestions can also include several servings of a food, in half-serving steps,
+by splitting each food into a few 0/1 items (``split_servings()``).
+
+``hit_both_feasible()`` rules hit_both out without a table (a bitset DP over
+protein levels), so asking for hit_both alone can skip the frontier.
+
+``anytime_recommend()`` answers within a deadline. It starts from a greedy
+protein-per-calorie answer and replaces it with the exact or an approximate
+frontier when the estimated solve time fits what is left.
+
+Limits on carbs and fat make it a knapsack with three weights, where an exact
+table is calories x carbs x fat cells per food. ``macro_recommend()`` counts each
+limit in buckets sized so the table (``MacroTable``) fits a latency budget, with
+the same kind of bound as the approximate frontier.
+"""
+import bisect
+import heapq
+import math
+import threading
+import time
+from functools import lru_cache
+from typing import NamedTuple
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; without it every table is built in pure Python
+    np = None
+
+
+class Food(NamedTuple):
+    id: int
+    name: str = ''
+    calories: int = 0
+    protein: int = 0
+    servings: float = 1  # how many servings the calories and protein are for, in multi-serving suggestions
+    carbs: int = 0
+    fat: int = 0
+
+
+class KnapsackTable:
+    """The best protein for every calorie budget from 0 to ``capacity``.
+
+    Only one row of the DP is kept (``best``), updated in place from the highest
+    budget down. To recover which foods make up a budget, each food gets one bit
+    per budget recording whether taking it improved that budget, so memory is
+    ``capacity`` ints plus ``len(foods) * capacity`` bits instead of a full
+    table of ints.
+
+    ``empty_at_zero`` reproduces the original table, which left budget 0 empty
+    even when 0-calorie foods were available.
+    """
+
+    def __init__(self, foods, capacity, empty_at_zero=True):
+        self.foods = list(foods)
+        self.capacity = capacity
+        self.empty_at_zero = empty_at_zero
+        self.best, self._take = self._build()
+
+    @classmethod
+    def from_rows(cls, foods, capacity, best, take, empty_at_zero=True):
+        """A table over ``foods`` from a best row and take bits that were already computed"""
+        table = cls.__new__(cls)
+        table.foods = list(foods)
+        table.capacity = capacity
+        table.empty_at_zero = empty_at_zero
+        table.best, table._take = best, take
+        return table
+
+    def _build(self):
+        """Return the best-protein row and the per-food take bits"""
+        best = self.empty_row(self.capacity)
+        take = [self.add_row(best, food, self.capacity, self.empty_at_zero) for food in self.foods]
+        return best, take
+
+    @staticmethod
+    def empty_row(capacity):
+        """The best row before any food: no protein at any budget"""
+        return [0] * (capacity + 1)
+
+    @staticmethod
+    def add_row(best, food, capacity, empty_at_zero=True):
+        """Update ``best`` in place for one more food and return that food's take bits"""
+        weight, value = food.calories, food.protein
+        bits = bytearray((capacity >> 3) + 1)
+        lowest = max(weight, 1) if empty_at_zero else weight
+        for w in range(capacity, lowest - 1, -1):
+            candidate = value + best[w - weight]
+            # Only a strict improvement takes the food, so ties keep the earlier foods
+            if candidate > best[w]:
+                best[w] = candidate
+                bits[w >> 3] |= 1 << (w & 7)
+        return bits
+
+    def choose(self, budget):
+        """The foods that make up ``best[budget]``, last food first"""
+        return [self.foods[i] for i in self.choose_indices(budget)]
+
+    def choose_indices(self, budget):
+        """Positions in ``foods`` of the foods that make up ``best[budget]``, last food first"""
+        chosen = []
+        w = budget
+        for i in range(len(self.foods) - 1, -1, -1):
+            if self._take[i][w >> 3] >> (w & 7) & 1:
+                chosen.append(i)
+                w -= self.foods[i].calories
+        return chosen
+
+    def first_budget_reaching(self, protein, start=0):
+        """The smallest budget from ``start`` up whose best protein is at least ``protein``, or None"""
+        for w in range(start, self.capacity + 1):
+            if self.best[w] >= protein:
+                return w
+        return None
+
+    def points(self, width):
+        """(budget, best protein) for budget 0 and each budget up to ``width`` where the best protein rises"""
+        best = self.best
+        points = [(0, int(best[0]))]
+        for w in range(1, width + 1):
+            if best[w] > best[w - 1]:
+                points.append((w, int(best[w])))
+        return points
+
+
+class NumpyKnapsackTable(KnapsackTable):
+    """``KnapsackTable`` with each food's row computed by NumPy array operations.
+
+    The update for one food is a shifted-array maximum: ``best[w - calories] + protein``
+    against ``best[w]`` for every budget at once. The take bits are packed in the same
+    layout as the pure-Python table, so ``choose()`` is shared.
+    """
+
+    @staticmethod
+    def empty_row(capacity):
+        return np.zeros(capacity + 1, dtype=np.int64)
+
+    @staticmethod
+    def add_row(best, food, capacity, empty_at_zero=True):
+        weight, value = food.calories, food.protein
+        row = np.zeros(capacity + 1, dtype=bool)
+        if weight <= capacity:
+            # candidate is a new array, so every comparison uses the row from before this food
+            candidate = best[:capacity + 1 - weight] + value
+            improved = candidate > best[weight:]
+            if weight == 0 and empty_at_zero:
+                improved[0] = False
+            best[weight:] = np.where(improved, candidate, best[weight:])
+            row[weight:] = improved
+        return np.packbits(row, bitorder='little')
+
+    def first_budget_reaching(self, protein, start=0):
+        budgets = np.flatnonzero(self.best[start:] >= protein)
+        return int(budgets[0]) + start if budgets.size else None
+
+
+KNAPSACK_BACKENDS = {'python': KnapsackTable}
+if np is not None:
+    KNAPSACK_BACKENDS['numpy'] = NumpyKnapsackTable
+
+
+def knapsack_backend(name='auto'):
+    """Return the table class for a backend name; 'auto' is NumPy when installed, else pure Python"""
+    if name == 'auto':
+        return KNAPSACK_BACKENDS.get('numpy', KnapsackTable)
+    if name == 'numpy' and 'numpy' not in KNAPSACK_BACKENDS:
+        raise ValueError("The 'numpy' recommender backend needs NumPy installed; use 'auto' or 'python'")
+    if name not in KNAPSACK_BACKENDS:
+        raise ValueError(f"Unknown recommender backend {name!r}; expected 'auto', 'python' or 'numpy'")
+    return KNAPSACK_BACKENDS[name]
+
+
+class ParetoRow:
+    """A read-only ``best`` row looked up from a Pareto list: the most protein within each budget"""
+
+    def __init__(self, pareto, capacity):
+        self._calories = [calories for calories, _ in pareto]
+        self._protein = [protein for _, protein in pareto]
+        self._capacity = capacity
+
+    def __len__(self):
+        return self._capacity + 1
+
+    def __getitem__(self, budget):
+        if not 0 <= budget <= self._capacity:
+            raise IndexError(budget)
+        return self._protein[bisect.bisect_right(self._calories, budget) - 1]
+
+
+class SubsetSearchTable:
+    """The same answers as ``KnapsackTable``, found from the Pareto-optimal subsets of a short list.
+
+    Foods are added one at a time to a list of the (calories, protein) totals no other subset
+    beats (Nemhauser-Ullmann), dropping anything over ``capacity``. For short lists that is
+    far fewer entries than budgets, so it beats a DP over every calorie value. The list after
+    each food is kept, which gives the DP's best protein for any budget over any prefix of the
+    foods, so ``choose()`` retraces exactly the foods the DP would take.
+
+    Only for foods that all have calories: the DP's empty budget 0 changes its answers when a
+    food has none.
+    """
+
+    def __init__(self, foods, capacity, empty_at_zero=True):
+        self.foods = list(foods)
+        self.capacity = capacity
+        self.empty_at_zero = empty_at_zero
+        if any(food.calories <= 0 for food in self.foods):
+            raise ValueError("SubsetSearchTable needs every food to have calories")
+        # _prefixes[i] is the Pareto list over the first i foods, by calories with protein rising
+        self._prefixes = [[(0, 0)]]
+        for food in self.foods:
+            current = self._prefixes[-1]
+            shifted = [(calories + food.calories, protein + food.protein) for calories, protein in current
+                       if calories + food.calories <= capacity]
+            merged = []
+            for calories, protein in sorted(current + shifted, key=lambda entry: (entry[0], -entry[1])):
+                if not merged or protein > merged[-1][1]:
+                    merged.append((calories, protein))
+            self._prefixes.append(merged)
+        self.best = ParetoRow(self._prefixes[-1], capacity)
+
+    def _best_of_prefix(self, count, budget):
+        """The DP's best protein within ``budget`` using only the first ``count`` foods"""
+        pareto = self._prefixes[count]
+        return pareto[bisect.bisect_right(pareto, (budget, math.inf)) - 1][1]
+
+    def choose(self, budget):
+        return [self.foods[i] for i in self.choose_indices(budget)]
+
+    def choose_indices(self, budget):
+        chosen = []
+        w = budget
+        for i in range(len(self.foods) - 1, -1, -1):
+            food = self.foods[i]
+            # The DP takes a food only where that strictly beats the foods before it
+            if food.calories <= w and \
+                    food.protein + self._best_of_prefix(i, w - food.calories) > self._best_of_prefix(i, w):
+                chosen.append(i)
+                w -= food.calories
+        return chosen
+
+    def first_budget_reaching(self, protein, start=0):
+        if start <= self.capacity and self.best[start] >= protein:
+            return start
+        for calories, total in self._prefixes[-1]:
+            if total >= protein and calories >= start:
+                return calories
+        return None
+
+    def points(self, width):
+        return [(calories, protein) for calories, protein in self._prefixes[-1] if calories <= width]
+
+
+# The most foods for which 'auto' uses SubsetSearchTable, by the DP backend it would use otherwise.
+# From benchmarks.bench_solver_selection: the subset search beat the NumPy DP up to 40 foods and
+# lost from 60, and beat the pure-Python DP up to 240 foods, at 500, 2,000 and 6,000 kcal alike.
+SUBSET_SEARCH_MAX_FOODS = {'numpy': 40, 'python': 200}
+
+
+def select_table_class(backend, foods, capacity):
+    """The table class for a frontier over ``foods``: the backend's DP, or a subset search for short lists.
+
+    'subset' asks for the subset search wherever it applies; 'auto' picks it for catalogs of up
+    to SUBSET_SEARCH_MAX_FOODS foods. The crossover barely moved with the budget in the
+    benchmark (both costs grow with it), so catalog size alone decides, except that a budget
+    of 0 calories always goes to the DP's single cell.
+    """
+    dp_class = knapsack_backend('auto' if backend == 'subset' else backend)
+    if backend == 'subset':
+        limit = len(foods)
+    elif backend == 'auto' and capacity > 0:
+        limit = SUBSET_SEARCH_MAX_FOODS['numpy' if dp_class is NumpyKnapsackTable else 'python']
+    else:
+        limit = -1
+    if len(foods) <= limit and all(food.calories > 0 for food in foods):
+        return SubsetSearchTable
+    return dp_class
+
+
+class CatalogState:
+    """A knapsack over a user's whole quick add list, kept between requests and updated as it changes.
+
+    The rows cover every food in catalog (id) order at ``capacity``, so:
+
+    - adding a food (which gets the highest id) is one more row update;
+    - a day's table, with the foods already eaten left out, replays only the rows from the
+      last checkpoint before the first eaten food (a copy of ``best`` is kept every
+      ``checkpoint_every`` rows); the rows before it are shared;
+    - removing a food leaves it out the same way until ``rebuild()`` drops its row.
+
+    Rows at budgets up to ``capacity`` don't depend on the capacity, so any narrower table
+    is a slice; a wider one grows the state. Tables come out exactly as ``KnapsackTable``
+    would build them for the same foods.
+    """
+
+    def __init__(self, foods, backend='auto', capacity=0, checkpoint_every=16):
+        self.table_class = knapsack_backend(backend)
+        self.checkpoint_every = checkpoint_every
+        self.removed = set()  # ids of removed foods whose rows are still in the table
+        self.version = 0  # bumped on every change, so a background rebuild can tell it is stale
+        self._lock = threading.Lock()
+        self._reset(list(foods), capacity)
+
+    def _reset(self, foods, capacity):
+        self.capacity = capacity
+        self.foods, self._best, self._take, self._checkpoints = self._rows(foods, capacity)
+
+    def _rows(self, foods, capacity):
+        """Rows built from scratch: (foods, best, take bits, checkpoints)"""
+        best = self.table_class.empty_row(capacity)
+        take, checkpoints = [], []
+        for i, food in enumerate(foods):
+            if i % self.checkpoint_every == 0:
+                checkpoints.append(best.copy())
+            take.append(self.table_class.add_row(best, food, capacity))
+        return list(foods), best, take, checkpoints
+
+    def _append(self, food):
+        if len(self.foods) % self.checkpoint_every == 0:
+            self._checkpoints.append(self._best.copy())
+        self._take.append(self.table_class.add_row(self._best, food, self.capacity))
+        self.foods.append(food)
+
+    def catalog(self):
+        """The foods this state currently stands for, in id order"""
+        return [food for food in self.foods if food.id not in self.removed]
+
+    def matches(self, foods):
+        return self.catalog() == list(foods)
+
+    def add(self, food):
+        """Add a newly created quick add food with one row update"""
+        with self._lock:
+            self._append(food)
+            self.version += 1
+
+    def remove(self, food_id):
+        """Leave a deleted quick add food out of every table until the next rebuild"""
+        with self._lock:
+            self.removed.add(food_id)
+            self.version += 1
+
+    def rebuild(self):
+        """Recompute the rows without removed foods. Safe to run in a background thread.
+
+        Returns False, keeping the current rows, if the state changed while rebuilding.
+        """
+        with self._lock:
+            version, foods, capacity = self.version, self.catalog(), self.capacity
+        rows = self._rows(foods, capacity)
+        with self._lock:
+            if self.version != version or self.capacity != capacity:
+                return False
+            self.foods, self._best, self._take, self._checkpoints = rows
+            self.removed = set()
+            return True
+
+    def shared_rows(self, foods):
+        """How many of ``foods`` (some of this catalog, in catalog order) a table over them takes from kept rows.
+
+        The foods after those are replayed row by row, so leaving any of them out costs nothing
+        more, while leaving out one before them would start the replay earlier.
+        """
+        with self._lock:
+            keep = {food.id for food in foods} - self.removed
+            skipped = [i for i, food in enumerate(self.foods) if food.id not in keep]
+            if not skipped:
+                return len(foods)
+            start = skipped[0] // self.checkpoint_every * self.checkpoint_every
+            shared = {food.id for food in self.foods[:start]}
+        return sum(1 for food in foods if food.id in shared)
+
+    def table(self, foods, capacity, empty_at_zero=True):
+        """A knapsack table over ``foods``, some of this catalog in catalog order, or None if they aren't.
+
+        Only tables that keep budget 0 empty (the exact frontier's) are kept in state.
+        """
+        if not empty_at_zero:
+            return None
+        foods = list(foods)
+        with self._lock:
+            if capacity > self.capacity:
+                # Grow by at least double, so a day of rising budgets rebuilds only a few times
+                self._reset(self.foods, max(capacity, 2 * self.capacity))
+            keep = {food.id for food in foods} - self.removed
+            skipped = [i for i, food in enumerate(self.foods) if food.id not in keep]
+            if [food for food in self.foods if food.id in keep] != foods:
+                return None
+            if not skipped:
+                # A copy, since later additions update self._best in place
+                best, take = self._best[:capacity + 1].copy(), list(self._take)
+            else:
+                start = skipped[0] // self.checkpoint_every * self.checkpoint_every
+                # Replayed rows only need the requested budgets
+                best = self._checkpoints[start // self.checkpoint_every][:capacity + 1].copy()
+                take = self._take[:start]
+                for i in range(start, len(self.foods)):
+                    if self.foods[i].id in keep:
+                        take.append(self.table_class.add_row(best, self.foods[i], capacity))
+        return self.table_class.from_rows(foods, capacity, best, take)
+
+
+def min_calories_for_protein(foods, protein):
+    """The fewest calories of any set of foods with at least ``protein`` protein, or None if none has.
+
+    A small DP indexed by protein (capped at the goal), so it costs ``len(foods) * protein``
+    steps, far fewer than a calorie-indexed table.
+    """
+    if protein <= 0:
+        return 0
+    unreachable = float('inf')
+    fewest = [0] + [unreachable] * protein
+    for food in foods:
+        if food.protein <= 0:
+            continue
+        for p in range(protein, food.protein, -1):
+            calories = fewest[p - food.protein] + food.calories
+            if calories < fewest[p]:
+                fewest[p] = calories
+        # The food alone covers every goal up to its own protein
+        for p in range(min(food.protein, protein), 0, -1):
+            if food.calories < fewest[p]:
+                fewest[p] = food.calories
+    return None if fewest[protein] == unreachable else fewest[protein]
+
+
+# prune_foods() reasons, in the order they're checked
+PRUNE_REASONS = ('over_budget', 'no_protein', 'duplicate', 'dominated')
+
+
+def prune_foods(foods, capacity, dominance=True, start=0):
+    """Which ``foods`` a knapsack table up to ``capacity`` needs: (kept indices, {reason: foods left out}).
+
+    Only foods that can't raise the best protein at any budget on top of the foods before
+    them are left out, so the table has the same rows and the same picks without them:
+
+        over_budget  more calories than the widest budget
+        no_protein   no protein, so taking it never beats leaving it out
+        duplicate    earlier foods with the same calories and protein, more than fit with it
+        dominated    earlier foods with no more calories and at least as much protein, more than fit with it
+
+    For the last two, any set with the food leaves out one of those earlier foods, which
+    could take its place for as much protein in no more calories. That needs the rows to be
+    the true best protein per budget, which the exact table's empty budget 0 isn't when a food
+    has 0 calories; ``dominance=False`` skips those checks then. The first ``start`` foods
+    are always kept, though they still count as earlier foods.
+    """
+    kept = []
+    pruned = dict.fromkeys(PRUNE_REASONS, 0)
+    earlier = []  # distinct (calories, protein) of the foods so far, by calories
+    total_calories = {}  # (calories, protein) -> calories of every food so far with them
+    for i, food in enumerate(foods):
+        pair = (food.calories, food.protein)
+        reason = None
+        if i < start:
+            pass
+        elif food.calories > capacity:
+            reason = 'over_budget'
+        elif food.protein <= 0:
+            reason = 'no_protein'
+        elif dominance:
+            room = capacity - food.calories
+            calories = 0
+            for other in earlier[:bisect.bisect_right(earlier, (food.calories, math.inf))]:
+                if other[1] >= food.protein:
+                    calories += total_calories[other]
+                    if calories > room:
+                        reason = 'duplicate' if pair in total_calories else 'dominated'
+                        break
+        if reason is None:
+            kept.append(i)
+        else:
+            pruned[reason] += 1
+        if pair not in total_calories:
+            bisect.insort(earlier, pair)
+            total_calories[pair] = 0
+        total_calories[pair] += food.calories
+    return kept, pruned
+
+
+class Frontier:
+    """The calorie/protein frontier for one day's foods and remaining goals, computed once for every mode.
+
+    The table only has to be wide enough for protein_first and closest. A cheap DP over
+    protein finds the fewest calories that meet the protein goal; protein_first is at that
+    budget or one above (the table keeps budget 0 empty, so a 0-calorie food can need one
+    spare calorie), and closest can't be further above the remaining calories than that
+    option misses them by. Budgets up to the width come out exactly as in a wider table,
+    so the picks match the separate tables the modes used to build.
+
+    With a ``granularity`` above 1 the table counts calories in buckets of that many kcal
+    (see the module docstring for the error bound), and every calorie figure on the frontier
+    is in buckets.
+
+    ``state`` is an optional ``CatalogState`` holding ``foods``' catalog, used for the table
+    instead of building one from scratch, whichever table class ``select_table_class()``
+    would pick: its rows are already filled, so even a short list gets its table sooner
+    from the state than from a subset search.
+
+    Foods the table doesn't need are left out first (``prune_foods()``); ``pruned`` counts
+    them by reason. With ``state``, only foods whose rows are replayed anyway are left out.
+    """
+
+    def __init__(self, foods, remaining_calories, remaining_protein, backend='auto', granularity=1, state=None):
+        self.foods = list(foods)
+        self.granularity = granularity
+        if granularity > 1:
+            # Rounding every food down keeps anything that fitted the budget still fitting, and
+            # costs at most granularity - 1 kcal per food. Without the original table's empty
+            # budget 0, foods that round to 0 buckets still count at the bottom of the table
+            table_foods = [food._replace(calories=food.calories // granularity) for food in self.foods]
+        else:
+            table_foods = self.foods
+        # protein_first only looks when the whole list covers the remaining calories
+        self.covers_remaining = remaining_calories <= sum(food.calories for food in self.foods)
+        self.remaining_calories = remaining_calories // granularity
+        self.remaining_protein = remaining_protein
+        self.protein_reachable, self.width = self._width(table_foods, self.remaining_calories, remaining_protein)
+        self.kept, self.pruned = prune_foods(
+            table_foods, self.width, dominance=granularity > 1 or all(food.calories > 0 for food in table_foods),
+            start=state.shared_rows(table_foods) if state and granularity == 1 else 0)
+        table_foods = [table_foods[i] for i in self.kept]
+        self.table = None
+        if state:
+            self.table = state.table(table_foods, self.width, empty_at_zero=granularity == 1)
+        if self.table is None:
+            table_class = select_table_class(backend, table_foods, self.width)
+            self.table = table_class(table_foods, self.width, empty_at_zero=granularity == 1)
+
+    @staticmethod
+    def _width(foods, remaining_calories, remaining_protein):
+        """Whether any foods meet the protein goal, and the budgets the table must cover"""
+        max_calories = sum(food.calories for food in foods)
+        goal_calories = min_calories_for_protein(foods, remaining_protein)
+        if goal_calories is not None:
+            width = remaining_calories + max(abs(goal_calories - remaining_calories),
+                                             abs(goal_calories + 1 - remaining_calories))
+        else:
+            # Nothing meets the protein goal. Eating nothing misses by 2 (all the calories and all
+            # the protein), and above the remaining calories an option misses by at least the extra
+            # calories plus the protein the whole list can't supply, which bounds how far to look
+            total_protein = sum(max(food.protein, 0) for food in foods)
+            protein_scale = max(remaining_protein, 1)
+            extra = -(-remaining_calories * (protein_scale + total_protein) // protein_scale)
+            width = remaining_calories + extra
+        return goal_calories is not None, max(remaining_calories, min(width, max_calories))
+
+    @classmethod
+    def estimate_cells(cls, foods, remaining_calories, remaining_protein):
+        """DP cells an exact frontier would fill, without building its table"""
+        foods = list(foods)
+        width = cls._width(foods, remaining_calories, remaining_protein)[1]
+        kept, _ = prune_foods(foods, width, dominance=all(food.calories > 0 for food in foods))
+        return len(kept) * (width + 1)
+
+    @property
+    def cells(self):
+        """DP cells filled for this frontier, for comparing solver work"""
+        return len(self.kept) * (self.width + 1)
+
+    def points(self):
+        """The frontier as (calories, protein) pairs: each budget where more calories buy more protein"""
+        return self.table.points(self.width)
+
+    def choose(self, budget):
+        """The original foods that make up the frontier at a budget, last food first"""
+        return [self.foods[self.kept[i]] for i in self.table.choose_indices(budget)]
+
+    def hit_both(self):
+        if self.table.best[self.remaining_calories] >= self.remaining_protein:
+            return self.choose(self.remaining_calories)
+        return None
+
+    def protein_first(self):
+        if not self.protein_reachable or not self.covers_remaining:
+            return None
+        calories = self.table.first_budget_reaching(self.remaining_protein, start=self.remaining_calories)
+        return None if calories is None else self.choose(calories)
+
+    def calorie_first(self):
+        return self.choose(self.remaining_calories)
+
+    def closest(self):
+        calorie_scale = max(self.remaining_calories, 1)
+        protein_scale = max(self.remaining_protein, 1)
+
+        def miss(point):
+            calories, protein = point
+            return (abs(calories - self.remaining_calories) / calorie_scale
+                    + max(0, self.remaining_protein - protein) / protein_scale)
+
+        # min() keeps the first of equal misses, i.e. the fewest calories
+        calories, _ = min(self.points(), key=miss)
+        return self.choose(calories)
+
+
+# Suggestion name -> Frontier method; the JSON response and dashboard use these names
+MODES = {
+    'hit_both': Frontier.hit_both,
+    'protein_first': Frontier.protein_first,
+    'calorie_first': Frontier.calorie_first,
+    'closest': Frontier.closest,
+}
+
+
+# Most foods x protein levels hit_both_feasible() runs its bitset DP for. In
+# benchmarks.bench_hit_both, with goals near the most protein that fits, it beat the
+# NumPy frontier table at 4,000 food-levels and lost at 19,000
+BITSET_MAX_STEPS = 10_000
+
+
+def hit_both_feasible(foods, remaining_calories, remaining_protein):
+    """False if no subset of ``foods`` has ``remaining_protein`` within ``remaining_calories``.
+
+    Cheap bounds answer the clear no's first: all the protein that fits, then the
+    fractional knapsack bound. The rest goes to a bitset DP with one Python int per protein
+    level (capped at the goal), whose bit c is set when some subset at that level has
+    exactly c calories; adding a food is a shift and an or per level. Levels that can't
+    reach the goal with the protein still to come are dropped, and the DP stops as soon as
+    the goal is hit. Past BITSET_MAX_STEPS food-levels the DP is skipped (returning True),
+    since there the frontier table is quicker.
+
+    True doesn't promise a hit_both suggestion: the table keeps budget 0 empty, which
+    can cost it combinations with 0-calorie foods. It only rules hit_both out.
+    """
+    if remaining_protein <= 0:
+        return True
+    # Most protein first, so the protein still to come shrinks and low levels drop out early
+    fitting = sorted((food for food in foods if food.calories <= remaining_calories and food.protein > 0),
+                     key=lambda food: food.protein, reverse=True)
+    still_to_come = sum(food.protein for food in fitting)
+    if still_to_come < remaining_protein or fractional_bound(fitting, remaining_calories) < remaining_protein:
+        return False
+    if len(fitting) * remaining_protein > BITSET_MAX_STEPS:
+        return True
+    mask = (1 << (remaining_calories + 1)) - 1
+    levels = [0] * (remaining_protein + 1)  # protein (capped at the goal) -> bitset of calorie totals
+    levels[0] = 1
+    for food in fitting:
+        still_to_come -= food.protein
+        # Downwards, so each food moves a subset up at most once
+        for protein in range(remaining_protein, -1, -1):
+            if levels[protein]:
+                target = min(protein + food.protein, remaining_protein)
+                levels[target] |= (levels[protein] << food.calories) & mask
+                if protein + still_to_come < remaining_protein:
+                    levels[protein] = 0
+        if levels[remaining_protein]:
+            return True
+    return False
+
+
+def recommend(foods, remaining_calories, remaining_protein, backend='auto', modes=None, granularity=1, state=None,
+              max_servings=None, pruned=None):
+    """Return the food list for each mode (None where a mode has no match), from a single frontier.
+
+    With ``max_servings``, each food can be suggested in half servings up to that many (see
+    ``split_servings()``), and suggested foods carry their ``servings``. ``hit_both_feasible()``
+    turns down impossible hit_both goals first: that mode is then None without a reconstruction,
+    and when it's the only mode asked for no table is built at all.
+    ``pruned``, if given, is a dict updated with the frontier's ``pruned`` counts.
+    """
+    modes = list(modes or MODES)
+    portions = None if max_servings is None else \
+        [portion for food in foods for portion in split_servings(food, max_servings)]
+    results = {}
+    if 'hit_both' in modes and not hit_both_feasible(
+            [food._replace(calories=food.calories // granularity) for food in portions or foods],
+            remaining_calories // granularity, remaining_protein):
+        results['hit_both'] = None
+    solved = [mode for mode in modes if mode not in results]
+    if not solved:
+        return results
+    if portions is not None:
+        frontier = Frontier(portions, remaining_calories, remaining_protein, backend=backend, granularity=granularity)
+        results.update((mode, merge_servings(foods, MODES[mode](frontier))) for mode in solved)
+    else:
+        frontier = Frontier(foods, remaining_calories, remaining_protein, backend=backend, granularity=granularity,
+                            state=state)
+        results.update((mode, MODES[mode](frontier)) for mode in solved)
+    if pruned is not None:
+        pruned.update(frontier.pruned)
+    return {mode: results[mode] for mode in modes}
+
+
+def _by_ratio(foods):
+    """Foods from most to least protein per calorie (free protein first), keeping list order on ties"""
+    def ratio(food):
+        if food.calories > 0:
+            return food.protein / food.calories
+        return math.inf if food.protein > 0 else 0
+    return sorted(foods, key=ratio, reverse=True)
+
+
+def greedy_recommend(foods, remaining_calories, remaining_protein, modes=None):
+    """Instant suggestions for each mode from foods taken in protein-per-calorie order.
+
+    Not always the best, but each one keeps to its mode's rules: hit_both and calorie_first fit
+    in the remaining calories, and protein_first meets the protein goal.
+    """
+    foods = list(foods)
+    ranked = _by_ratio(foods)
+
+    fitted, calories = [], 0
+    for food in ranked:
+        if calories + food.calories <= remaining_calories:
+            fitted.append(food)
+            calories += food.calories
+
+    # Taking foods in order until the protein goal is met, past the calories if need be
+    prefixes, protein = [[]], 0
+    for food in ranked:
+        if protein >= remaining_protein:
+            break
+        prefixes.append(prefixes[-1] + [food])
+        protein += food.protein
+
+    def totals(chosen):
+        return sum(food.calories for food in chosen), sum(food.protein for food in chosen)
+
+    def miss(chosen):
+        calories, protein = totals(chosen)
+        return (abs(calories - remaining_calories) / max(remaining_calories, 1)
+                + max(0, remaining_protein - protein) / max(remaining_protein, 1))
+
+    covers_remaining = remaining_calories <= sum(food.calories for food in foods)
+    results = {
+        'hit_both': fitted if totals(fitted)[1] >= remaining_protein else None,
+        'protein_first': prefixes[-1] if protein >= remaining_protein and covers_remaining else None,
+        'calorie_first': fitted,
+        'closest': min([fitted] + prefixes, key=miss),
+    }
+    return {mode: results[mode] for mode in (modes or MODES)}
+
+
+def fractional_bound(foods, capacity):
+    """An upper bound on the protein any foods fitting in ``capacity`` calories can have.
+
+    The greedy fill, plus the fitting fraction of the first food that doesn't fit (the
+    fractional knapsack optimum).
+    """
+    protein = 0
+    for food in _by_ratio(foods):
+        if food.protein <= 0:
+            break
+        if food.calories <= capacity:
+            capacity -= food.calories
+            protein += food.protein
+        else:
+            return protein + food.protein * capacity / food.calories
+    return protein
+
+
+class Solve(NamedTuple):
+    """How ``anytime_recommend()`` arrived at its answer"""
+    method: str  # 'exact', 'approximate' or 'greedy'
+    exact: bool
+    granularity: int  # calorie bucket of the approximate frontier; 1 when exact
+    solve_ms: float
+    gap: float  # share of the calorie_first protein bound the answer may fall short by; 0 when exact
+    pruned: int = 0  # foods (or serving items) prune_foods() left out of the table
+    buckets: tuple = ()  # (calories, carbs, fat) bucket sizes of a solve with macro limits, None where unlimited
+
+
+def anytime_recommend(foods, remaining_calories, remaining_protein, deadline_ms, backend='auto', modes=None,
+                      state=None, max_servings=None, clock=time.perf_counter):
+    """``recommend()`` within about ``deadline_ms``, returning (suggestions, Solve).
+
+    A greedy answer comes first. If the exact frontier's estimated time fits what is left of the
+    deadline it replaces the greedy one; otherwise an approximate frontier with the smallest
+    calorie bucket that fits does (see ``choose_granularity()``). If even the coarsest bucket
+    wouldn't fit, the greedy answer is returned as best-effort.
+    """
+    start = clock()
+    foods = list(foods)
+    items = ([portion for food in foods for portion in split_servings(food, max_servings)]
+             if max_servings is not None else foods)
+    results = greedy_recommend(items, remaining_calories, remaining_protein, modes)
+    if max_servings is not None:
+        results = {mode: merge_servings(foods, chosen) for mode, chosen in results.items()}
+    method, granularity = 'greedy', 1
+
+    left_ms = deadline_ms - (clock() - start) * 1000
+    exact_ms = Frontier.estimate_cells(items, remaining_calories, remaining_protein) * seconds_per_cell(backend) * 1000
+    if exact_ms <= left_ms:
+        method = 'exact'
+    elif left_ms > 0 and exact_ms / MAX_GRANULARITY <= left_ms:
+        method, granularity = 'approximate', math.ceil(exact_ms / left_ms)
+    pruned = {}
+    if method != 'greedy':
+        results = recommend(foods, remaining_calories, remaining_protein, backend=backend, modes=modes,
+                            granularity=granularity, state=state, max_servings=max_servings, pruned=pruned)
+
+    gap = 0.0
+    if method != 'exact':
+        bound = fractional_bound(items, remaining_calories)
+        chosen = results.get('calorie_first') or []
+        if bound > 0:
+            gap = max(0.0, bound - sum(food.protein for food in chosen)) / bound
+    return results, Solve(method, method == 'exact', granularity, (clock() - start) * 1000, gap,
+                          sum(pruned.values()))
+
+
+# Multi-serving suggestions come in steps of this many servings
+SERVING_STEP = 0.5
+
+
+def split_servings(food, max_servings, step=SERVING_STEP):
+    """Split up to ``max_servings`` of a food into 0/1 knapsack items of 1, 2, 4, ... steps and a remainder.
+
+    Every count of steps up to the maximum is a sum of some of the items, so the bounded
+    knapsack becomes a 0/1 knapsack with about log2(max_servings / step) items per food instead
+    of one per step. Each item rounds its calories (and carbs and fat) up and its protein down,
+    so the servings picked are never more calories or less protein than the knapsack counted
+    (the same rounding ``log_food`` applies to the total).
+    """
+    steps = int(round(max_servings / step))
+    items = []
+    size = 1
+    while steps > 0:
+        size = min(size, steps)
+        servings = size * step
+        items.append(food._replace(calories=math.ceil(food.calories * servings),
+                                   protein=math.floor(food.protein * servings), servings=servings,
+                                   carbs=math.ceil(food.carbs * servings), fat=math.ceil(food.fat * servings)))
+        steps -= size
+        size *= 2
+    return items
+
+
+def merge_servings(foods, portions):
+    """Combine the items ``split_servings()`` made back into one entry per food, in the order picked.
+
+    Calories, protein, carbs and fat are for the total servings, rounded down as ``log_food`` logs them.
+    """
+    if portions is None:
+        return None
+    by_id = {food.id: food for food in foods}
+    servings = {}
+    for portion in portions:
+        servings[portion.id] = servings.get(portion.id, 0) + portion.servings
+    merged = []
+    for food_id, count in servings.items():
+        food = by_id[food_id]
+        merged.append(food._replace(calories=int(food.calories * count), protein=int(food.protein * count),
+                                    servings=count, carbs=int(food.carbs * count), fat=int(food.fat * count)))
+    return merged
+
+
+class KBestTable:
+    """The ``k`` most-protein distinct sets of foods for every exact calorie total up to ``capacity``.
+
+    A 0/1 knapsack DP over one rolling row whose cells are lists of at most ``k`` sets, most
+    protein first, instead of a single best. Adding a food merges each cell with the sets
+    ``food.calories`` below plus the food, keeping the top ``k``. Sets are linked lists of
+    (food index, rest of the set), shared between cells, so memory stays at about
+    ``k * (capacity + 1)`` sets whatever the number of foods.
+
+    Foods that are identical apart from their id make the same set; only one of those is
+    kept, so every set in a cell looks different.
+    """
+
+    def __init__(self, foods, capacity, k):
+        if k < 1:
+            raise ValueError(f"k must be at least 1, not {k}")
+        self.foods = list(foods)
+        self.capacity = capacity
+        self.k = k
+        kinds = {}
+        for food in self.foods:
+            kinds.setdefault(food[1:], len(kinds))
+        # Only repeated foods can make the same set twice. Adding foods kind by kind keeps each
+        # set's kinds in order, so the kinds tuple identifies the set
+        dedupe = len(kinds) < len(self.foods)
+        order = sorted(range(len(self.foods)), key=lambda i: kinds[self.foods[i][1:]])
+        # cells[c]: (protein, kinds or None, linked set) for the best sets of exactly c calories
+        cells = [None] * (capacity + 1)
+        cells[0] = [(0, () if dedupe else None, None)]
+        for i in order:
+            food = self.foods[i]
+            calories, protein = food.calories, food.protein
+            if calories > capacity:
+                continue
+            kind = kinds[food[1:]]
+            for w in range(capacity, calories - 1, -1):
+                below = cells[w - calories]
+                if below is None:
+                    continue
+                current = cells[w]
+                if current is None:
+                    cells[w] = [(total + protein, key + (kind,) if dedupe else None, (i, chosen))
+                                for total, key, chosen in below]
+                    continue
+                if len(current) == k and below[0][0] + protein <= current[-1][0]:
+                    continue  # nothing with this food beats the cell's worst
+                merged = []
+                seen = set()
+                a = b = 0
+                while len(merged) < k and (a < len(current) or b < len(below)):
+                    if b == len(below) or (a < len(current) and current[a][0] >= below[b][0] + protein):
+                        entry = current[a]
+                        a += 1
+                    else:
+                        total, key, chosen = below[b]
+                        b += 1
+                        entry = (total + protein, key + (kind,) if dedupe else None, (i, chosen))
+                    if dedupe:
+                        if entry[1] in seen:
+                            continue
+                        seen.add(entry[1])
+                    merged.append(entry)
+                cells[w] = merged
+        self.cells = cells
+
+    def sets(self):
+        """Every set kept, as (calories, protein, food indices last food first), by calories"""
+        for calories, cell in enumerate(self.cells):
+            for protein, _, chosen in cell or ():
+                indices = []
+                while chosen is not None:
+                    i, chosen = chosen
+                    indices.append(i)
+                yield calories, protein, indices
+
+
+def top_k_recommend(foods, remaining_calories, remaining_protein, k, modes=None, max_servings=None):
+    """Up to ``k`` distinct food lists for each mode, best first, from one ``KBestTable``.
+
+    Each mode ranks the sets as it picks its one suggestion: hit_both and calorie_first by
+    protein within the remaining calories (hit_both only those meeting the protein goal),
+    protein_first by the budget needed to meet the protein goal, then protein, and closest by
+    its miss on both goals, then calories. Sets up to the frontier's width are considered
+    (see ``Frontier``), so a mode can have fewer than ``k``. The first list can differ from
+    ``recommend()``'s where sets tie, or the exact table's empty budget 0 hides a set.
+
+    With ``max_servings``, ``split_servings()`` can make the same servings of a food from
+    different items (1.5 servings, or 0.5 and 1), so suggestions are told apart by the
+    servings of each food once merged, keeping the best-ranked of each. Those copies can take
+    up a cell's ``k`` places, so when a mode comes up short after dropping them the table is
+    built again with twice the room.
+    """
+    foods = list(foods)
+    items = foods if max_servings is None else \
+        [portion for food in foods for portion in split_servings(food, max_servings)]
+    _, width = Frontier._width(items, remaining_calories, remaining_protein)
+    covers_remaining = remaining_calories <= sum(item.calories for item in items)
+    calorie_scale = max(remaining_calories, 1)
+    protein_scale = max(remaining_protein, 1)
+
+    def miss(calories, protein):
+        return (abs(calories - remaining_calories) / calorie_scale
+                + max(0, remaining_protein - protein) / protein_scale)
+
+    # mode -> (whether a set qualifies, its rank; lower is better)
+    rankings = {
+        'hit_both': (lambda calories, protein: calories <= remaining_calories and protein >= remaining_protein,
+                     lambda calories, protein: (-protein, calories)),
+        'protein_first': (lambda calories, protein: covers_remaining and protein >= remaining_protein,
+                          lambda calories, protein: (max(calories, remaining_calories), -protein, calories)),
+        'calorie_first': (lambda calories, protein: calories <= remaining_calories,
+                          lambda calories, protein: (-protein, calories)),
+        'closest': (lambda calories, protein: True,
+                    lambda calories, protein: (miss(calories, protein), calories, -protein)),
+    }
+    table_k = k
+    while True:
+        table = KBestTable(items, width, table_k)
+        candidates = [entry for entry in table.sets() if entry[2]]  # leave out eating nothing
+        results = {}
+        short = False
+        for mode in (modes or MODES):
+            qualifies, rank = rankings[mode]
+            ranked = (entry for entry in candidates if qualifies(entry[0], entry[1]))
+            if max_servings is None:
+                best = heapq.nsmallest(k, ranked, key=lambda entry: rank(entry[0], entry[1]))
+                results[mode] = [[items[i] for i in indices] for _, _, indices in best]
+                continue
+            chosen, seen, repeated = [], set(), False
+            for _, _, indices in sorted(ranked, key=lambda entry: rank(entry[0], entry[1])):
+                merged = merge_servings(foods, [items[i] for i in indices])
+                key = frozenset((food.id, food.servings) for food in merged)
+                if key in seen:
+                    repeated = True
+                    continue
+                seen.add(key)
+                chosen.append(merged)
+                if len(chosen) == k:
+                    break
+            results[mode] = chosen
+            short = short or (repeated and len(chosen) < k)
+        if not short or not any(cell is not None and len(cell) == table_k for cell in table.cells):
+            return results
+        table_k *= 2
+
+
+# The limits MacroTable holds a suggestion to, in the order of its dimensions
+MACRO_LIMITS = ('calories', 'carbs', 'fat')
+
+
+class MacroTable:
+    """The most protein within every (calories, carbs, fat) budget up to ``shape``, for 0/1 picks of foods.
+
+    The calorie knapsack with two more weights. ``weights`` are each food's (calories, carbs,
+    fat) in the table's units (``macro_recommend()`` passes them in buckets); a dimension of
+    size 1 is one the foods don't count against. The cells are kept flat, in C order, so a
+    food moves a budget down by one fixed offset and the DP is the 1-D one, except that a
+    cell only takes a food when every coordinate has room for it. Take bits are packed as in
+    ``KnapsackTable``, one per food and cell.
+    """
+
+    # Cells filled per millisecond, a round figure below bench_macro_solver's, from which
+    # macro_buckets() sizes the table: fixed so that buckets depend on the request, not on load
+    cells_per_ms = 10_000
+
+    def __init__(self, foods, weights, shape):
+        self.foods = list(foods)
+        self.weights = list(weights)
+        self.shape = tuple(shape)
+        self.strides = (shape[1] * shape[2], shape[2], 1)
+        self.cells = shape[0] * shape[1] * shape[2]
+        self.best, self._take = self._build()
+
+    def offset(self, weight):
+        return sum(w * stride for w, stride in zip(weight, self.strides))
+
+    def _build(self):
+        best = [0] * self.cells
+        take = []
+        n0, n1, n2 = self.shape
+        for food, (a, b, c) in zip(self.foods, self.weights):
+            value, offset = food.protein, self.offset((a, b, c))
+            bits = bytearray((self.cells >> 3) + 1)
+            # Highest cell first, so the cell a food is added to still holds the row before it
+            for i in range(n0 - 1, a - 1, -1):
+                for j in range(n1 - 1, b - 1, -1):
+                    base = i * self.strides[0] + j * self.strides[1]
+                    for w in range(base + n2 - 1, base + c - 1, -1):
+                        candidate = value + best[w - offset]
+                        # Only a strict improvement takes the food, so ties keep the earlier foods
+                        if candidate > best[w]:
+                            best[w] = candidate
+                            bits[w >> 3] |= 1 << (w & 7)
+            take.append(bits)
+        return best, take
+
+    def cell(self, budget):
+        """The flat index of a (calories, carbs, fat) budget"""
+        return self.offset(budget)
+
+    def choose(self, budget):
+        """The foods that make up the best protein within ``budget``, last food first"""
+        chosen = []
+        w = self.cell(budget)
+        for i in range(len(self.foods) - 1, -1, -1):
+            if self._take[i][w >> 3] >> (w & 7) & 1:
+                chosen.append(self.foods[i])
+                w -= self.offset(self.weights[i])
+        return chosen
+
+
+class NumpyMacroTable(MacroTable):
+    """``MacroTable`` with each food's update done on the 3-D array at once, like ``NumpyKnapsackTable``"""
+
+    cells_per_ms = 200_000
+
+    def _build(self):
+        best = np.zeros(self.shape, dtype=np.int64)
+        take = []
+        n0, n1, n2 = self.shape
+        for food, (a, b, c) in zip(self.foods, self.weights):
+            row = np.zeros(self.shape, dtype=bool)
+            # candidate is a new array, so every comparison uses the table from before this food
+            candidate = best[:n0 - a, :n1 - b, :n2 - c] + food.protein
+            improved = candidate > best[a:, b:, c:]
+            best[a:, b:, c:] = np.where(improved, candidate, best[a:, b:, c:])
+            row[a:, b:, c:] = improved
+            take.append(np.packbits(row.ravel(), bitorder='little'))
+        return best.ravel(), take
+
+
+def macro_table_class(backend='auto'):
+    """The MacroTable class for a knapsack backend name (see ``knapsack_backend()``)"""
+    return NumpyMacroTable if knapsack_backend(backend) is NumpyKnapsackTable else MacroTable
+
+
+# Cells MacroTable may use per food whatever the latency budget, which bounds its take bits
+MACRO_MAX_CELLS = 1_000_000
+
+# Coarsest bucket per limit (kcal, g carbs, g fat), however tight the latency budget; calories
+# stop where choose_granularity() does at MAX_GRANULARITY
+MACRO_MAX_BUCKETS = (50, 10, 5)
+
+
+def macro_buckets(limits, foods, cells_per_ms, latency_budget_ms):
+    """Bucket sizes, one per limit (None for a limit not set), whose table fits the latency budget.
+
+    The budget is a cap on cells, foods x calories x carbs x fat, at ``cells_per_ms`` (a table
+    class's ``cells_per_ms``), so the same request always gets the same buckets. All 1 when the
+    exact table fits. Otherwise the dimension with the most buckets is coarsened first, about
+    10% at a time, so no limit is counted much more finely than the others. No bucket grows past
+    its ``MACRO_MAX_BUCKETS``; once every one is there, the table is built over the budget.
+    """
+    max_cells = min(MACRO_MAX_CELLS, latency_budget_ms * cells_per_ms / max(len(foods), 1))
+    buckets = [1 if limit is not None else None for limit in limits]
+
+    def sizes():
+        return [limit // bucket + 1 if limit is not None else 1 for limit, bucket in zip(limits, buckets)]
+
+    while math.prod(sizes()) > max_cells:
+        coarsenable = [i for i, limit in enumerate(limits)
+                       if limit is not None and buckets[i] < MACRO_MAX_BUCKETS[i] and sizes()[i] > 1]
+        if not coarsenable:
+            break
+        i = max(coarsenable, key=lambda i: sizes()[i])
+        buckets[i] = min(MACRO_MAX_BUCKETS[i], max(buckets[i] + 1, math.ceil(buckets[i] * 1.1)))
+    return tuple(buckets)
+
+
+def within_limits(foods, limits):
+    """Whether the foods' total calories, carbs and fat keep to ``limits`` (None is no limit)"""
+    return all(limit is None or sum(getattr(food, name) for food in foods) <= limit
+               for name, limit in zip(MACRO_LIMITS, limits))
+
+
+MACRO_MODES = ('hit_both', 'calorie_first')
+
+
+def macro_recommend(foods, remaining_calories, remaining_protein, remaining_carbs=None, remaining_fat=None,
+                    backend='auto', buckets=None, latency_budget_ms=50):
+    """hit_both and calorie_first held to the remaining carbs and fat as well as calories; returns
+    (suggestions, buckets).
+
+    Either macro limit may be None (not limited). Each limit is counted in buckets of its
+    ``buckets`` size, chosen by ``macro_buckets()`` for ``latency_budget_ms`` unless given.
+    Foods are rounded up to whole buckets, so a suggestion never goes over a limit; what
+    bucketing costs is protein, as up to a bucket less 1 of each limit goes unused per food.
+    With every bucket 1 the suggestions are exact. The suggestion is checked against the
+    real totals before it's offered. protein_first and closest look past the remaining
+    calories, which this table doesn't cover, so they aren't offered.
+    """
+    limits = (remaining_calories, remaining_carbs, remaining_fat)
+    table_class = macro_table_class(backend)
+    if buckets is None:
+        # Foods with no protein never help, and a food over any limit on its own can't be in a suggestion
+        candidates = [food for food in foods if food.protein > 0 and within_limits([food], limits)]
+        buckets = macro_buckets(limits, candidates, table_class.cells_per_ms, latency_budget_ms)
+    shape = [limit // bucket + 1 if limit is not None else 1 for limit, bucket in zip(limits, buckets)]
+    fitting, weights = [], []
+    for food in foods:
+        weight = tuple(-(-getattr(food, name) // bucket) if bucket is not None else 0
+                       for name, bucket in zip(MACRO_LIMITS, buckets))
+        if food.protein > 0 and all(w < size for w, size in zip(weight, shape)):
+            fitting.append(food)
+            weights.append(weight)
+    table = table_class(fitting, weights, shape)
+    chosen = table.choose([size - 1 for size in shape])
+    # Rounding up already keeps to the limits; this only guards the table against a slip
+    while not within_limits(chosen, limits):
+        chosen.remove(min(chosen, key=lambda food: food.protein))
+    hit_both = chosen if sum(food.protein for food in chosen) >= remaining_protein else None
+    return {'hit_both': hit_both, 'calorie_first': chosen}, tuple(buckets)
+
+
+def solve(foods, remaining_calories, remaining_protein, backend='auto', approximate=False, granularity=0,
+          max_servings=None, deadline_ms=None, latency_budget_ms=50, state=None, k=1,
+          remaining_carbs=None, remaining_fat=None):
+    """Run the solver a request's options ask for, returning (suggestions, Solve).
+
+    With a carb or fat limit, ``macro_recommend()`` answers within ``deadline_ms`` (or else
+    ``latency_budget_ms``), and ``k``, ``approximate`` and ``granularity`` don't apply.
+    A ``k`` above 1 uses ``top_k_recommend()``, whose suggestions are lists of up to ``k``
+    alternatives, always exact. Otherwise ``deadline_ms`` uses ``anytime_recommend()``, or the
+    answer is exact, or approximate with ``granularity`` (0 picks one for ``latency_budget_ms``).
+    A module-level function, so it can run in a worker process.
+    """
+    start = time.perf_counter()
+    if remaining_carbs is not None or remaining_fat is not None:
+        items = ([portion for food in foods for portion in split_servings(food, max_servings)]
+                 if max_servings is not None else foods)
+        results, buckets = macro_recommend(items, remaining_calories, remaining_protein, remaining_carbs,
+                                           remaining_fat, backend=backend,
+                                           latency_budget_ms=deadline_ms or latency_budget_ms)
+        if max_servings is not None:
+            results = {mode: merge_servings(foods, chosen) for mode, chosen in results.items()}
+        exact = all(bucket in (1, None) for bucket in buckets)
+        return results, Solve('exact' if exact else 'approximate', exact, buckets[0],
+                              (time.perf_counter() - start) * 1000, 0.0, buckets=buckets)
+    if k > 1:
+        results = top_k_recommend(foods, remaining_calories, remaining_protein, k, max_servings=max_servings)
+        return results, Solve('exact', True, 1, (time.perf_counter() - start) * 1000, 0.0)
+    if deadline_ms is not None:
+        return anytime_recommend(foods, remaining_calories, remaining_protein, deadline_ms, backend=backend,
+                                 state=state, max_servings=max_servings)
+    if not approximate:
+        granularity = 1
+    elif not granularity:
+        granularity = choose_granularity(foods, remaining_calories, remaining_protein, latency_budget_ms,
+                                         backend=backend)
+    pruned = {}
+    results = recommend(foods, remaining_calories, remaining_protein, backend=backend, granularity=granularity,
+                        state=state, max_servings=max_servings, pruned=pruned)
+    # Only the anytime solver measures how far a non-exact answer may be from the best
+    return results, Solve('exact' if granularity == 1 else 'approximate', granularity == 1, granularity,
+                          (time.perf_counter() - start) * 1000, 0.0, sum(pruned.values()))
+
+
+# Coarsest bucket choose_granularity() will use, however tight the latency budget
+MAX_GRANULARITY = 50
+
+
+@lru_cache(maxsize=None)
+def seconds_per_cell(backend='auto'):
+    """Measured cost of one DP cell on a backend, timed once per process on a mid-sized table"""
+    table_class = knapsack_backend(backend)
+    foods = [Food(i, '', 37 + 53 * i % 400, i % 40) for i in range(30)]
+    start = time.perf_counter()
+    table_class(foods, 2000)
+    return (time.perf_counter() - start) / (len(foods) * 2001)
+
+
+def choose_granularity(foods, remaining_calories, remaining_protein, latency_budget_ms,
+                       backend='auto', cell_seconds=None):
+    """The smallest bucket size (in kcal, up to MAX_GRANULARITY) whose DP should fit the latency budget.
+
+    1 means the exact frontier already fits. ``cell_seconds`` defaults to ``seconds_per_cell(backend)``.
+    """
+    if cell_seconds is None:
+        cell_seconds = seconds_per_cell(backend)
+    exact_ms = Frontier.estimate_cells(foods, remaining_calories, remaining_protein) * cell_seconds * 1000
+    if exact_ms <= latency_budget_ms:
+        return 1
+    return min(MAX_GRANULARITY, math.ceil(exact_ms / max(latency_budget_ms, 1e-9)))
+
+
+def reference_recommend(foods, remaining_calories, remaining_protein):
+    """The original full-table implementation of ``recommend()``.
+
+    Kept to check faster solvers against in tests and benchmarks; the app doesn't call it.
+    """
+    foods = list(foods)
+
+    def knapsack(n, W, wt, val):
+        K = [[0 for _ in range(W + 1)] for _ in range(n + 1)]
+        for i in range(n + 1):
+            for w in range(W + 1):
+                if i == 0 or w == 0:
+                    K[i][w] = 0
+                elif wt[i-1] <= w:
+                    K[i][w] = max(val[i-1] + K[i-1][w-wt[i-1]], K[i-1][w])
+                else:
+                    K[i][w] = K[i-1][w]
+        return K
+
+    def backtrack(K, wt, val, n, W):
+        res = []
+        w = W
+        for i in range(n, 0, -1):
+            if K[i][w] != K[i-1][w]:
+                res.append(foods[i-1])
+                w -= wt[i-1]
+        return res
+
+    weights = [food.calories for food in foods]
+    values = [food.protein for food in foods]
+    n = len(foods)
+
+    hit_both = None
+    prioritize_protein = None
+
+    K = knapsack(n, remaining_calories, weights, values)
+    if K[n][remaining_calories] >= remaining_protein:
+        hit_both = backtrack(K, weights, values, n, remaining_calories)
+
+    max_calories = sum(weights)
+    K = knapsack(n, max_calories, weights, values)
+    for cal in range(remaining_calories, max_calories + 1):
+        if K[n][cal] >= remaining_protein:
+            prioritize_protein = backtrack(K, weights, values, n, cal)
+            break
+
+    K = knapsack(n, remaining_calories, weights, values)
+    prioritize_calories = backtrack(K, weights, values, n, remaining_calories)
+
+    return {
+        "hit_both": hit_both,
+        "protein_first": prioritize_protein,
+        "calorie_first": prioritize_calories
+    }
@@ -0,0 +1,107 @@
+"""Per-user recommendation solver state, kept between requests.
+
+Each user's quick add list is held as a ``recommender.CatalogState``, the knapsack
+rows over every food, so a recommendation only replays the rows after the first
+food eaten today instead of building the whole table. ``quick_add_food`` adds a
+row; ``remove_quick_add_food`` leaves the food out and rebuilds the rows on a
+background thread. A state is checked against the catalog read for the request
+and rebuilt if they differ (for example after a change made by another process).
+"""
+import logging
+import threading
+from collections import OrderedDict
+
+from recommender import CatalogState
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_USERS = 64
+
+
+class SolverStates:
+    """An LRU of per-user ``CatalogState``s, at most ``max_users`` at a time"""
+
+    def __init__(self, backend='auto', max_users=DEFAULT_MAX_USERS):
+        self.backend = backend
+        self.max_users = max_users
+        self._states = OrderedDict()  # user_id -> CatalogState, least recently used first
+        self._lock = threading.Lock()
+        self._rebuilds = set()  # background rebuild threads still running
+        self._hits = 0
+        self._builds = 0
+        self._rows_added = 0
+        self._removals = 0
+        self._background_rebuilds = 0
+
+    def get(self, user_id, foods):
+        """The state for a user's catalog ``foods`` (in id order), built if missing or out of date"""
+        if self.max_users <= 0:
+            return None
+        with self._lock:
+            state = self._states.get(user_id)
+            if state is not None and state.matches(foods):
+                self._states.move_to_end(user_id)
+                self._hits += 1
+                return state
+        state = CatalogState(foods, backend=self.backend)
+        with self._lock:
+            self._states[user_id] = state
+            self._states.move_to_end(user_id)
+            while len(self._states) > self.max_users:
+                self._states.popitem(last=False)
+            self._builds += 1
+        return state
+
+    def add_food(self, user_id, food):
+        """Append a new quick add food to the user's state, if they have one"""
+        with self._lock:
+            state = self._states.get(user_id)
+        if state is not None:
+            state.add(food)
+            with self._lock:
+                self._rows_added += 1
+
+    def remove_food(self, user_id, food_id):
+        """Leave a deleted food out of the user's state and rebuild it in the background"""
+        with self._lock:
+            state = self._states.get(user_id)
+        if state is None:
+            return
+        state.remove(food_id)
+        thread = threading.Thread(target=self._rebuild, args=(state,), name='solver-rebuild', daemon=True)
+        with self._lock:
+            self._removals += 1
+            self._rebuilds.add(thread)
+        thread.start()
+
+    def _rebuild(self, state):
+        try:
+            if state.rebuild():
+                with self._lock:
+                    self._background_rebuilds += 1
+        except Exception:
+            # The state still serves correct tables with the food left out
+            logger.exception("Background solver rebuild failed")
+        finally:
+            with self._lock:
+                self._rebuilds.discard(threading.current_thread())
+
+    def wait(self, timeout=None):
+        """Wait for background rebuilds started so far to finish"""
+        with self._lock:
+            threads = list(self._rebuilds)
+        for thread in threads:
+            thread.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'users': len(self._states),
+                'max_users': self.max_users,
+                'hits': self._hits,
+                'builds': self._builds,
+                'rows_added': self._rows_added,
+                'removals': self._removals,
+                'background_rebuilds': self._background_rebuilds,
+                'rebuilds_running': len(self._rebuilds),
+            }
@@ -212,6 +212,8 @@ function updateTodaysLog(logEntry) {
             '<td class="p-2">' + logEntry.food_name + '</td>' +
             '<td class="p-2">' + logEntry.calories + '</td>' +
             '<td class="p-2">' + logEntry.protein + 'g</td>' +
+            '<td class="p-2">' + (logEntry.carbs || 0) + 'g</td>' +
+            '<td class="p-2">' + (logEntry.fat || 0) + 'g</td>' +
             '<td class="p-2">' +
                 '<span class="material-symbols-outlined text-[#1F3C5E] cursor-pointer delete-icon" data-log-id="' + logEntry.id + '">delete</span>' +
             '</td>' +
@@ -231,6 +233,8 @@ function updateTotals(totals) {
     // Update the original totals at bottom of page
     $('#total-calories').text(newCalories);
     $('#total-protein').text(newProtein + 'g');
+    $('#total-carbs').text((parseInt($('#total-carbs').text()) || 0) + (totals.carbs || 0) + 'g');
+    $('#total-fat').text((parseInt($('#total-fat').text()) || 0) + (totals.fat || 0) + 'g');
     
     // Update desktop header totals
     $('#header-calories').text(newCalories);
@@ -285,6 +289,8 @@ function setTotals(totals) {
     // Update the original totals at bottom of page
     $('#total-calories').text(newCalories);
     $('#total-protein').text(newProtein + 'g');
+    $('#total-carbs').text((totals.carbs || 0) + 'g');
+    $('#total-fat').text((totals.fat || 0) + 'g');
     
     // Update desktop header totals
     $('#header-calories').text(newCalories);
@@ -340,6 +346,83 @@ function addQuickAddButton(food) {
 }
 
 function initializeRecommendations() {
+    const showError = () => {
+        document.getElementById('recommendationsContainer').classList.remove('hidden');
+        document.getElementById('errorMessage').classList.remove('hidden');
+        document.getElementById('recommendationResults').classList.add('hidden');
+        document.getElementById('hitBoth').textContent = 'Error getting recommendations. Please try again.';
+    };
+
+    const showRecommendations = (data) => {
+        const errorMessageDiv = document.getElementById('errorMessage');
+        const recommendationResultsDiv = document.getElementById('recommendationResults');
+        document.getElementById('recommendationsContainer').classList.remove('hidden');
+        
+        // Check if we received an insufficient foods message
+        if (data.insufficient_foods) {
+            errorMessageDiv.classList.remove('hidden');
+            recommendationResultsDiv.classList.add('hidden');
+            document.getElementById('hitBoth').textContent = data.message;
+            return;
+        }
+        
+        // Show recommendations
+        errorMessageDiv.classList.add('hidden');
+        recommendationResultsDiv.classList.remove('hidden');
+        
+        const formatRecommendation = (recommendation) => {
+            if (!recommendation || !recommendation.foods || recommendation.foods.length === 0) {
+                return 'No recommendations available';
+            }
+            const listFoods = (suggestion) => suggestion.foods.map(food => 
+                `${food.servings !== 1 ? food.servings + ' x ' : ''}${food.name} ${food.calories}cal (${food.protein}g)`
+            ).join(', ');
+            let text = `${listFoods(recommendation)} -- Recommendation Total: ${recommendation.total_calories}cal (${recommendation.total_protein}g) -- Day's Total: ${recommendation.day_total_calories}cal (${recommendation.day_total_protein}g)`;
+            // With carb or fat limits set, show how much of each the suggestion uses
+            if (data.macro_limits) {
+                text += ` -- Carbs ${recommendation.day_total_carbs}g, Fat ${recommendation.day_total_fat}g for the day`;
+            }
+            // With k above 1 the server also sends the next best suggestions
+            if (recommendation.alternatives && recommendation.alternatives.length > 0) {
+                const alternatives = recommendation.alternatives.map(alternative =>
+                    `${listFoods(alternative)} (${alternative.total_calories}cal, ${alternative.total_protein}g)`
+                ).join(' | ');
+                text += ` -- Or: ${alternatives}`;
+            }
+            return text;
+        };
+
+        document.getElementById('hitBothResult').textContent = formatRecommendation(data.hit_both);
+        // protein_first and closest aren't offered under carb or fat limits
+        const notWithLimits = 'Not available with carb or fat limits';
+        document.getElementById('prioritizeProtein').textContent =
+            data.macro_limits ? notWithLimits : formatRecommendation(data.protein_first);
+        document.getElementById('prioritizeCalories').textContent = formatRecommendation(data.calorie_first);
+        document.getElementById('closestResult').textContent =
+            data.macro_limits ? notWithLimits : formatRecommendation(data.closest);
+    };
+
+    // In async mode the server answers with a job to poll until the recommendations are ready
+    const pollJob = (pollUrl, delay) => {
+        setTimeout(() => {
+            fetch(pollUrl)
+            .then(response => response.json())
+            .then(data => {
+                if (data.status === 'pending') {
+                    pollJob(pollUrl, Math.min(delay * 2, 2000));
+                } else if (data.status === 'done') {
+                    showRecommendations(data);
+                } else {
+                    showError();
+                }
+            })
+            .catch((error) => {
+                console.error('Error:', error);
+                showError();
+            });
+        }, delay);
+    };
+
     document.getElementById('showRecommendationsBtn').addEventListener('click', function() {
         fetch('/get_recommendations', {
             method: 'POST',
@@ -349,42 +432,17 @@ function initializeRecommendations() {
         })
         .then(response => response.json())
         .then(data => {
-            const errorMessageDiv = document.getElementById('errorMessage');
-            const recommendationResultsDiv = document.getElementById('recommendationResults');
-            document.getElementById('recommendationsContainer').classList.remove('hidden');
-            
-            // Check if we received an insufficient foods message
-            if (data.insufficient_foods) {
-                errorMessageDiv.classList.remove('hidden');
-                recommendationResultsDiv.classList.add('hidden');
-                document.getElementById('hitBoth').textContent = data.message;
-                return;
+            if (data.status === 'pending' && data.poll_url) {
+                pollJob(data.poll_url, 100);
+            } else if (data.status === 'busy') {
+                showError();
+            } else {
+                showRecommendations(data);
             }
-            
-            // Show recommendations
-            errorMessageDiv.classList.add('hidden');
-            recommendationResultsDiv.classList.remove('hidden');
-            
-            const formatRecommendation = (recommendation) => {
-                if (!recommendation || !recommendation.foods || recommendation.foods.length === 0) {
-                    return 'No recommendations available';
-                }
-                const foodList = recommendation.foods.map(food => 
-                    `${food.name} ${food.calories}cal (${food.protein}g)`
-                ).join(', ');
-                return `${foodList} -- Recommendation Total: ${recommendation.total_calories}cal (${recommendation.total_protein}g) -- Day's Total: ${recommendation.day_total_calories}cal (${recommendation.day_total_protein}g)`;
-            };
-
-            document.getElementById('hitBothResult').textContent = formatRecommendation(data.hit_both);
-            document.getElementById('prioritizeProtein').textContent = formatRecommendation(data.protein_first);
-            document.getElementById('prioritizeCalories').textContent = formatRecommendation(data.calorie_first);
         })
         .catch((error) => {
             console.error('Error:', error);
-            document.getElementById('recommendationsContainer').classList.remove('hidden');
-            document.getElementById('errorMessage').classList.remove('hidden');
-            document.getElementById('recommendationResults').classList.add('hidden');
-            document.getElementById('hitBoth').textContent = 'Error getting recommendations. Please try again.';
+            showError();
         });
     });
 }
@@ -38,6 +38,8 @@ document.addEventListener('DOMContentLoaded', function() {
             <td class="p-2">${food.name}</td>
             <td class="p-2">${food.calories}</td>
             <td class="p-2">${food.protein}</td>
+            <td class="p-2">${food.carbs || 0}</td>
+            <td class="p-2">${food.fat || 0}</td>
             <td class="p-2">
                 <input type="hidden" name="existing_food_id[]" value="${food.id}">
                 <span class="material-symbols-outlined text-red-500 cursor-pointer delete-icon">delete</span>
@@ -53,6 +55,8 @@ document.addEventListener('DOMContentLoaded', function() {
             <td class="p-2"><input type="text" name="new_food_name[]" required class="w-full px-2 py-1 border rounded-md"></td>
             <td class="p-2"><input type="number" name="new_food_calories[]" required class="w-full px-2 py-1 border rounded-md"></td>
             <td class="p-2"><input type="number" name="new_food_protein[]" required class="w-full px-2 py-1 border rounded-md"></td>
+            <td class="p-2"><input type="number" name="new_food_carbs[]" min="0" class="w-full px-2 py-1 border rounded-md"></td>
+            <td class="p-2"><input type="number" name="new_food_fat[]" min="0" class="w-full px-2 py-1 border rounded-md"></td>
             <td class="p-2">
                 <span class="material-symbols-outlined text-red-500 cursor-pointer delete-icon">delete</span>
             </td>
@@ -42,6 +42,8 @@ async function fetchFreshData() {
             <td class="p-2">${entry.food_name}</td>
             <td class="p-2">${entry.calories}</td>
             <td class="p-2">${entry.protein}g</td>
+            <td class="p-2">${entry.carbs || 0}g</td>
+            <td class="p-2">${entry.fat || 0}g</td>
             <td class="p-2">
               <span class="material-symbols-outlined text-[#1F3C5E] cursor-pointer delete-icon" data-log-id="${entry.id}">delete</span>
             </td>
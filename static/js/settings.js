@@ -19,11 +19,15 @@ document.addEventListener('DOMContentLoaded', function() {
     const proteinInput = document.getElementById('protein-goal');
     const currentWeightInput = document.getElementById('current-weight');
     const weightGoalInput = document.getElementById('weight-goal');
+    const carbLimitInput = document.getElementById('carb-limit');
+    const fatLimitInput = document.getElementById('fat-limit');
     
     // Store initial values - using let for values that might need to be updated
     let originalCalorieValue = INITIAL_STATE.calorieGoal.toString();
     let originalProteinValue = INITIAL_STATE.proteinGoal.toString();
     let originalWeightGoalValue = INITIAL_STATE.weightGoal ? INITIAL_STATE.weightGoal.toString() : '';
+    let originalCarbLimitValue = carbLimitInput.value;
+    let originalFatLimitValue = fatLimitInput.value;
     const originalWeightUnit = INITIAL_STATE.weightUnit; // This stays constant
     let currentWeightUnit = originalWeightUnit.toString();
     
@@ -99,8 +103,10 @@ document.addEventListener('DOMContentLoaded', function() {
         const weightGoalChanged = weightGoalInput.value !== (originalWeightUnit === 1 && originalWeightGoalValue ? 
             (parseFloat(originalWeightGoalValue) * 2.20462).toFixed(1) : originalWeightGoalValue);
         const currentWeightEntered = currentWeightInput.value.trim() !== '';
+        const macroLimitsChanged = carbLimitInput.value !== originalCarbLimitValue ||
+            fatLimitInput.value !== originalFatLimitValue;
         
-        if (calorieChanged || proteinChanged || weightGoalChanged || currentWeightEntered) {
+        if (calorieChanged || proteinChanged || weightGoalChanged || currentWeightEntered || macroLimitsChanged) {
             settingsForm.classList.add('settings-form-changed');
         } else {
             settingsForm.classList.remove('settings-form-changed');
@@ -131,6 +137,8 @@ document.addEventListener('DOMContentLoaded', function() {
         // Reset calorie and protein goals
         calorieInput.value = originalCalorieValue;
         proteinInput.value = originalProteinValue;
+        carbLimitInput.value = originalCarbLimitValue;
+        fatLimitInput.value = originalFatLimitValue;
         
         // Reset weight goal - display in the current unit (kg or lbs)
         weightGoalInput.value = originalWeightUnit === 1 && originalWeightGoalValue ? 
@@ -256,6 +264,14 @@ document.addEventListener('DOMContentLoaded', function() {
     weightGoalInput.addEventListener('input', function() {
         checkFormChanged();
     });
+
+    carbLimitInput.addEventListener('input', function() {
+        checkFormChanged();
+    });
+
+    fatLimitInput.addEventListener('input', function() {
+        checkFormChanged();
+    });
     
     // Show confirmation modal for settings form
     saveButton.addEventListener('click', function() {
@@ -265,9 +281,11 @@ document.addEventListener('DOMContentLoaded', function() {
             const proteinChanged = proteinInput.value !== originalProteinValue;
             const weightGoalChanged = weightGoalInput.value !== originalWeightGoalValue;
             const currentWeightEntered = currentWeightInput.value.trim() !== '';
+            const macroLimitsChanged = carbLimitInput.value !== originalCarbLimitValue ||
+                fatLimitInput.value !== originalFatLimitValue;
             
             // Only show confirmation if values have changed
-            if (calorieChanged || proteinChanged || weightGoalChanged || currentWeightEntered) {
+            if (calorieChanged || proteinChanged || weightGoalChanged || currentWeightEntered || macroLimitsChanged) {
                 // Update confirmation message based on what's changing
                 let changeMessage = 'Are you sure you want to update your settings?';
                 const changes = [];
@@ -284,6 +302,9 @@ document.addEventListener('DOMContentLoaded', function() {
                 if (currentWeightEntered) {
                     changes.push('current weight');
                 }
+                if (macroLimitsChanged) {
+                    changes.push('carb and fat limits');
+                }
                 
                 if (changes.length > 0) {
                     changeMessage = `Are you sure you want to update your ${changes.join(', ')}?`;
@@ -437,6 +458,8 @@ document.addEventListener('DOMContentLoaded', function() {
                     // Update original values to match current form values
                     originalCalorieValue = calorieInput.value;
                     originalProteinValue = proteinInput.value;
+                    originalCarbLimitValue = carbLimitInput.value;
+                    originalFatLimitValue = fatLimitInput.value;
                     originalWeightGoalValue = weightGoalInput.value;
                     
                     // Clear current weight input
@@ -7,6 +7,7 @@ import logging
 from werkzeug.security import generate_password_hash
 from flask import session
 from app import app as flask_app
+from db import migrate
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
@@ -15,6 +16,18 @@ logger = logging.getLogger(__name__)
 # Add the parent directory to sys.path to import app
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+AJAX = {'X-Requested-With': 'XMLHttpRequest'}
+
+# (name, calories, protein), optionally followed by carbs and fat
+TEST_FOODS = [
+    ('Oats', 150, 5),
+    ('Greek Yogurt', 100, 17),
+    ('Chicken Breast', 165, 31),
+    ('Rice', 200, 4),
+    ('Protein Shake', 120, 24),
+    ('Banana', 105, 1),
+]
+
 
 @pytest.fixture
 def app():
@@ -53,6 +66,10 @@ def app():
     conn.close()
     os.close(db_fd)
     os.unlink(db_path)
+    # WAL mode leaves side files next to the database
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.unlink(db_path + suffix)
     
     # Restore the original DB_PATH
     app_module.DB_PATH = original_db_path
@@ -66,6 +83,9 @@ def init_db(db_path):
     conn = sqlite3.connect(db_path, check_same_thread=False)
     c = conn.cursor()
     
+    # Match the app's init_db, which switches the database to WAL
+    c.execute("PRAGMA journal_mode = WAL")
+    
     # Drop existing tables if they exist
     c.executescript('''
         DROP TABLE IF EXISTS users;
@@ -150,6 +170,10 @@ def init_db(db_path):
     )
     ''')
     
+    # Apply the app's schema migrations (indexes and later changes) on top of the base tables
+    conn.commit()
+    migrate(conn)
+    
     # Insert test user
     test_password = generate_password_hash('password')
     c.execute("INSERT INTO users (username, password, calorie_goal, protein_goal) VALUES (?, ?, ?, ?)",
@@ -206,6 +230,22 @@ def auth(client):
     return AuthActions()
 
 
+@pytest.fixture
+def quick_add_list():
+    """The foods quick_add_foods adds; override or parametrize it for another list."""
+    return TEST_FOODS
+
+
+@pytest.fixture
+def quick_add_foods(client, auth, quick_add_list):
+    """Log in and give the test user a quick add list, with carbs and fat where the list has them."""
+    auth.login()
+    for food in quick_add_list:
+        client.post('/quick_add_food', data=dict(zip(('name', 'calories', 'protein', 'carbs', 'fat'), food)),
+                    headers=AJAX)
+    return quick_add_list
+
+
 @pytest.fixture(autouse=True)
 def logout_after_test(client):
     """Ensure user is logged out after each test."""
@@ -0,0 +1,87 @@
+import sys
+import os
+
+# Add the parent directory to sys.path to import app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from app import get_local_date
+from conftest import AJAX
+
+
+def daily_totals(conn, date, user_id=1):
+    row = conn.execute("""SELECT calories, protein, entry_count FROM daily_totals
+                          WHERE user_id = ? AND date = ?""", (user_id, date)).fetchone()
+    return row
+
+
+def test_triggers_track_daily_log_writes(app):
+    """Test that inserts, updates and deletes on daily_log keep daily_totals in step."""
+    conn = app.config['DB_CONNECTION']
+    c = conn.cursor()
+    c.execute("INSERT INTO daily_log (date, food_name, calories, protein, user_id) VALUES (?, ?, ?, ?, ?)",
+              ('2024-01-01', 'Eggs', 140, 12, 1))
+    eggs_id = c.lastrowid
+    c.execute("INSERT INTO daily_log (date, food_name, calories, protein, user_id) VALUES (?, ?, ?, ?, ?)",
+              ('2024-01-01', 'Toast', 80, 3, 1))
+    conn.commit()
+    assert daily_totals(conn, '2024-01-01') == (220, 15, 2)
+
+    # Moving an entry to another day moves its totals with it
+    c.execute("UPDATE daily_log SET date = ?, calories = ? WHERE id = ?", ('2024-01-02', 150, eggs_id))
+    conn.commit()
+    assert daily_totals(conn, '2024-01-01') == (80, 3, 1)
+    assert daily_totals(conn, '2024-01-02') == (150, 12, 1)
+
+    # Deleting the last entry of a day removes the row
+    c.execute("DELETE FROM daily_log WHERE id = ?", (eggs_id,))
+    conn.commit()
+    assert daily_totals(conn, '2024-01-02') is None
+
+def test_log_and_remove_food_report_running_totals(client, auth, app):
+    """Test that log_food and remove_food return totals from daily_totals."""
+    auth.login()
+    response = client.post('/log_food', data={'name': 'Rice', 'calories': '200', 'protein': '4',
+                                               'servings': '1.5'}, headers=AJAX)
+    data = response.get_json()
+    assert data['totals'] == {'calories': 300, 'protein': 6, 'carbs': 0, 'fat': 0}
+
+    response = client.post('/log_food', data={'name': 'Chicken', 'calories': '250', 'protein': '30',
+                                               'servings': '1'}, headers=AJAX)
+    assert response.get_json()['totals'] == {'calories': 550, 'protein': 36, 'carbs': 0, 'fat': 0}
+
+    response = client.post(f"/remove_food/{data['log_entry']['id']}", headers=AJAX)
+    assert response.get_json()['totals'] == {'calories': 250, 'protein': 30, 'carbs': 0, 'fat': 0}
+
+    stats = client.get('/api/dashboard-stats').get_json()['stats']
+    assert (stats['total_calories'], stats['total_protein']) == (250, 30)
+
+def test_update_history_keeps_totals_current(client, auth, app):
+    """Test that editing a past day through update_history updates daily_totals."""
+    auth.login()
+    conn = app.config['DB_CONNECTION']
+    c = conn.cursor()
+    c.execute("INSERT INTO daily_log (date, food_name, calories, protein, user_id) VALUES (?, ?, ?, ?, ?)",
+              ('2024-02-01', 'Old food', 500, 20, 1))
+    conn.commit()
+
+    client.post('/update_history', data={'edit_date': '2024-02-01', 'existing_food_id[]': [],
+                                         'new_food_name[]': ['Soup', 'Bread'],
+                                         'new_food_calories[]': ['250', '120'],
+                                         'new_food_protein[]': ['10', '4']})
+    assert daily_totals(conn, '2024-02-01') == (370, 14, 2)
+
+def test_rebuild_totals_command(runner, app):
+    """Test that the rebuild-totals command recomputes daily_totals from daily_log."""
+    conn = app.config['DB_CONNECTION']
+    c = conn.cursor()
+    today = get_local_date().isoformat()
+    c.execute("INSERT INTO daily_log (date, food_name, calories, protein, user_id) VALUES (?, ?, ?, ?, ?)",
+              (today, 'Oats', 150, 5, 1))
+    # Simulate totals drifting from the log
+    c.execute("UPDATE daily_totals SET calories = 9999 WHERE user_id = 1 AND date = ?", (today,))
+    c.execute("INSERT INTO daily_totals (user_id, date, calories, protein, entry_count) VALUES (1, '1999-01-01', 1, 1, 1)")
+    conn.commit()
+
+    result = runner.invoke(args=['rebuild-totals'])
+    assert 'Rebuilt daily totals (1 user-days)' in result.output
+    assert daily_totals(conn, today) == (150, 5, 1)
+    assert daily_totals(conn, '1999-01-01') is None
@@ -0,0 +1,153 @@
+import pytest
+import sqlite3
+import sys
+import os
+
+# Add the parent directory to sys.path to import app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from db import ConnectionPool, PoolTimeout
+
+
+def test_pool_reuses_released_connection(app):
+    """Test that a released connection is handed out again instead of opening a new one."""
+    pool = ConnectionPool(app.config['DB_PATH'], size=2)
+    conn = pool.acquire()
+    pool.release(conn)
+    assert pool.acquire() is conn
+    pool.close()
+
+def test_pool_checkout_timeout(app):
+    """Test that checking out of an exhausted pool raises PoolTimeout."""
+    pool = ConnectionPool(app.config['DB_PATH'], size=1, timeout=0.05)
+    conn = pool.acquire()
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    pool.release(conn)
+    pool.close()
+
+def test_pool_applies_pragmas(app):
+    """Test that configured pragmas are run on every new connection."""
+    pool = ConnectionPool(app.config['DB_PATH'], size=1, pragmas={'cache_size': -4000})
+    conn = pool.acquire()
+    assert conn.execute("PRAGMA cache_size").fetchone()[0] == -4000
+    pool.release(conn)
+    pool.close()
+
+def test_pool_release_discards_uncommitted_work(app):
+    """Test that releasing a connection rolls back an open transaction."""
+    pool = ConnectionPool(app.config['DB_PATH'], size=1)
+    conn = pool.acquire()
+    conn.execute("INSERT INTO daily_log (date, food_name, calories, protein, user_id) VALUES (?, ?, ?, ?, ?)",
+                 ('2023-01-01', 'Uncommitted', 100, 10, 1))
+    pool.release(conn)
+
+    c = app.config['DB_CONNECTION'].cursor()
+    c.execute("SELECT COUNT(*) FROM daily_log WHERE food_name = ?", ('Uncommitted',))
+    assert c.fetchone()[0] == 0
+    pool.close()
+
+def test_pool_size_zero_disables_pooling(app):
+    """Test that a pool size of 0 opens and closes a connection per checkout."""
+    pool = ConnectionPool(app.config['DB_PATH'], size=0)
+    conn = pool.acquire()
+    pool.release(conn)
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute("SELECT 1")
+    assert pool.acquire() is not conn
+
+def test_settings_page_uses_one_connection(client, auth, app, monkeypatch):
+    """Test that the settings page (route plus User.get_weight_logs) checks out a single connection."""
+    auth.login()
+    # pytest-flask keeps one app context open for the whole test, so hand back the login connection first
+    from app import close_db
+    close_db()
+
+    checkouts = []
+    original_acquire = ConnectionPool.acquire
+
+    def counting_acquire(self):
+        checkouts.append(self.db_path)
+        return original_acquire(self)
+
+    monkeypatch.setattr(ConnectionPool, 'acquire', counting_acquire)
+    response = client.get('/settings')
+    assert response.status_code == 200
+    assert len(checkouts) == 1
+
+def test_pool_connections_use_configured_profile(app):
+    """Test that request connections get the WAL journal and the profile's synchronous level."""
+    from app import get_db
+    app.config['DB_PROFILE'] = 'durable'
+    with app.app_context():
+        import app as app_module
+        app_module.get_database().close()
+        app_module._database = None
+        conn = get_db()
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 2  # FULL
+    app.config['DB_PROFILE'] = 'balanced'
+
+def test_profile_pragmas_overrides_and_unknown_profile():
+    """Test that overrides win over profile values and unknown profiles are rejected."""
+    from db import profile_pragmas
+    pragmas = profile_pragmas('fast', {'synchronous': 'NORMAL'})
+    assert pragmas['synchronous'] == 'NORMAL'
+    assert pragmas['journal_mode'] == 'WAL'
+    with pytest.raises(ValueError):
+        profile_pragmas('reckless')
+
+def test_init_db_switches_to_wal(app):
+    """Test that init_db leaves the database file in WAL mode."""
+    import app as app_module
+    app_module.init_db()
+    conn = sqlite3.connect(app.config['DB_PATH'])
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+    conn.close()
+
+def test_reader_connections_are_read_only(app):
+    """Test that connections from the reader pool refuse writes."""
+    from db import Database
+    database = Database(app.config['DB_PATH'], reader_pool_size=2)
+    conn = database.readers.acquire()
+    assert conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] >= 1
+    with pytest.raises(sqlite3.OperationalError):
+        conn.execute("DELETE FROM daily_log")
+    database.readers.release(conn)
+    database.close()
+
+def test_single_writer_is_serialized(app):
+    """Test that a second writer checkout waits for the first and times out while it is held."""
+    from db import Database
+    database = Database(app.config['DB_PATH'], reader_pool_size=2, timeout=0.05)
+    writer = database.writer.acquire()
+    with pytest.raises(PoolTimeout):
+        database.writer.acquire()
+    # Readers are unaffected by a busy writer
+    reader = database.readers.acquire()
+    assert reader.execute("SELECT 1").fetchone()[0] == 1
+    database.readers.release(reader)
+    database.writer.release(writer)
+    assert database.writer.acquire() is writer
+    database.close()
+
+def test_read_routes_use_reader_pool(client, auth, app):
+    """Test that the dashboard reads on a reader connection and never checks out the writer."""
+    auth.login()
+    import app as app_module
+    app_module.close_db()
+
+    checkouts = []
+    with app.app_context():
+        database = app_module.get_database()
+    original_writer_acquire = database.writer.acquire
+    original_reader_acquire = database.readers.acquire
+    database.writer.acquire = lambda: checkouts.append('writer') or original_writer_acquire()
+    database.readers.acquire = lambda: checkouts.append('reader') or original_reader_acquire()
+    try:
+        for path in ('/dashboard', '/api/dashboard-stats', '/history', '/edit_history', '/export_csv'):
+            assert client.get(path).status_code == 200
+            app_module.close_db()
+    finally:
+        del database.writer.acquire
+        del database.readers.acquire
+    assert checkouts and set(checkouts) == {'reader'}
@@ -0,0 +1,311 @@
+import itertools
+import pytest
+import random
+import sqlite3
+import sys
+import os
+
+# Add the parent directory to sys.path to import app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import app as app_module
+from db import migrate, rebuild_daily_totals
+from recommender import (Food, MACRO_MAX_BUCKETS, MacroTable, NumpyMacroTable, macro_buckets, macro_recommend,
+                         solve)
+from conftest import AJAX
+
+# (name, calories, protein, carbs, fat)
+TEST_FOODS = [
+    ('Oats', 150, 5, 27, 3),
+    ('Greek Yogurt', 100, 17, 6, 0),
+    ('Chicken Breast', 165, 31, 0, 4),
+    ('Rice', 200, 4, 45, 0),
+    ('Protein Shake', 120, 24, 3, 1),
+    ('Banana', 105, 1, 27, 0),
+    ('Peanut Butter', 190, 8, 6, 16),
+    ('Salmon', 280, 39, 0, 13),
+]
+
+
+@pytest.fixture
+def quick_add_list():
+    """The quick add list with carbs and fat."""
+    return TEST_FOODS
+
+
+@pytest.fixture(params=['python', 'numpy'])
+def backend(request):
+    """Run a test against each knapsack backend, skipping NumPy when it isn't installed."""
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    return request.param
+
+
+def daily_totals(conn, date, user_id=1):
+    return conn.execute("""SELECT calories, protein, carbs, fat, entry_count FROM daily_totals
+                           WHERE user_id = ? AND date = ?""", (user_id, date)).fetchone()
+
+
+def random_catalog(rng, n):
+    return [Food(i + 1, f'Food {i}', rng.randint(0, 400), rng.randint(0, 40), carbs=rng.randint(0, 60),
+                 fat=rng.randint(0, 25)) for i in range(n)]
+
+
+def best_protein(foods, calories, carbs, fat):
+    """The most protein of any subset within the limits (None for no limit), by brute force"""
+    best = 0
+    for r in range(len(foods) + 1):
+        for combo in itertools.combinations(foods, r):
+            if (sum(food.calories for food in combo) <= calories
+                    and (carbs is None or sum(food.carbs for food in combo) <= carbs)
+                    and (fat is None or sum(food.fat for food in combo) <= fat)):
+                best = max(best, sum(food.protein for food in combo))
+    return best
+
+
+def test_triggers_track_carbs_and_fat(app):
+    """Test that the daily_totals triggers sum carbs and fat through inserts, updates and deletes."""
+    conn = app.config['DB_CONNECTION']
+    c = conn.cursor()
+    c.execute("""INSERT INTO daily_log (date, food_name, calories, protein, carbs, fat, user_id)
+                 VALUES ('2024-01-01', 'Oats', 150, 5, 27, 3, 1)""")
+    oats_id = c.lastrowid
+    c.execute("""INSERT INTO daily_log (date, food_name, calories, protein, carbs, fat, user_id)
+                 VALUES ('2024-01-01', 'Eggs', 140, 12, 1, 10, 1)""")
+    conn.commit()
+    assert daily_totals(conn, '2024-01-01') == (290, 17, 28, 13, 2)
+
+    c.execute("UPDATE daily_log SET carbs = 30 WHERE id = ?", (oats_id,))
+    conn.commit()
+    assert daily_totals(conn, '2024-01-01') == (290, 17, 31, 13, 2)
+
+    c.execute("DELETE FROM daily_log WHERE id = ?", (oats_id,))
+    conn.commit()
+    assert daily_totals(conn, '2024-01-01') == (140, 12, 1, 10, 1)
+
+    c.execute("UPDATE daily_totals SET carbs = 99")
+    assert rebuild_daily_totals(conn) == 1
+    assert daily_totals(conn, '2024-01-01') == (140, 12, 1, 10, 1)
+
+def test_migration_keeps_existing_rows(tmp_path):
+    """Test that migrating a database with rows gives them 0 carbs and fat, and later logs add theirs."""
+    conn = sqlite3.connect(str(tmp_path / 'v3.db'))
+    conn.executescript("""
+        CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE NOT NULL,
+                            password TEXT NOT NULL, calorie_goal INTEGER, protein_goal INTEGER,
+                            weight_goal REAL, weight_unit INTEGER DEFAULT 0);
+        CREATE TABLE foods (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, calories INTEGER NOT NULL,
+                            protein INTEGER NOT NULL, user_id INTEGER);
+        CREATE TABLE daily_log (id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT NOT NULL, food_name TEXT NOT NULL,
+                                calories INTEGER NOT NULL, protein INTEGER NOT NULL, user_id INTEGER NOT NULL);
+        CREATE TABLE daily_summary (id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT NOT NULL,
+                                    total_calories INTEGER NOT NULL, total_protein INTEGER NOT NULL, summary TEXT,
+                                    user_id INTEGER NOT NULL, calorie_goal INTEGER, protein_goal INTEGER,
+                                    UNIQUE(date, user_id));
+        CREATE TABLE weight_logs (id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT NOT NULL, weight REAL NOT NULL,
+                                  user_id INTEGER NOT NULL);
+    """)
+    conn.execute("INSERT INTO users (username, password) VALUES ('old', 'x')")
+    conn.execute("INSERT INTO foods (name, calories, protein, user_id) VALUES ('Rice', 200, 4, 1)")
+    conn.execute("""INSERT INTO daily_log (date, food_name, calories, protein, user_id)
+                    VALUES ('2024-01-01', 'Rice', 200, 4, 1)""")
+    conn.commit()
+
+    migrate(conn)
+
+    assert daily_totals(conn, '2024-01-01') == (200, 4, 0, 0, 1)
+    assert conn.execute("SELECT carbs, fat FROM foods").fetchone() == (0, 0)
+    assert conn.execute("SELECT carb_limit, fat_limit FROM users").fetchone() == (None, None)
+    # Logs after the migration add their carbs and fat to the existing totals
+    conn.execute("""INSERT INTO daily_log (date, food_name, calories, protein, carbs, fat, user_id)
+                    VALUES ('2024-01-01', 'Oats', 150, 5, 27, 3, 1)""")
+    conn.commit()
+    assert daily_totals(conn, '2024-01-01') == (350, 9, 27, 3, 2)
+    conn.close()
+
+@pytest.mark.parametrize('seed', range(30))
+def test_macro_recommend_is_exact_with_unit_buckets(seed, backend):
+    """Test that with every bucket 1 the suggestion is the most protein within all three limits."""
+    rng = random.Random(seed)
+    foods = random_catalog(rng, rng.randint(0, 9))
+    calories = rng.randint(0, 900)
+    carbs = rng.choice([None, rng.randint(0, 90)])
+    fat = rng.choice([None, rng.randint(0, 40)]) if carbs is not None else rng.randint(0, 40)
+    results, buckets = macro_recommend(foods, calories, 30, carbs, fat, backend=backend,
+                                       buckets=(1, None if carbs is None else 1, None if fat is None else 1))
+    chosen = results['calorie_first']
+    assert sum(food.calories for food in chosen) <= calories
+    assert carbs is None or sum(food.carbs for food in chosen) <= carbs
+    assert fat is None or sum(food.fat for food in chosen) <= fat
+    protein = sum(food.protein for food in chosen)
+    assert protein == best_protein(foods, calories, carbs, fat)
+    assert results['hit_both'] == (chosen if protein >= 30 else None)
+
+@pytest.mark.parametrize('seed', range(30))
+def test_bucketed_macro_recommend_keeps_to_limits(seed, backend):
+    """Test that bucketed limits never let a suggestion over any limit, and only cost protein."""
+    rng = random.Random(seed)
+    foods = random_catalog(rng, rng.randint(1, 9))
+    limits = (rng.randint(0, 900), rng.randint(0, 90), rng.randint(0, 40))
+    buckets = (rng.randint(1, 60), rng.randint(1, 10), rng.randint(1, 5))
+    results = macro_recommend(foods, limits[0], 30, limits[1], limits[2], backend=backend, buckets=buckets)[0]
+    chosen = results['calorie_first']
+    for name, limit in zip(('calories', 'carbs', 'fat'), limits):
+        assert sum(getattr(food, name) for food in chosen) <= limit
+    protein = sum(food.protein for food in chosen)
+    assert protein <= best_protein(foods, *limits)
+    assert results['hit_both'] == (chosen if protein >= 30 else None)
+
+@pytest.mark.parametrize('n', [60, 100, 200])
+def test_default_budget_keeps_to_limits(n, backend):
+    """Test that with buckets picked for the default budget every suggestion keeps to every limit."""
+    foods = random_catalog(random.Random(n), n)
+    results, buckets = macro_recommend(foods, 2000, 150, 250, 70, backend=backend)
+    assert all(bucket <= most for bucket, most in zip(buckets, MACRO_MAX_BUCKETS))
+    for chosen in (results['calorie_first'], results['hit_both'] or []):
+        assert sum(food.calories for food in chosen) <= 2000
+        assert sum(food.carbs for food in chosen) <= 250
+        assert sum(food.fat for food in chosen) <= 70
+
+def test_backends_agree(backend):
+    """Test that the NumPy table picks exactly the foods the pure-Python one does."""
+    rng = random.Random(7)
+    foods = random_catalog(rng, 40)
+    expected = macro_recommend(foods, 1500, 80, 150, 50, backend='python', buckets=(50, 5, 2))
+    assert macro_recommend(foods, 1500, 80, 150, 50, backend=backend, buckets=(50, 5, 2)) == expected
+
+def test_macro_buckets_fit_the_budget():
+    """Test that buckets grow, coarsest where there are most, until the table fits, and stay 1 when it already does."""
+    foods = [Food(i) for i in range(10)]
+    assert macro_buckets((2000, 250, None), foods, cells_per_ms=1_000_000, latency_budget_ms=50) == (1, 1, None)
+    buckets = macro_buckets((2000, 250, 70), foods, cells_per_ms=100_000, latency_budget_ms=50)
+    sizes = [limit // bucket + 1 for limit, bucket in zip((2000, 250, 70), buckets)]
+    assert sizes[0] * sizes[1] * sizes[2] * len(foods) <= 50 * 100_000
+    assert buckets[0] > buckets[1] >= buckets[2] >= 1
+    assert max(sizes) <= 2 * min(sizes)
+    # Only the request decides the buckets
+    assert macro_buckets((2000, 250, 70), foods, cells_per_ms=100_000, latency_budget_ms=50) == buckets
+    # However tight the budget, no bucket passes its cap
+    assert macro_buckets((2000, 250, 70), foods, cells_per_ms=1, latency_budget_ms=1) == MACRO_MAX_BUCKETS
+
+def test_macro_buckets_follow_the_backend_rate(backend):
+    """Test that macro_recommend sizes buckets from its table's fixed rate, not from timing."""
+    foods = random_catalog(random.Random(5), 30)
+    table_class = MacroTable if backend == 'python' else NumpyMacroTable
+    expected = macro_buckets((1800, 200, 60), [food for food in foods if food.protein > 0],
+                             table_class.cells_per_ms, 50)
+    assert macro_recommend(foods, 1800, 90, 200, 60, backend=backend)[1] == expected
+
+def test_solve_reports_macro_buckets():
+    """Test that solve() hands carb and fat limits to macro_recommend, with servings if asked."""
+    foods = random_catalog(random.Random(3), 12)
+    results, info = solve(foods, 800, 40, remaining_carbs=60, max_servings=2, latency_budget_ms=1000)
+    assert info.buckets == (1, 1, None) and info.exact
+    assert set(results) == {'hit_both', 'calorie_first'}
+    chosen = results['calorie_first']
+    assert sum(food.carbs for food in chosen) <= 60 and sum(food.calories for food in chosen) <= 800
+    # Without limits nothing changes
+    assert solve(foods, 800, 40)[1].buckets == ()
+
+def test_logging_routes_carry_carbs_and_fat(client, app, quick_add_foods):
+    """Test that quick add foods keep their carbs and fat, and logging them adds to the day's totals."""
+    conn = sqlite3.connect(app_module.DB_PATH)
+    oats_id = conn.execute("SELECT id FROM foods WHERE name = 'Oats'").fetchone()[0]
+    conn.close()
+    data = client.post('/log_quick_food', data={'food_id': oats_id}, headers=AJAX).get_json()
+    assert (data['log_entry']['carbs'], data['log_entry']['fat']) == (27, 3)
+
+    data = client.post('/log_food', data={'name': 'Bagel', 'calories': '270', 'protein': '10', 'carbs': '53',
+                                          'fat': '', 'servings': '1.5'}, headers=AJAX).get_json()
+    assert (data['log_entry']['carbs'], data['log_entry']['fat']) == (79, 0)
+    assert data['totals'] == {'calories': 150 + 405, 'protein': 5 + 15, 'carbs': 27 + 79, 'fat': 3}
+
+    stats = client.get('/api/dashboard-stats').get_json()
+    assert (stats['stats']['total_carbs'], stats['stats']['total_fat']) == (106, 3)
+    assert [entry['carbs'] for entry in stats['daily_log']] == [27, 79]
+
+    response = client.post('/remove_food/{}'.format(data['log_entry']['id']), headers=AJAX)
+    assert response.get_json()['totals']['carbs'] == 27
+
+    # Saving the summary hands back the carbs and fat the dashboard shows too
+    totals = client.post('/save_summary', headers=AJAX).get_json()['totals']
+    assert totals == {'calories': 150, 'protein': 5, 'carbs': 27, 'fat': 3}
+
+def test_bad_macros_are_rejected(client, auth):
+    """Test that carbs or fat that aren't whole grams are refused."""
+    auth.login()
+    data = client.post('/quick_add_food', data={'name': 'Toast', 'calories': 80, 'protein': 3, 'carbs': '-5'},
+                       headers=AJAX).get_json()
+    assert data['success'] is False
+    response = client.post('/log_food', data={'name': 'Toast', 'calories': '80', 'protein': '3', 'fat': 'lots',
+                                              'servings': '1'}, headers=AJAX)
+    assert response.status_code == 400
+
+def test_history_edits_carry_carbs_and_fat(client, app, auth):
+    """Test that foods added on the edit history page keep their carbs and fat, blank meaning 0."""
+    auth.login()
+    client.post('/update_history', data={'edit_date': '2024-02-01', 'existing_food_id[]': [],
+                                         'new_food_name[]': ['Bagel', 'Eggs'], 'new_food_calories[]': ['270', '140'],
+                                         'new_food_protein[]': ['10', '12'], 'new_food_carbs[]': ['53', ''],
+                                         'new_food_fat[]': ['2', '10']})
+    conn = sqlite3.connect(app_module.DB_PATH)
+    assert conn.execute("SELECT food_name, carbs, fat FROM daily_log WHERE date = '2024-02-01' ORDER BY id").fetchall() \
+        == [('Bagel', 53, 2), ('Eggs', 0, 10)]
+    assert daily_totals(conn, '2024-02-01') == (410, 22, 53, 12, 2)
+    data = client.get('/edit_history?date=2024-02-01', headers=AJAX).get_json()
+    assert [(food['carbs'], food['fat']) for food in data['daily_log']] == [(53, 2), (0, 10)]
+
+    # Forms without the columns still work, and a bad value changes nothing
+    client.post('/update_history', data={'edit_date': '2024-02-02', 'existing_food_id[]': [],
+                                         'new_food_name[]': ['Toast'], 'new_food_calories[]': ['80'],
+                                         'new_food_protein[]': ['3']})
+    assert daily_totals(conn, '2024-02-02') == (80, 3, 0, 0, 1)
+    response = client.post('/update_history', data={'edit_date': '2024-02-02', 'existing_food_id[]': [],
+                                                    'new_food_name[]': ['Jam'], 'new_food_calories[]': ['50'],
+                                                    'new_food_protein[]': ['0'], 'new_food_fat[]': ['some']})
+    assert response.status_code == 302
+    assert daily_totals(conn, '2024-02-02') == (80, 3, 0, 0, 1)
+    conn.close()
+
+def test_settings_set_and_clear_macro_limits(client, app, auth):
+    """Test that carb and fat limits are saved from settings, blank clears one, and forms without them keep them."""
+    auth.login()
+    client.post('/update_settings', data={'calorie_goal': 2000, 'protein_goal': 100, 'carb_limit': '150',
+                                          'fat_limit': '60'}, headers=AJAX)
+    client.post('/update_settings', data={'calorie_goal': 2100, 'protein_goal': 100}, headers=AJAX)
+    conn = sqlite3.connect(app_module.DB_PATH)
+    assert conn.execute("SELECT carb_limit, fat_limit FROM users WHERE id = 1").fetchone() == (150, 60)
+    client.post('/update_settings', data={'calorie_goal': 2100, 'protein_goal': 100, 'carb_limit': '150',
+                                          'fat_limit': ''}, headers=AJAX)
+    assert conn.execute("SELECT carb_limit, fat_limit FROM users WHERE id = 1").fetchone() == (150, None)
+    conn.close()
+    data = client.post('/update_settings', data={'calorie_goal': 2100, 'protein_goal': 100, 'carb_limit': 'some'},
+                       headers=AJAX).get_json()
+    assert data['success'] is False
+
+def test_recommendations_keep_to_macro_limits(client, app, quick_add_foods, monkeypatch):
+    """Test that with limits set the suggestions keep to the carbs and fat left, and say how they were bucketed."""
+    # Room for the exact table (3 foods that fit x 1,921 x 26 x 10 cells) on either backend
+    monkeypatch.setitem(app.config, 'RECOMMENDER_LATENCY_MS', 400)
+    client.post('/update_settings', data={'calorie_goal': 2000, 'protein_goal': 100, 'carb_limit': '40',
+                                          'fat_limit': '10'}, headers=AJAX)
+    client.post('/log_food', data={'name': 'Toast', 'calories': '80', 'protein': '3', 'carbs': '15', 'fat': '1',
+                                   'servings': '1'}, headers=AJAX)
+    data = client.post('/get_recommendations', headers=AJAX).get_json()
+    assert data['macro_limits']['remaining_carbs'] == 25 and data['macro_limits']['remaining_fat'] == 9
+    assert data['macro_limits']['buckets'] == {'calories': 1, 'carbs': 1, 'fat': 1}
+    suggestion = data['calorie_first']
+    assert suggestion['total_carbs'] <= 25 and suggestion['total_fat'] <= 9
+    assert suggestion['day_total_carbs'] == 15 + suggestion['total_carbs']
+    # The most protein within 25 g carbs and 9 g fat: chicken, yogurt and the shake
+    assert sorted(food['name'] for food in suggestion['foods']) == ['Chicken Breast', 'Greek Yogurt', 'Protein Shake']
+    assert 'protein_first' not in data and 'closest' not in data
+
+def test_bucketed_recommendations_report_each_limit(client, app, quick_add_foods, monkeypatch):
+    """Test that a bucketed macro solve reports what may go unused of each limit, not a calorie overshoot."""
+    monkeypatch.setitem(app.config, 'RECOMMENDER_LATENCY_MS', 0.001)
+    client.post('/update_settings', data={'calorie_goal': 2000, 'protein_goal': 100, 'carb_limit': '200',
+                                          'fat_limit': ''}, headers=AJAX)
+    data = client.post('/get_recommendations', headers=AJAX).get_json()
+    assert data['macro_limits']['buckets'] == {'calories': 50, 'carbs': 10, 'fat': None}
+    assert data['approximation'] == {'max_unused_per_food': {'calories': 49, 'carbs': 9}}
+    assert data['calorie_first']['total_calories'] <= 2000 and data['calorie_first']['total_carbs'] <= 200
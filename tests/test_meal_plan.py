@@ -0,0 +1,162 @@
+import pytest
+import random
+import sqlite3
+import threading
+import time
+import sys
+import os
+
+# Add the parent directory to sys.path to import app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import app as app_module
+from meal_planner import PlanCancelled, plan_meals
+from recommender import CatalogState, Food, Frontier
+from conftest import AJAX, TEST_FOODS
+
+PLAN_FOODS = TEST_FOODS + [
+    ('Salmon', 280, 39),
+    ('Pasta', 350, 12),
+    ('Eggs', 140, 12),
+    ('Tuna', 120, 26),
+]
+
+
+class CancelAfter:
+    """A cancel event that turns set after being checked ``checks`` times"""
+
+    def __init__(self, checks):
+        self.checks = checks
+
+    def is_set(self):
+        self.checks -= 1
+        return self.checks < 0
+
+
+@pytest.fixture
+def quick_add_list():
+    """A longer list, so a week's plan has foods to spread across the days."""
+    return PLAN_FOODS
+
+
+@pytest.fixture
+def meal_plan_jobs():
+    """Shut the app's meal plan workers down after the test."""
+    yield
+    if app_module._meal_plan_jobs is not None:
+        app_module._meal_plan_jobs.shutdown()
+        app_module._meal_plan_jobs = None
+
+
+def random_catalog(rng, n):
+    return [Food(i + 1, f'Food {i}', rng.randint(50, 500), rng.randint(0, 40)) for i in range(n)]
+
+
+def poll(client, url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        response = client.get(url)
+        if response.get_json()['status'] != 'pending':
+            return response
+        time.sleep(0.05)
+    raise AssertionError(f"{url} still pending after {timeout}s")
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_plan_days_match_fresh_frontiers(seed):
+    """Test that each day is the suggestion a fresh frontier gives for the foods left, within the repeat limit."""
+    rng = random.Random(seed)
+    foods = random_catalog(rng, rng.randint(5, 25))
+    plan = plan_meals(foods, 1800, 90, days=7, max_repeats=2)
+    assert len(plan) == 7
+    used = {}
+    for day in plan:
+        available = [food for food in foods if used.get(food.id, 0) < 2]
+        frontier = Frontier(available, 1800, 90)
+        expected = frontier.hit_both()
+        assert day.foods == (expected if expected is not None else frontier.closest())
+        assert day.mode == ('hit_both' if expected is not None else 'closest')
+        assert day.total_calories == sum(food.calories for food in day.foods)
+        for food in day.foods:
+            used[food.id] = used.get(food.id, 0) + 1
+    assert max(used.values(), default=0) <= 2
+
+def test_plan_reuses_catalog_state():
+    """Test that a plan given the list's state builds its tables from it."""
+    rng = random.Random(3)
+    foods = random_catalog(rng, 250)  # too many foods for the subset search
+    state = CatalogState(foods)
+    assert plan_meals(foods, 1500, 80, state=state) == plan_meals(foods, 1500, 80)
+    assert state.capacity >= 1500
+
+def test_plan_cancelled_between_days():
+    """Test that a set cancel event stops the plan before the next day."""
+    foods = random_catalog(random.Random(1), 10)
+    with pytest.raises(PlanCancelled, match='after 2 of 7 days'):
+        plan_meals(foods, 1800, 90, cancel=CancelAfter(2))
+    cancelled = threading.Event()
+    cancelled.set()
+    with pytest.raises(PlanCancelled):
+        plan_meals(foods, 1800, 90, cancel=cancelled)
+
+def test_meal_plan_route(client, app, quick_add_foods, meal_plan_jobs):
+    """Test that a plan is dated from tomorrow, keeps to the repeat limit and has food ids to log."""
+    response = client.post('/meal_plan', data={'days': '5', 'max_repeats': '2'}, headers=AJAX)
+    assert response.status_code == 202
+    submitted = response.get_json()
+    data = poll(client, submitted['poll_url']).get_json()
+    assert data['status'] == 'done'
+    plan = data['plan']
+    assert len(plan['days']) == 5
+    tomorrow = app_module.get_local_date() + app_module.timedelta(days=1)
+    assert plan['days'][0]['date'] == tomorrow.isoformat()
+    counts = {}
+    for day in plan['days']:
+        assert day['mode'] in ('hit_both', 'closest')
+        for food in day['foods']:
+            counts[food['food_id']] = counts.get(food['food_id'], 0) + 1
+    assert counts and max(counts.values()) <= 2
+
+def test_meal_plan_needs_five_foods(client, auth):
+    """Test that planning needs a quick add list, like recommendations."""
+    auth.login()
+    assert client.post('/meal_plan', headers=AJAX).get_json()['insufficient_foods'] is True
+
+def test_cancel_meal_plan(client, app, quick_add_foods, meal_plan_jobs):
+    """Test that a plan waiting behind another can be cancelled, and then reports so."""
+    jobs = app_module.get_meal_plan_jobs()
+    release = threading.Event()
+    jobs.submit(0, 'blocker', release.wait)  # hold the only worker
+    try:
+        submitted = client.post('/meal_plan', headers=AJAX).get_json()
+        response = client.post(submitted['cancel_url'], headers=AJAX)
+        assert response.get_json()['success'] is True
+    finally:
+        release.set()
+    assert poll(client, submitted['poll_url']).get_json()['status'] == 'cancelled'
+    # A finished plan can't be cancelled
+    assert client.post(submitted['cancel_url'], headers=AJAX).status_code == 404
+    assert jobs.stats()['cancelled'] == 1
+
+def test_log_meal_plan(client, app, quick_add_foods):
+    """Test that a planned day's foods are logged on its date in one request."""
+    conn = sqlite3.connect(app_module.DB_PATH)
+    food_ids = [row[0] for row in conn.execute("SELECT id FROM foods WHERE name IN ('Oats', 'Tuna') ORDER BY id")]
+    conn.close()
+    response = client.post('/log_meal_plan', data={'date': '2030-01-02', 'food_id[]': food_ids,
+                                                   'servings[]': ['1', '2']}, headers=AJAX)
+    data = response.get_json()
+    assert data['success'] is True and data['logged'] == 2
+    assert data['totals'] == {'date': '2030-01-02', 'calories': 150 + 240, 'protein': 5 + 52,
+                              'carbs': 0, 'fat': 0}
+
+    conn = sqlite3.connect(app_module.DB_PATH)
+    rows = conn.execute("SELECT food_name, calories FROM daily_log WHERE date = '2030-01-02' ORDER BY id").fetchall()
+    conn.close()
+    assert rows == [('Oats', 150), ('Tuna', 240)]
+
+def test_log_meal_plan_rejects_bad_input(client, app, quick_add_foods):
+    """Test that logging a plan needs a valid date and the user's own foods."""
+    assert client.post('/log_meal_plan', data={'date': 'soon', 'food_id[]': [1]}, headers=AJAX).status_code == 400
+    assert client.post('/log_meal_plan', data={'date': '2030-01-02'}, headers=AJAX).status_code == 400
+    response = client.post('/log_meal_plan', data={'date': '2030-01-02', 'food_id[]': [99999]}, headers=AJAX)
+    assert response.status_code == 404
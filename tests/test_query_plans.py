@@ -0,0 +1,107 @@
+import pytest
+import sqlite3
+import logging
+import sys
+import os
+
+# Add the parent directory to sys.path to import app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import app as app_module
+from db import ConnectionPool, MIGRATIONS, migrate, schema_version
+from conftest import AJAX
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+@pytest.fixture
+def traced_statements(app, monkeypatch):
+    """Record every SQL statement the app runs on pooled connections."""
+    statements = []
+    original_connect = ConnectionPool._connect
+
+    def tracing_connect(self):
+        conn = original_connect(self)
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    monkeypatch.setattr(ConnectionPool, '_connect', tracing_connect)
+    # Drop connections opened before the patch so every query goes through a traced one
+    app_module.close_db()
+    with app.app_context():
+        app_module.get_database().close()
+    app_module._database = None
+    return statements
+
+
+def exercise_routes(client, auth, app):
+    """Hit every route that touches the database for one user and one day."""
+    auth.login()
+    for i in range(5):
+        client.post('/quick_add_food', data={'name': f'Food {i}', 'calories': str(100 * (i + 1)),
+                                              'protein': str(10 * (i + 1))}, headers=AJAX)
+    client.get('/dashboard')
+    client.get('/api/dashboard-stats')
+    log_id = client.post('/log_food', data={'name': 'Eggs', 'calories': '150', 'protein': '12',
+                                            'servings': '1'}, headers=AJAX).get_json()['log_entry']['id']
+    foods = app.config['DB_CONNECTION'].execute("SELECT id FROM foods ORDER BY id").fetchall()
+    client.post('/log_quick_food', data={'food_id': foods[0][0]}, headers=AJAX)
+    client.post('/get_recommendations', headers=AJAX)
+    client.post(f'/remove_food/{log_id}', headers=AJAX)
+    client.post('/save_summary', headers=AJAX)
+    today = app_module.get_local_date().isoformat()
+    client.get(f'/edit_history?date={today}', headers=AJAX)
+    client.post('/update_history', data={'edit_date': today, 'existing_food_id[]': [],
+                                         'new_food_name[]': ['Toast'], 'new_food_calories[]': ['90'],
+                                         'new_food_protein[]': ['3']})
+    client.post('/update_settings', data={'calorie_goal': '2100', 'protein_goal': '120',
+                                          'current_weight': '80'}, headers=AJAX)
+    client.get('/settings')
+    client.get('/history')
+    client.get('/export_csv')
+    client.post('/remove_quick_add_food', data={'food_id': foods[1][0]}, headers=AJAX)
+
+
+def test_migrations_record_user_version(app):
+    """Test that the test database is migrated to the latest schema version."""
+    conn = app.config['DB_CONNECTION']
+    assert schema_version(conn) == MIGRATIONS[-1][0]
+    # Running again is a no-op
+    assert migrate(conn) == MIGRATIONS[-1][0]
+
+def test_migrate_from_empty_database(tmp_path, app):
+    """Test that init_db creates the schema and applies every migration."""
+    db_path = str(tmp_path / 'fresh.db')
+    original_db_path = app_module.DB_PATH
+    app_module.DB_PATH = db_path
+    try:
+        app_module.init_db()
+    finally:
+        app_module.DB_PATH = original_db_path
+
+    conn = sqlite3.connect(db_path)
+    assert schema_version(conn) == MIGRATIONS[-1][0]
+    indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert 'idx_daily_log_user_date' in indexes
+    assert 'idx_weight_logs_user_date_unique' in indexes
+    conn.close()
+
+def test_hot_queries_use_indexes(client, auth, app, traced_statements):
+    """Test that no query the routes run falls back to a full table SCAN."""
+    exercise_routes(client, auth, app)
+
+    checked = 0
+    conn = app.config['DB_CONNECTION']
+    for sql in traced_statements:
+        keyword = sql.lstrip().split(None, 1)[0].upper()
+        if keyword not in ('SELECT', 'UPDATE', 'DELETE', 'INSERT'):
+            continue
+        plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+        details = [row[3] for row in plan]
+        logger.debug(f"{sql!r} -> {details}")
+        assert not any(detail.startswith('SCAN') for detail in details), f"Full scan in {sql!r}: {details}"
+        checked += 1
+
+    # Make sure the routes actually ran their queries
+    assert checked > 30
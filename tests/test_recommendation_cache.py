@@ -0,0 +1,150 @@
+import pytest
+import sqlite3
+import sys
+import os
+
+# Add the parent directory to sys.path to import app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import app as app_module
+import recommender
+from recommendation_cache import RecommendationCache
+from conftest import AJAX, TEST_FOODS
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def cache_stats(client):
+    return client.get('/api/recommendation-cache-stats').get_json()
+
+
+def test_cache_hit_and_lru_eviction():
+    """Test that the least recently used entry is evicted once the cache is full."""
+    cache = RecommendationCache(max_entries=2, ttl=60)
+    a, b, c = (cache.key(user_id, {'Oats'}, 500, 40) for user_id in (1, 2, 3))
+    cache.put(a, 'A')
+    cache.put(b, 'B')
+    assert cache.get(a) == 'A'  # a is now the most recently used
+    cache.put(c, 'C')
+    assert cache.get(b) is None
+    assert cache.get(a) == 'A' and cache.get(c) == 'C'
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['hits'] == 3 and cache.stats()['misses'] == 1
+
+def test_cache_entries_expire():
+    """Test that an entry older than the TTL is a miss."""
+    clock = FakeClock()
+    cache = RecommendationCache(ttl=10, clock=clock)
+    key = cache.key(1, set(), 500, 40)
+    cache.put(key, 'A')
+    clock.now = 9.9
+    assert cache.get(key) == 'A'
+    clock.now = 10
+    assert cache.get(key) is None
+    assert cache.stats()['expirations'] == 1
+
+def test_invalidate_drops_user_entries_only():
+    """Test that invalidating one user keeps other users' entries and changes the user's keys."""
+    cache = RecommendationCache()
+    mine, theirs = cache.key(1, set(), 500, 40), cache.key(2, set(), 500, 40)
+    cache.put(mine, 'mine')
+    cache.put(theirs, 'theirs')
+    cache.invalidate(1)
+    assert cache.get(mine) is None
+    assert cache.get(theirs) == 'theirs'
+    assert cache.key(1, set(), 500, 40) != mine
+
+def test_result_computed_before_a_write_is_not_cached():
+    """Test that a result whose key predates an invalidation is dropped instead of stored."""
+    cache = RecommendationCache()
+    key = cache.key(1, set(), 500, 40)
+    cache.invalidate(1)  # a write lands while the result is being computed
+    cache.put(key, 'stale')
+    assert cache.stats()['entries'] == 0
+
+def test_repeated_request_hits_cache(client, app, quick_add_foods):
+    """Test that pressing "Show recommendations" twice with nothing changed runs the solver once."""
+    calls = []
+    original = recommender.recommend
+    recommender.recommend = lambda *args, **kwargs: calls.append(args) or original(*args, **kwargs)
+    try:
+        first = client.post('/get_recommendations', headers=AJAX).get_json()
+        second = client.post('/get_recommendations', headers=AJAX).get_json()
+    finally:
+        recommender.recommend = original
+    assert first == second
+    assert len(calls) == 1
+    stats = cache_stats(client)
+    assert stats['enabled'] is True
+    assert (stats['hits'], stats['misses']) == (1, 1)
+
+def test_quick_add_while_loading_is_not_served_stale(client, app, quick_add_foods, monkeypatch):
+    """Test that a food added between loading the list and solving doesn't leave the old answer cached."""
+    load_day_data = app_module.load_day_data
+
+    def load_then_quick_add(*args):
+        day = load_day_data(*args)
+        monkeypatch.setattr(app_module, 'load_day_data', load_day_data)
+        # What quick_add_food does, landing after this request read the list
+        conn = app_module.get_db()
+        conn.execute("INSERT INTO foods (name, calories, protein, user_id) VALUES ('Whey Isolate', 100, 90, 1)")
+        conn.commit()
+        app_module.invalidate_recommendations(1)
+        return day
+
+    monkeypatch.setattr(app_module, 'load_day_data', load_then_quick_add)
+    before = client.post('/get_recommendations', headers=AJAX).get_json()
+    assert before['calorie_first']['total_protein'] == sum(protein for _, _, protein in TEST_FOODS)
+
+    after = client.post('/get_recommendations', headers=AJAX).get_json()
+    assert 'Whey Isolate' in [food['name'] for food in after['calorie_first']['foods']]
+    assert cache_stats(client)['hits'] == 0
+
+@pytest.mark.parametrize('write', ['quick_add_food', 'log_food', 'log_quick_food', 'remove_food',
+                                   'remove_quick_add_food', 'update_settings'])
+def test_writes_invalidate_cache(client, app, quick_add_foods, write):
+    """Test that each route that changes foods, the log or goals drops cached recommendations."""
+    client.post('/log_food', data={'name': 'Rice', 'calories': '200', 'protein': '4', 'servings': '1'},
+                headers=AJAX)
+    client.post('/get_recommendations', headers=AJAX)
+    invalidations = cache_stats(client)['invalidations']
+
+    conn = sqlite3.connect(app_module.DB_PATH)
+    food_id = conn.execute("SELECT id FROM foods WHERE name = 'Oats'").fetchone()[0]
+    log_id = conn.execute("SELECT id FROM daily_log WHERE food_name = 'Rice'").fetchone()[0]
+    conn.close()
+    requests = {
+        'quick_add_food': ('/quick_add_food', {'name': 'Tofu', 'calories': 90, 'protein': 10}),
+        'log_food': ('/log_food', {'name': 'Tofu', 'calories': '90', 'protein': '10', 'servings': '1'}),
+        'log_quick_food': ('/log_quick_food', {'food_id': food_id}),
+        'remove_food': (f'/remove_food/{log_id}', {}),
+        'remove_quick_add_food': ('/remove_quick_add_food', {'food_id': food_id}),
+        'update_settings': ('/update_settings', {'calorie_goal': 1800, 'protein_goal': 120}),
+    }
+    url, data = requests[write]
+    assert client.post(url, data=data, headers=AJAX).status_code == 200
+
+    assert cache_stats(client)['invalidations'] == invalidations + 1
+    client.post('/get_recommendations', headers=AJAX)
+    stats = cache_stats(client)
+    assert stats['hits'] == 0
+    assert stats['misses'] == 2
+
+def test_cache_can_be_disabled(client, app, quick_add_foods):
+    """Test that a cache size of 0 recomputes every request."""
+    app.config['RECOMMENDATION_CACHE_SIZE'] = 0
+    app_module._recommendation_cache = None
+    try:
+        client.post('/get_recommendations', headers=AJAX)
+        client.post('/get_recommendations', headers=AJAX)
+        stats = cache_stats(client)
+    finally:
+        app.config['RECOMMENDATION_CACHE_SIZE'] = app_module.DEFAULT_CACHE_SIZE
+        app_module._recommendation_cache = None
+    assert stats['enabled'] is False
+    assert (stats['hits'], stats['misses']) == (0, 2)
@@ -0,0 +1,131 @@
+import pytest
+import threading
+import time
+import sys
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Add the parent directory to sys.path to import app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import app as app_module
+from recommendation_jobs import JobQueueFull, RecommendationJobs
+from conftest import AJAX
+
+
+@pytest.fixture
+def jobs():
+    """A job pool on threads, so tests can hold jobs open."""
+    pool = RecommendationJobs(max_workers=2, max_pending=2, executor=ThreadPoolExecutor(2))
+    yield pool
+    pool.shutdown()
+
+
+@pytest.fixture
+def process_pool():
+    """Shut the app's worker processes down after the test."""
+    yield
+    if app_module._recommendation_jobs is not None:
+        app_module._recommendation_jobs.shutdown()
+        app_module._recommendation_jobs = None
+
+
+def poll(client, url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        response = client.get(url)
+        if response.get_json()['status'] != 'pending':
+            return response
+        time.sleep(0.05)
+    raise AssertionError(f"{url} still pending after {timeout}s")
+
+
+def test_identical_in_flight_jobs_are_deduplicated(jobs):
+    """Test that the same work for the same user joins the running job, but not another user's."""
+    release = threading.Event()
+    first = jobs.submit(1, 'key', release.wait)
+    assert jobs.submit(1, 'key', release.wait) == first
+    other_user = jobs.submit(2, 'key', release.wait)
+    assert other_user != first
+    release.set()
+    jobs.get(1, first).future.result(timeout=5)
+    jobs.get(2, other_user).future.result(timeout=5)
+    # Once finished, the same work starts a new job
+    assert jobs.submit(1, 'key', release.wait) != first
+    assert jobs.stats()['deduplicated'] == 1
+
+def test_pending_jobs_are_bounded(jobs):
+    """Test that submissions beyond max_pending are rejected until a job finishes."""
+    release = threading.Event()
+    jobs.submit(1, 'a', release.wait)
+    jobs.submit(1, 'b', release.wait)
+    with pytest.raises(JobQueueFull):
+        jobs.submit(1, 'c', release.wait)
+    release.set()
+    for job in list(jobs._jobs.values()):
+        job.future.result(timeout=5)
+    jobs.submit(1, 'c', release.wait)
+    assert jobs.stats()['rejected'] == 1
+
+def test_jobs_are_private_to_their_user(jobs):
+    """Test that one user can't read another user's job."""
+    job_id = jobs.submit(1, 'key', sum, [1, 2])
+    assert jobs.get(2, job_id) is None
+    assert jobs.get(1, job_id).future.result(timeout=5) == 3
+
+def test_async_recommendations_match_sync(client, app, quick_add_foods, process_pool):
+    """Test that an async request returns a job whose result is the synchronous response."""
+    expected = client.post('/get_recommendations', headers=AJAX).get_json()
+    app_module.get_recommendation_cache().clear()
+
+    response = client.post('/get_recommendations', data={'async': '1'}, headers=AJAX)
+    assert response.status_code == 202
+    submitted = response.get_json()
+    assert submitted['status'] == 'pending'
+
+    data = poll(client, submitted['poll_url']).get_json()
+    assert data.pop('status') == 'done'
+    assert data.pop('job_id') == submitted['job_id']
+    assert data == expected
+
+    # The finished job filled the cache, so asking again answers straight away
+    again = client.post('/get_recommendations', data={'async': '1'}, headers=AJAX)
+    assert again.status_code == 200 and again.get_json()['status'] == 'done'
+
+def test_unknown_job_is_404(client, auth):
+    """Test that polling a job that doesn't exist is a 404."""
+    auth.login()
+    response = client.get('/recommendation_jobs/nope')
+    assert response.status_code == 404
+    assert response.get_json()['status'] == 'missing'
+
+def test_cancelled_job_polls_as_cancelled(client, app, quick_add_foods, process_pool):
+    """Test that polling a job cancelled before it ran reports it instead of failing."""
+    release = threading.Event()
+    app_module._recommendation_jobs = RecommendationJobs(1, 4, executor=ThreadPoolExecutor(1))
+    app_module._recommendation_jobs.submit(1, 'busy', release.wait)  # holds the only worker
+    try:
+        submitted = client.post('/get_recommendations', data={'async': '1'}, headers=AJAX).get_json()
+        assert app_module._recommendation_jobs.get(1, submitted['job_id']).future.cancel()
+        response = client.get(submitted['poll_url'])
+    finally:
+        release.set()
+    assert response.status_code == 200
+    assert response.get_json() == {'status': 'cancelled', 'job_id': submitted['job_id']}
+
+def test_cancel_running_job(jobs):
+    """Test that a running job is asked to stop through its cancel event, and only by its user."""
+    release, started = threading.Event(), threading.Event()
+    running_cancel = threading.Event()
+
+    def run():
+        started.set()
+        release.wait()
+        return running_cancel.is_set()
+
+    running = jobs.submit(1, 'running', run, cancel_event=running_cancel)
+    started.wait(timeout=5)
+    assert jobs.cancel(2, running) is False  # not their job
+    assert jobs.cancel(1, running) is True
+    release.set()
+    assert jobs.get(1, running).future.result(timeout=5) is True
+    assert jobs.cancel(1, 'nope') is False
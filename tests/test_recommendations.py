@@ -0,0 +1,154 @@
+import pytest
+import re
+import sys
+import os
+
+# Add the parent directory to sys.path to import app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import app as app_module
+import recommender
+from conftest import AJAX, TEST_FOODS
+
+
+def test_recommendations_read_each_table_once(client, app, quick_add_foods):
+    """Test that get_recommendations reads daily_log, foods and daily_totals exactly once each."""
+    client.post('/log_food', data={'name': 'Oats', 'calories': '150', 'protein': '5', 'servings': '1'},
+                headers=AJAX)
+
+    statements = []
+    conn = app_module.get_read_db()
+    conn.set_trace_callback(statements.append)
+    try:
+        response = client.post('/get_recommendations', headers=AJAX)
+    finally:
+        conn.set_trace_callback(None)
+    assert response.status_code == 200
+
+    reads = {}
+    for sql in statements:
+        match = re.search(r'\bFROM\s+(\w+)', sql)
+        if sql.lstrip().upper().startswith('SELECT') and match:
+            reads[match.group(1)] = reads.get(match.group(1), 0) + 1
+    # users may be read once by the login manager; everything else exactly once
+    reads.pop('users', None)
+    assert reads == {'daily_log': 1, 'foods': 1, 'daily_totals': 1}
+
+def test_recommendations_skip_eaten_foods(client, app, quick_add_foods):
+    """Test that foods already logged today are never recommended."""
+    client.post('/log_food', data={'name': 'Chicken Breast', 'calories': '165', 'protein': '31',
+                                   'servings': '1'}, headers=AJAX)
+    data = client.post('/get_recommendations', headers=AJAX).get_json()
+    for mode in ('hit_both', 'protein_first', 'calorie_first'):
+        if data[mode]:
+            assert 'Chicken Breast' not in [food['name'] for food in data[mode]['foods']]
+            assert data[mode]['day_total_calories'] == 165 + data[mode]['total_calories']
+
+def test_recommendations_need_five_foods(client, auth):
+    """Test that users with fewer than five quick add foods are told to add more."""
+    auth.login()
+    client.post('/quick_add_food', data={'name': 'Oats', 'calories': 150, 'protein': 5}, headers=AJAX)
+    data = client.post('/get_recommendations', headers=AJAX).get_json()
+    assert data['insufficient_foods'] is True
+    assert 'You currently have 1 food.' in data['message']
+
+def test_recommendations_include_closest(client, app, quick_add_foods):
+    """Test that the response carries the closest-to-both-goals suggestion alongside the original three."""
+    data = client.post('/get_recommendations', headers=AJAX).get_json()
+    assert set(data) == {'hit_both', 'protein_first', 'calorie_first', 'closest'}
+    assert data['closest']['foods']
+    assert data['closest']['total_calories'] == sum(food['calories'] for food in data['closest']['foods'])
+
+def test_recommendations_approximate(client, app, quick_add_foods):
+    """Test that an approximate request reports its granularity and bound alongside the usual modes."""
+    data = client.post('/get_recommendations', data={'approximate': '1', 'granularity': '25'},
+                       headers=AJAX).get_json()
+    assert data['approximation'] == {'granularity': 25, 'max_extra_calories_per_food': 24}
+    assert set(data) == {'hit_both', 'protein_first', 'calorie_first', 'closest', 'approximation'}
+    # The whole list fits in 2,000 kcal, bucketed or not
+    assert data['calorie_first']['total_protein'] == sum(protein for _, _, protein in TEST_FOODS)
+
+def test_recommendations_multiple_servings(client, app, quick_add_foods):
+    """Test that max_servings allows repeated half servings and reports them per food."""
+    data = client.post('/get_recommendations', data={'max_servings': '3'}, headers=AJAX).get_json()
+    foods = data['calorie_first']['foods']
+    assert any(food['servings'] > 1 for food in foods)
+    assert all(food['servings'] <= 3 and (food['servings'] * 2).is_integer() for food in foods)
+    assert data['calorie_first']['total_calories'] <= 2000
+    single = client.post('/get_recommendations', headers=AJAX).get_json()
+    assert all(food['servings'] == 1 for food in single['calorie_first']['foods'])
+
+def test_recommendations_deadline(client, app, quick_add_foods, monkeypatch):
+    """Test that deadline_ms reports how the answer was found, falling back to greedy when time is short."""
+    data = client.post('/get_recommendations', data={'deadline_ms': '10000'}, headers=AJAX).get_json()
+    assert data['solver']['method'] == 'exact' and data['solver']['exact'] is True
+    assert data['solver']['gap'] == 0
+    assert data['solver']['pruned'] >= 0
+
+    # Pretend every DP cell takes a second, so only the greedy answer fits
+    monkeypatch.setattr(recommender, 'seconds_per_cell', lambda backend='auto': 1.0)
+    for _ in range(2):
+        data = client.post('/get_recommendations', data={'deadline_ms': '50'}, headers=AJAX).get_json()
+        assert data['solver']['method'] == 'greedy' and data['solver']['exact'] is False
+        assert data['calorie_first']['total_calories'] <= 2000
+    # Best-effort answers are recomputed rather than served from the cache
+    assert client.get('/api/recommendation-cache-stats').get_json()['hits'] == 0
+
+def test_recommendations_top_k_alternatives(client, app, quick_add_foods):
+    """Test that k returns the best suggestion plus up to k - 1 distinct, no better alternatives per mode."""
+    single = client.post('/get_recommendations', headers=AJAX).get_json()
+    data = client.post('/get_recommendations', data={'k': '3'}, headers=AJAX).get_json()
+    calorie_first = data['calorie_first']
+    assert calorie_first['total_protein'] == single['calorie_first']['total_protein']
+    assert len(calorie_first['alternatives']) == 2
+    suggestions = [calorie_first] + calorie_first['alternatives']
+    assert len({tuple(sorted(food['name'] for food in s['foods'])) for s in suggestions}) == 3
+    assert [s['total_protein'] for s in suggestions] == sorted((s['total_protein'] for s in suggestions),
+                                                               reverse=True)
+    assert all(s['total_calories'] <= 2000 for s in suggestions)
+
+    # k is capped, and the default stays a single suggestion
+    data = client.post('/get_recommendations', data={'k': '99'}, headers=AJAX).get_json()
+    assert len(data['closest']['alternatives']) <= app.config['RECOMMENDER_MAX_K'] - 1
+    assert 'alternatives' not in client.post('/get_recommendations', headers=AJAX).get_json()['closest']
+
+def test_recommendations_check_hit_both_first(client, app, quick_add_foods, monkeypatch):
+    """Test that get_recommendations runs the hit_both pre-check and skips the reconstruction it rules out."""
+    checks, reconstructions = [], []
+    feasible, hit_both = recommender.hit_both_feasible, recommender.MODES['hit_both']
+    monkeypatch.setattr(recommender, 'hit_both_feasible', lambda *args: checks.append(feasible(*args)) or checks[-1])
+    monkeypatch.setitem(recommender.MODES, 'hit_both',
+                        lambda frontier: reconstructions.append(frontier) or hit_both(frontier))
+
+    # The whole list has 82 g protein, short of the default 100 g goal
+    data = client.post('/get_recommendations', headers=AJAX).get_json()
+    assert checks == [False] and reconstructions == []
+    assert data['hit_both'] is None
+    assert data['calorie_first']['total_protein'] == sum(protein for _, _, protein in TEST_FOODS)
+
+    # After a 40 g steak off the list, 60 g more fits, so the reconstruction runs
+    client.post('/log_food', data={'name': 'Steak', 'calories': '300', 'protein': '40', 'servings': '1'},
+                headers=AJAX)
+    data = client.post('/get_recommendations', headers=AJAX).get_json()
+    assert checks == [False, True] and len(reconstructions) == 1
+    assert data['hit_both']['total_protein'] >= 60
+
+@pytest.mark.parametrize('value', ['nan', 'inf', '-inf', '-2', '0'])
+def test_recommendations_ignore_bad_servings_and_deadlines(client, app, quick_add_foods, value):
+    """Test that max_servings and deadline_ms that aren't finite and positive are ignored rather than a 500."""
+    single = client.post('/get_recommendations', headers=AJAX).get_json()
+    response = client.post('/get_recommendations', data={'max_servings': value, 'deadline_ms': value}, headers=AJAX)
+    assert response.status_code == 200
+    data = response.get_json()
+    assert 'solver' not in data
+    assert data['calorie_first'] == single['calorie_first']
+
+def test_recommendations_cap_servings_and_deadlines(client, app, quick_add_foods, monkeypatch):
+    """Test that max_servings and deadline_ms are capped at their configured limits, like k."""
+    seen = {}
+    monkeypatch.setattr(app_module, 'food_recommendation',
+                        lambda day, **options: seen.update(options) or (
+                            {mode: [] for mode in ('hit_both', 'protein_first', 'calorie_first', 'closest')},
+                            recommender.Solve('exact', True, 1, 0.0, 0.0)))
+    client.post('/get_recommendations', data={'max_servings': '1e9', 'deadline_ms': '1e12'}, headers=AJAX)
+    assert seen['max_servings'] == app.config['RECOMMENDER_SERVINGS_LIMIT']
+    assert seen['deadline_ms'] == app.config['RECOMMENDER_DEADLINE_LIMIT_MS']
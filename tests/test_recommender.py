@@ -0,0 +1,522 @@
+import itertools
+import pytest
+import random
+import sys
+import os
+
+# Add the parent directory to sys.path to import app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import recommender
+from recommender import (CatalogState, Food, Frontier, KnapsackTable, choose_granularity, knapsack_backend,
+                         min_calories_for_protein, recommend, reference_recommend, split_servings,
+                         anytime_recommend, fractional_bound, greedy_recommend, SubsetSearchTable,
+                         select_table_class, hit_both_feasible, prune_foods, KBestTable, top_k_recommend)
+
+ORIGINAL_MODES = ('hit_both', 'protein_first', 'calorie_first')
+
+
+def random_catalog(rng, n, max_calories=400, max_protein=40):
+    """A quick add list with plenty of ties, duplicates and zero-calorie or zero-protein foods."""
+    return [Food(i + 1, f'Food {i}', rng.choice([0, rng.randint(1, max_calories)]) if i % 7 == 0
+                 else rng.randint(1, max_calories), rng.randint(0, max_protein))
+            for i in range(n)]
+
+
+@pytest.fixture(params=['python', 'numpy'])
+def backend(request):
+    """Run a test against each knapsack backend, skipping NumPy when it isn't installed."""
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    return request.param
+
+
+@pytest.mark.parametrize('seed', range(40))
+def test_recommend_matches_full_table(seed, backend):
+    """Test that each backend recommends exactly what the original full-table DP did."""
+    rng = random.Random(seed)
+    foods = random_catalog(rng, rng.randint(0, 14))
+    remaining_calories = rng.randint(0, 1200)
+    remaining_protein = rng.randint(0, 150)
+    assert recommend(foods, remaining_calories, remaining_protein, backend=backend, modes=ORIGINAL_MODES) == \
+        reference_recommend(foods, remaining_calories, remaining_protein)
+
+def test_recommend_ties_keep_earlier_foods():
+    """Test that equally good choices resolve the same way as the full table did."""
+    foods = [Food(1, 'A', 100, 10), Food(2, 'B', 100, 10), Food(3, 'C', 200, 20)]
+    result = recommend(foods, 200, 20, modes=ORIGINAL_MODES)
+    assert result == reference_recommend(foods, 200, 20)
+    assert [food.name for food in result['calorie_first']] == ['B', 'A']
+
+def test_knapsack_table_best_by_budget():
+    """Test the best protein for every budget and the foods recovered for one."""
+    foods = [Food(1, 'Eggs', 3, 4), Food(2, 'Tuna', 4, 5), Food(3, 'Rice', 2, 3)]
+    table = KnapsackTable(foods, 7)
+    assert table.best == [0, 0, 3, 4, 5, 7, 8, 9]
+    assert sorted(food.name for food in table.choose(7)) == ['Eggs', 'Tuna']
+    assert sorted(food.name for food in table.choose(6)) == ['Rice', 'Tuna']
+    assert table.choose(0) == []
+
+def test_recommend_goals_already_met():
+    """Test that nothing left to eat still gives the original empty suggestions."""
+    foods = [Food(1, 'Oats', 150, 5), Food(2, 'Shake', 120, 24)]
+    assert recommend(foods, 0, 0) == {'hit_both': [], 'protein_first': [], 'calorie_first': [], 'closest': []}
+
+def test_numpy_table_matches_python_table():
+    """Test that the NumPy backend fills the same best row and take bits as pure Python."""
+    pytest.importorskip('numpy')
+    rng = random.Random(7)
+    foods = random_catalog(rng, 30)
+    python_table = KnapsackTable(foods, 2500)
+    numpy_table = knapsack_backend('numpy')(foods, 2500)
+    assert list(numpy_table.best) == python_table.best
+    for budget in range(0, 2501, 50):
+        assert numpy_table.choose(budget) == python_table.choose(budget)
+
+def test_backend_falls_back_without_numpy(monkeypatch):
+    """Test that 'auto' uses pure Python when NumPy isn't available and 'numpy' is rejected."""
+    monkeypatch.delitem(recommender.KNAPSACK_BACKENDS, 'numpy', raising=False)
+    assert knapsack_backend('auto') is KnapsackTable
+    with pytest.raises(ValueError):
+        knapsack_backend('numpy')
+    foods = [Food(1, 'Oats', 150, 5), Food(2, 'Shake', 120, 24)]
+    assert recommend(foods, 200, 20, modes=ORIGINAL_MODES) == reference_recommend(foods, 200, 20)
+
+def test_unknown_backend_rejected():
+    """Test that a misspelled backend name is an error rather than a silent fallback."""
+    with pytest.raises(ValueError):
+        knapsack_backend('fortran')
+
+def test_min_calories_for_protein():
+    """Test the protein-indexed DP that bounds the frontier's width."""
+    foods = [Food(1, 'Shake', 120, 24), Food(2, 'Chicken', 165, 31), Food(3, 'Rice', 200, 4)]
+    assert min_calories_for_protein(foods, 0) == 0
+    assert min_calories_for_protein(foods, 24) == 120
+    assert min_calories_for_protein(foods, 30) == 165
+    assert min_calories_for_protein(foods, 55) == 285
+    assert min_calories_for_protein(foods, 60) is None
+
+def test_frontier_is_narrower_than_separate_tables():
+    """Test that one frontier fills fewer DP cells than the whole-catalog protein_first table did."""
+    rng = random.Random(3)
+    foods = random_catalog(rng, 40)
+    frontier = Frontier(foods, 800, 60)
+    assert frontier.width < sum(food.calories for food in foods)
+    assert frontier.cells < len(foods) * (sum(food.calories for food in foods) + 1)
+
+def test_frontier_points_are_pareto_optimal():
+    """Test that every frontier point buys strictly more protein with strictly more calories."""
+    foods = [Food(1, 'Eggs', 3, 4), Food(2, 'Tuna', 4, 5), Food(3, 'Rice', 2, 3)]
+    points = Frontier(foods, 7, 9, backend='python').points()
+    assert points == [(0, 0), (2, 3), (3, 4), (4, 5), (5, 7), (6, 8), (7, 9)]
+
+def test_closest_balances_both_goals(backend):
+    """Test that closest prefers a near miss on both goals over overshooting calories."""
+    foods = [Food(1, 'Steak', 700, 60), Food(2, 'Salad', 250, 8), Food(3, 'Yogurt', 150, 17),
+             Food(4, 'Nuts', 300, 9), Food(5, 'Cookie', 200, 2)]
+    result = recommend(foods, 400, 30, backend=backend)
+    # Nothing within 400 kcal reaches 30 g, so hit_both is empty and protein_first overshoots to the steak
+    assert result['hit_both'] is None
+    assert [food.name for food in result['protein_first']] == ['Steak']
+    assert sorted(food.name for food in result['closest']) == ['Salad', 'Yogurt']
+
+@pytest.mark.parametrize('seed', range(20))
+def test_closest_is_best_pareto_option(seed):
+    """Test closest against brute force over every Pareto-optimal subset of a small catalog."""
+    from itertools import combinations
+    rng = random.Random(seed)
+    foods = [Food(i, f'Food {i}', rng.randint(1, 400), rng.randint(0, 40)) for i in range(8)]
+    remaining_calories, remaining_protein = rng.randint(1, 1200), rng.randint(1, 150)
+
+    def totals(subset):
+        return sum(food.calories for food in subset), sum(food.protein for food in subset)
+
+    def miss(subset):
+        calories, protein = totals(subset)
+        return (abs(calories - remaining_calories) / remaining_calories
+                + max(0, remaining_protein - protein) / remaining_protein)
+
+    subsets = [subset for r in range(len(foods) + 1) for subset in combinations(foods, r)]
+    options = {totals(subset) for subset in subsets}
+    # Pareto-optimal: no other subset has at least as much protein for fewer calories
+    pareto = [subset for subset in subsets
+              if not any(protein >= totals(subset)[1] and calories < totals(subset)[0]
+                         for calories, protein in options)]
+    best = min(miss(subset) for subset in pareto)
+    assert miss(recommend(foods, remaining_calories, remaining_protein)['closest']) == pytest.approx(best)
+
+@pytest.mark.parametrize('seed', range(30))
+def test_approximate_stays_within_bound(seed, backend):
+    """Test the approximate frontier's stated error bound against the exact solver."""
+    rng = random.Random(seed)
+    foods = random_catalog(rng, rng.randint(0, 25), max_calories=600, max_protein=45)
+    remaining_calories, remaining_protein = rng.randint(0, 3000), rng.randint(0, 200)
+    granularity = rng.randint(2, 40)
+    exact = recommend(foods, remaining_calories, remaining_protein, backend=backend)
+    approx = recommend(foods, remaining_calories, remaining_protein, backend=backend, granularity=granularity)
+
+    def calories(foods):
+        return sum(food.calories for food in foods)
+
+    def protein(foods):
+        return sum(food.protein for food in foods)
+
+    def slack(foods):
+        return len(foods) * (granularity - 1)
+
+    for mode in ('hit_both', 'calorie_first'):
+        if exact[mode] is not None:
+            assert protein(approx[mode]) >= protein(exact[mode])
+            assert calories(approx[mode]) <= remaining_calories + slack(approx[mode])
+    assert (approx['protein_first'] is None) == (exact['protein_first'] is None)
+    if exact['protein_first'] is not None:
+        limit = max(remaining_calories, calories(exact['protein_first']))
+        assert protein(approx['protein_first']) >= remaining_protein
+        assert calories(approx['protein_first']) <= limit + slack(approx['protein_first'])
+
+def test_approximate_table_is_smaller():
+    """Test that bucketing calories shrinks the frontier by about the granularity."""
+    rng = random.Random(5)
+    foods = random_catalog(rng, 60, max_calories=600)
+    exact, approx = Frontier(foods, 3000, 150), Frontier(foods, 3000, 150, granularity=10)
+    assert approx.cells * 8 < exact.cells
+
+def test_choose_granularity_fits_latency_budget():
+    """Test that the bucket size grows with the estimated work and stays exact when it fits."""
+    foods = [Food(i, f'Food {i}', 300 + i, 20) for i in range(100)]
+    cells = Frontier.estimate_cells(foods, 3000, 150)
+    assert cells == Frontier(foods, 3000, 150, backend='python').cells
+    # 1 microsecond a cell puts the exact solve at cells / 1000 ms
+    assert choose_granularity(foods, 3000, 150, cells / 1000, cell_seconds=1e-6) == 1
+    assert choose_granularity(foods, 3000, 150, cells / 4000, cell_seconds=1e-6) == 4
+    assert choose_granularity(foods, 3000, 150, 0.001, cell_seconds=1e-6) == recommender.MAX_GRANULARITY
+
+@pytest.mark.parametrize('seed', range(30))
+def test_catalog_state_tables_match_fresh_tables(seed, backend):
+    """Test that tables from kept rows, after additions, removals and eaten foods, match building anew."""
+    rng = random.Random(seed)
+    foods = random_catalog(rng, rng.randint(1, 40))
+    state = CatalogState(foods[:len(foods) // 2], backend=backend, checkpoint_every=rng.randint(1, 8))
+    for food in foods[len(foods) // 2:]:
+        state.add(food)
+    removed = rng.choice(foods)
+    state.remove(removed.id)
+    catalog = [food for food in foods if food is not removed]
+    assert state.matches(catalog)
+
+    for rebuilt in (False, True):
+        if rebuilt:
+            assert state.rebuild()
+            assert state.removed == set()
+        available = [food for food in catalog if rng.random() < 0.7]
+        capacity = rng.randint(0, 1500)
+        table = state.table(available, capacity)
+        expected = knapsack_backend(backend)(available, capacity)
+        assert list(table.best) == list(expected.best)
+        for budget in range(0, capacity + 1, 25):
+            assert table.choose(budget) == expected.choose(budget)
+
+def test_catalog_state_rejects_foods_outside_catalog():
+    """Test that a food list that isn't part of the kept catalog falls back to a fresh table."""
+    foods = [Food(1, 'Oats', 150, 5), Food(2, 'Shake', 120, 24)]
+    state = CatalogState(foods, backend='python')
+    assert state.table([Food(3, 'Tofu', 90, 10)], 300) is None
+    assert state.table(foods[::-1], 300) is None
+    assert state.table(foods, 300, empty_at_zero=False) is None
+    assert recommend(foods[::-1], 300, 20, state=state) == recommend(foods[::-1], 300, 20)
+
+def test_catalog_state_rebuild_yields_to_newer_changes():
+    """Test that a rebuild started before another change leaves the rows alone."""
+    foods = [Food(1, 'Oats', 150, 5), Food(2, 'Shake', 120, 24)]
+    state = CatalogState(foods, backend='python', capacity=400)
+    state.remove(1)
+    original_rows = state._rows
+
+    def rows_then_add(*args):
+        rows = original_rows(*args)
+        state.add(Food(3, 'Tofu', 90, 10))  # lands while the rebuild is computing
+        return rows
+
+    state._rows = rows_then_add
+    assert state.rebuild() is False
+    assert state.catalog() == [foods[1], Food(3, 'Tofu', 90, 10)]
+    assert state.table(state.catalog(), 400).best == KnapsackTable(state.catalog(), 400).best
+
+def test_split_servings_covers_every_count():
+    """Test that binary splitting reaches every half-serving count up to the maximum with few items."""
+    from itertools import combinations
+    food = Food(1, 'Oats', 150, 5)
+    items = split_servings(food, 3)
+    assert [item.servings for item in items] == [0.5, 1.0, 1.5]
+    sums = {sum(item.servings for item in subset) for r in range(len(items) + 1)
+            for subset in combinations(items, r)}
+    assert sums == {0.5 * halves for halves in range(7)}
+    assert len(split_servings(food, 32)) == 7
+    # Calories round up and protein down
+    assert (items[0].calories, items[0].protein) == (75, 2)
+
+@pytest.mark.parametrize('seed', range(15))
+def test_multi_serving_matches_brute_force(seed, backend):
+    """Test calorie_first with servings against every combination of half servings of a small list."""
+    from itertools import product
+    rng = random.Random(seed)
+    # Even calories and protein, so half servings need no rounding
+    foods = [Food(i, f'Food {i}', 2 * rng.randint(10, 200), 2 * rng.randint(0, 20)) for i in range(3)]
+    remaining_calories = rng.randint(0, 1500)
+    result = recommend(foods, remaining_calories, 200, backend=backend, max_servings=2)['calorie_first']
+
+    best = 0
+    for halves in product(range(5), repeat=len(foods)):
+        calories = sum(food.calories * h // 2 for food, h in zip(foods, halves))
+        if calories <= remaining_calories:
+            best = max(best, sum(food.protein * h // 2 for food, h in zip(foods, halves)))
+    assert sum(food.protein for food in result) == best
+    assert sum(food.calories for food in result) <= remaining_calories
+    assert all(0 < food.servings <= 2 and food.servings * 2 == int(food.servings * 2) for food in result)
+
+def test_multi_serving_stays_within_budget():
+    """Test that rounded servings of odd-calorie foods never go over the calories left."""
+    rng = random.Random(11)
+    for _ in range(30):
+        foods = random_catalog(rng, 8)
+        remaining_calories = rng.randint(0, 2000)
+        for mode in ('hit_both', 'calorie_first'):
+            result = recommend(foods, remaining_calories, 50, max_servings=3)[mode]
+            if result:
+                assert sum(food.calories for food in result) <= remaining_calories
+                assert len({food.id for food in result}) == len(result)
+
+@pytest.mark.parametrize('seed', range(20))
+def test_greedy_keeps_mode_rules_and_bound_holds(seed):
+    """Test that greedy answers respect each mode's limits and the fractional bound tops the exact one."""
+    rng = random.Random(seed)
+    foods = random_catalog(rng, rng.randint(0, 14))
+    remaining_calories, remaining_protein = rng.randint(0, 1200), rng.randint(0, 150)
+    greedy = greedy_recommend(foods, remaining_calories, remaining_protein)
+    exact = recommend(foods, remaining_calories, remaining_protein)
+
+    assert sum(food.calories for food in greedy['calorie_first']) <= remaining_calories
+    assert (greedy['protein_first'] is None) == (exact['protein_first'] is None)
+    if greedy['protein_first'] is not None:
+        assert sum(food.protein for food in greedy['protein_first']) >= remaining_protein
+    if greedy['hit_both'] is not None:
+        assert exact['hit_both'] is not None
+    assert fractional_bound(foods, remaining_calories) >= sum(food.protein for food in exact['calorie_first'])
+
+def test_anytime_exact_when_deadline_allows(backend):
+    """Test that a generous deadline gives the exact answer with no gap."""
+    rng = random.Random(2)
+    foods = random_catalog(rng, 12)
+    results, solve = anytime_recommend(foods, 900, 80, deadline_ms=10_000, backend=backend)
+    assert results == recommend(foods, 900, 80, backend=backend)
+    assert (solve.method, solve.exact, solve.gap) == ('exact', True, 0.0)
+
+def test_anytime_falls_back_by_estimated_cost(monkeypatch):
+    """Test the approximate and greedy fallbacks when the exact solve is estimated to overrun."""
+    rng = random.Random(4)
+    foods = random_catalog(rng, 30, max_calories=600)
+    cells = Frontier.estimate_cells(foods, 2000, 120)
+    # 1 microsecond a cell puts the exact solve at cells / 1000 ms
+    monkeypatch.setattr(recommender, 'seconds_per_cell', lambda backend='auto': 1e-6)
+
+    results, solve = anytime_recommend(foods, 2000, 120, deadline_ms=cells / 10_000)
+    assert (solve.method, solve.exact) == ('approximate', False)
+    assert 1 < solve.granularity <= recommender.MAX_GRANULARITY
+    assert results == recommend(foods, 2000, 120, granularity=solve.granularity)
+
+    results, solve = anytime_recommend(foods, 2000, 120, deadline_ms=cells / 1_000_000)
+    assert solve.method == 'greedy'
+    assert results == greedy_recommend(foods, 2000, 120)
+    assert 0 <= solve.gap < 1
+    assert solve.gap == pytest.approx(1 - sum(food.protein for food in results['calorie_first'])
+                                      / fractional_bound(foods, 2000))
+
+@pytest.mark.parametrize('seed', range(40))
+def test_subset_search_matches_knapsack_table(seed):
+    """Test that the subset search gives the DP's best protein, picks, frontier and budget lookups."""
+    rng = random.Random(seed)
+    foods = [food._replace(calories=max(food.calories, 1)) for food in random_catalog(rng, rng.randint(0, 12))]
+    capacity = rng.randint(0, 1500)
+    table, subset = KnapsackTable(foods, capacity), SubsetSearchTable(foods, capacity)
+    assert [subset.best[w] for w in range(capacity + 1)] == list(table.best)
+    assert subset.points(capacity) == table.points(capacity)
+    for budget in range(0, capacity + 1, max(1, capacity // 50)):
+        assert subset.choose(budget) == table.choose(budget)
+    for protein in (0, 10, 60, 500):
+        start = rng.randint(0, capacity)
+        assert subset.first_budget_reaching(protein, start) == table.first_budget_reaching(protein, start)
+
+@pytest.mark.parametrize('seed', range(40))
+def test_subset_search_recommends_like_full_table(seed):
+    """Test that recommendations with the subset search match the original DP, zero-calorie foods included."""
+    rng = random.Random(seed)
+    foods = random_catalog(rng, rng.randint(0, 14))
+    remaining_calories = rng.randint(0, 1200)
+    remaining_protein = rng.randint(0, 150)
+    assert recommend(foods, remaining_calories, remaining_protein, backend='subset', modes=ORIGINAL_MODES) == \
+        reference_recommend(foods, remaining_calories, remaining_protein)
+
+def test_select_table_class_by_catalog_size():
+    """Test that 'auto' searches subsets of short lists and falls back to the DP where that can't or shouldn't."""
+    rng = random.Random(0)
+    short = [Food(i, '', rng.randint(1, 400), rng.randint(0, 40)) for i in range(10)]
+    long = [Food(i, '', rng.randint(1, 400), rng.randint(0, 40)) for i in range(250)]
+    assert select_table_class('auto', short, 1000) is SubsetSearchTable
+    assert select_table_class('auto', long, 1000) is knapsack_backend('auto')
+    assert select_table_class('subset', long, 1000) is SubsetSearchTable
+    # An explicit DP backend, a zero-calorie food or an empty budget keep the DP
+    assert select_table_class('python', short, 1000) is KnapsackTable
+    assert select_table_class('auto', short + [Food(99, '', 0, 5)], 1000) is knapsack_backend('auto')
+    assert select_table_class('auto', short, 0) is knapsack_backend('auto')
+    with pytest.raises(ValueError):
+        SubsetSearchTable([Food(1, '', 0, 5)], 100)
+
+@pytest.mark.parametrize('seed', range(40))
+def test_hit_both_feasible_matches_brute_force(seed, monkeypatch):
+    """Test the bitset pre-check against every subset, and that past its step limit it still never says no wrongly."""
+    rng = random.Random(seed)
+    foods = random_catalog(rng, rng.randint(0, 12))
+    remaining_calories = rng.randint(0, 1200)
+    most = max(sum(food.protein for food in subset)
+               for k in range(len(foods) + 1) for subset in itertools.combinations(foods, k)
+               if sum(food.calories for food in subset) <= remaining_calories)
+    for protein in (0, most // 2, most, most + 1, 2 * most + 1):
+        assert hit_both_feasible(foods, remaining_calories, protein) == (protein <= most)
+    monkeypatch.setattr(recommender, 'BITSET_MAX_STEPS', 0)
+    for protein in (most // 2, most):
+        assert hit_both_feasible(foods, remaining_calories, protein)
+    assert not hit_both_feasible(foods, remaining_calories, 2 * most + 1)
+
+@pytest.mark.parametrize('seed', range(20))
+def test_hit_both_alone_matches_full_recommendation(seed):
+    """Test that asking for hit_both alone gives the same answer as the full frontier."""
+    rng = random.Random(seed)
+    foods = random_catalog(rng, rng.randint(0, 14))
+    remaining_calories, remaining_protein = rng.randint(0, 1200), rng.randint(0, 150)
+    for granularity, max_servings in ((1, None), (7, None), (1, 2)):
+        assert recommend(foods, remaining_calories, remaining_protein, modes=['hit_both'],
+                         granularity=granularity, max_servings=max_servings) == \
+            {'hit_both': recommend(foods, remaining_calories, remaining_protein, granularity=granularity,
+                                   max_servings=max_servings)['hit_both']}
+
+def test_prune_foods_reasons():
+    """Test each reason a food is left out, and that only foods the table can't use are."""
+    foods = [
+        Food(1, 'Chicken', 165, 31),
+        Food(2, 'Chicken again', 165, 31),  # both copies fit in 400 kcal
+        Food(3, 'Chicken third', 165, 31),  # three don't
+        Food(4, 'Cola', 140, 0),
+        Food(5, 'Burrito', 650, 28),
+        Food(6, 'Pasta', 200, 12),  # dominated by the chicken, but they don't all fit with it
+        Food(7, 'Tofu', 90, 10),
+    ]
+    kept, pruned = prune_foods(foods, 400)
+    assert kept == [0, 1, 6]
+    assert pruned == {'over_budget': 1, 'no_protein': 1, 'duplicate': 1, 'dominated': 1}
+    # The leading foods whose rows are shared are kept regardless
+    kept, _ = prune_foods(foods, 400, start=4)
+    assert kept == [0, 1, 2, 3, 6]
+    # Without dominance only foods that can't help on their own go
+    kept, pruned = prune_foods(foods, 400, dominance=False)
+    assert kept == [0, 1, 2, 5, 6] and pruned['duplicate'] == pruned['dominated'] == 0
+
+@pytest.mark.parametrize('seed', range(30))
+def test_pruning_keeps_recommendations_identical(seed, backend, monkeypatch):
+    """Test that recommendations with pruning match those over every food, duplicates and ties included."""
+    rng = random.Random(seed)
+    base = random_catalog(rng, 8, max_calories=300, max_protein=30)
+    # Repeat foods as a real quick add list does
+    foods = [rng.choice(base)._replace(id=i + 1) for i in range(rng.randint(0, 30))]
+    remaining_calories, remaining_protein = rng.randint(0, 1500), rng.randint(0, 150)
+    granularity = rng.choice([1, 1, 5])
+    state = CatalogState(foods, backend=backend) if granularity == 1 and seed % 2 else None
+    eaten = {food.id for food in foods if rng.random() < 0.2}
+    available = [food for food in foods if food.id not in eaten]
+    pruned = Frontier(available, remaining_calories, remaining_protein, backend=backend,
+                      granularity=granularity).pruned
+    results = recommend(available, remaining_calories, remaining_protein, backend=backend, granularity=granularity,
+                        state=state)
+    monkeypatch.setattr(recommender, 'prune_foods',
+                        lambda foods, capacity, **kwargs: (list(range(len(foods))), {}))
+    assert results == recommend(available, remaining_calories, remaining_protein, backend=backend,
+                                granularity=granularity)
+    assert set(pruned) == set(recommender.PRUNE_REASONS)
+
+@pytest.mark.parametrize('seed', range(30))
+def test_top_k_matches_brute_force(seed):
+    """Test each mode's k best distinct sets against ranking every subset, repeated foods included."""
+    rng = random.Random(seed)
+    base = random_catalog(rng, 6, max_calories=300, max_protein=30)
+    foods = [rng.choice(base)._replace(id=i + 1) for i in range(rng.randint(0, 9))]
+    remaining_calories, remaining_protein, k = rng.randint(0, 900), rng.randint(0, 80), rng.randint(1, 5)
+    results = top_k_recommend(foods, remaining_calories, remaining_protein, k)
+
+    _, width = Frontier._width(foods, remaining_calories, remaining_protein)
+    # Repeated foods make the same set, so compare sets by what's in them
+    subsets = {tuple(sorted(food[1:] for food in subset)): subset
+               for n in range(1, len(foods) + 1) for subset in itertools.combinations(foods, n)
+               if sum(food.calories for food in subset) <= width}
+    totals = [(sum(food.calories for food in subset), sum(food.protein for food in subset))
+              for subset in subsets.values()]
+    covers = remaining_calories <= sum(food.calories for food in foods)
+    expected = {
+        'hit_both': sorted(-p for c, p in totals if c <= remaining_calories and p >= remaining_protein),
+        'calorie_first': sorted(-p for c, p in totals if c <= remaining_calories),
+        'protein_first': sorted((max(c, remaining_calories), -p) for c, p in totals
+                                if covers and p >= remaining_protein),
+    }
+    for mode, ranks in expected.items():
+        got = [(sum(food.calories for food in chosen), sum(food.protein for food in chosen))
+               for chosen in results[mode]]
+        if mode == 'protein_first':
+            got = [(max(c, remaining_calories), -p) for c, p in got]
+        else:
+            got = [-p for c, p in got]
+        assert got == ranks[:k]
+    for suggestions in results.values():
+        assert len(suggestions) <= k
+        assert len({tuple(sorted(food[1:] for food in chosen)) for chosen in suggestions}) == len(suggestions)
+
+@pytest.mark.parametrize('seed', range(20))
+def test_top_k_servings_matches_brute_force(seed):
+    """Test that with servings the k best are distinct servings of foods, matching every serving combination."""
+    rng = random.Random(seed)
+    # Even calories and protein, so half servings need no rounding and any split of a count adds up the same
+    foods = [Food(i + 1, f'Food {i}', 2 * rng.randint(10, 150), 2 * rng.randint(0, 15))
+             for i in range(rng.randint(1, 3))]
+    max_servings = rng.choice([1.5, 2, 3])
+    remaining_calories, remaining_protein, k = rng.randint(0, 900), rng.randint(0, 80), rng.randint(1, 6)
+    results = top_k_recommend(foods, remaining_calories, remaining_protein, k, max_servings=max_servings)
+
+    items = [portion for food in foods for portion in split_servings(food, max_servings)]
+    _, width = Frontier._width(items, remaining_calories, remaining_protein)
+    counts = [step * 0.5 for step in range(int(max_servings * 2) + 1)]
+    totals = []
+    for servings in itertools.product(counts, repeat=len(foods)):
+        calories = sum(food.calories * count for food, count in zip(foods, servings))
+        if any(servings) and calories <= width:
+            totals.append((calories, sum(food.protein * count for food, count in zip(foods, servings))))
+    expected = {
+        'hit_both': sorted(-p for c, p in totals if c <= remaining_calories and p >= remaining_protein),
+        'calorie_first': sorted(-p for c, p in totals if c <= remaining_calories),
+    }
+    for mode, ranks in expected.items():
+        assert [-sum(food.protein for food in chosen) for chosen in results[mode]] == ranks[:k]
+    for suggestions in results.values():
+        combinations = {frozenset((food.id, food.servings) for food in chosen) for chosen in suggestions}
+        assert len(combinations) == len(suggestions)
+
+def test_top_k_first_matches_recommend(backend):
+    """Test that without ties the best of the k suggestions is recommend()'s suggestion."""
+    foods = [Food(i + 1, f'Food {i}', 50 + 37 * i, 3 + 7 * i % 23) for i in range(12)]
+    single = recommend(foods, 700, 60, backend=backend)
+    for mode, suggestions in top_k_recommend(foods, 700, 60, 4).items():
+        if single[mode]:
+            assert sorted(suggestions[0]) == sorted(single[mode])
+
+def test_k_best_table_memory_is_bounded():
+    """Test that no cell holds more than k sets, however many foods there are."""
+    foods = [Food(i, '', 10 + i % 17, i % 11) for i in range(60)]
+    table = KBestTable(foods, 300, 3)
+    assert max(len(cell) for cell in table.cells if cell) == 3
+    with pytest.raises(ValueError):
+        KBestTable(foods, 300, 0)
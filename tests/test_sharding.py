@@ -0,0 +1,158 @@
+import pytest
+import sqlite3
+import threading
+import sys
+import os
+
+# Add the parent directory to sys.path to import app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import app as app_module
+from db import ShardRouter, shard_filename, split_into_shards
+from conftest import AJAX
+
+
+@pytest.fixture
+def sharded(app, tmp_path):
+    """Switch the app to one shard file per user for the duration of a test."""
+    app_module.close_db()
+    app.config.update({'DB_SHARD_MODE': 'user', 'DB_SHARD_DIR': str(tmp_path / 'shards')})
+    yield tmp_path / 'shards'
+    app_module.close_db()
+    with app.app_context():
+        app_module.get_shards().close()
+    app_module._shards = None
+    app.config.update({'DB_SHARD_MODE': 'none', 'DB_SHARD_DIR': None})
+
+
+def test_shard_filename_by_mode():
+    """Test that users map to their own file or to a hash bucket."""
+    assert shard_filename(7, 'user') == 'user_7.db'
+    assert shard_filename(7, 'bucket', buckets=4) == shard_filename(3, 'bucket', buckets=4) == 'bucket_0003.db'
+    with pytest.raises(ValueError):
+        shard_filename(7, 'none')
+
+def test_logged_food_goes_to_user_shard(client, auth, app, sharded):
+    """Test that a sharded user's log is written to their shard and read back from it."""
+    auth.login()
+    response = client.post('/log_food', data={'name': 'Apple', 'calories': '95', 'protein': '0', 'servings': '1'},
+                           headers=AJAX)
+    assert response.status_code == 200
+
+    # Nothing was written to the main database
+    main = app.config['DB_CONNECTION']
+    assert main.execute("SELECT COUNT(*) FROM daily_log").fetchone()[0] == 0
+
+    shard = sqlite3.connect(str(sharded / 'user_1.db'))
+    assert shard.execute("SELECT food_name, calories FROM daily_log").fetchall() == [('Apple', 95)]
+    assert shard.execute("SELECT calories FROM daily_totals").fetchone()[0] == 95
+    shard.close()
+
+    stats = client.get('/api/dashboard-stats').get_json()
+    assert stats['stats']['total_calories'] == 95
+    assert [entry['food_name'] for entry in stats['daily_log']] == ['Apple']
+
+def test_sharded_settings_update_goals_and_weight(client, auth, app, sharded):
+    """Test that one request can write the users table and the user's shard."""
+    auth.login()
+    response = client.post('/update_settings', data={'calorie_goal': '2200', 'protein_goal': '130',
+                                                      'current_weight': '81'}, headers=AJAX)
+    assert response.status_code == 200
+
+    main = app.config['DB_CONNECTION']
+    assert main.execute("SELECT calorie_goal FROM users WHERE id = 1").fetchone()[0] == 2200
+    shard = sqlite3.connect(str(sharded / 'user_1.db'))
+    assert shard.execute("SELECT weight FROM weight_logs").fetchone()[0] == 81
+    shard.close()
+
+def test_shard_router_evicts_least_recently_used(tmp_path):
+    """Test that the router keeps at most cache_size shards open, closing the oldest."""
+    router = ShardRouter(str(tmp_path), 'user', cache_size=2, setup=app_module.init_db)
+    first = router.get(1)
+    router.get(2)
+    assert router.get(1) is first  # 1 is now the most recently used
+    router.get(3)
+
+    stats = router.stats()
+    assert stats['open_shards'] == 2
+    assert stats['evictions'] == 1
+    assert stats['hits'] == 1
+    # 2 was evicted; 1 is still cached
+    assert router.get(1) is first
+    assert router.stats()['open_shards'] == 2
+
+    # A connection checked out of an evicted shard is still usable, then closed on release
+    pool, conn = router.acquire(4, 'write')
+    router.get(5)
+    router.get(6)
+    conn.execute("INSERT INTO foods (name, calories, protein, user_id) VALUES ('Rice', 200, 4, 4)")
+    conn.commit()
+    pool.release(conn)
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute("SELECT 1")
+    router.close()
+
+def test_shard_setup_runs_outside_the_router_lock(tmp_path):
+    """Test that setting up a new shard holds up only that shard's requests, and runs once."""
+    release, started = threading.Event(), threading.Event()
+    setups = []
+
+    def slow_setup(path):
+        setups.append(os.path.basename(path))
+        if path.endswith('user_1.db'):
+            started.set()
+            release.wait(timeout=5)
+        app_module.init_db(path)
+
+    router = ShardRouter(str(tmp_path), 'user', setup=slow_setup)
+    opened = []
+    threads = [threading.Thread(target=lambda: opened.append(router.get(1))) for _ in range(2)]
+    try:
+        for thread in threads:
+            thread.start()
+        assert started.wait(timeout=5)
+        # Another user's shard opens while user 1's is still being set up
+        assert router.get(2) is not None
+        assert not release.is_set() and opened == []
+    finally:
+        release.set()
+        for thread in threads:
+            thread.join()
+    assert opened[0] is opened[1]
+    assert sorted(setups) == ['user_1.db', 'user_2.db']
+    router.close()
+
+def test_split_into_shards_copies_each_users_rows(app, tmp_path):
+    """Test that splitting a single-file database copies rows into shards and is safe to re-run."""
+    main = app.config['DB_CONNECTION']
+    main.execute("INSERT INTO users (username, password) VALUES ('second', 'x')")
+    main.executemany("INSERT INTO daily_log (date, food_name, calories, protein, user_id) VALUES (?, ?, ?, ?, ?)",
+                     [('2024-01-01', 'Eggs', 150, 12, 1), ('2024-01-01', 'Toast', 90, 3, 1),
+                      ('2024-01-01', 'Soup', 200, 8, 2)])
+    main.execute("INSERT INTO foods (name, calories, protein, user_id) VALUES ('Eggs', 150, 12, 1)")
+    main.execute("INSERT INTO weight_logs (date, weight, user_id) VALUES ('2024-01-01', 80, 2)")
+    main.commit()
+
+    router = ShardRouter(str(tmp_path), 'bucket', buckets=2, setup=app_module.init_db)
+    copied = split_into_shards(main, router)
+    assert copied == {'foods': 1, 'daily_log': 3, 'daily_summary': 0, 'weight_logs': 1}
+
+    bucket_1 = sqlite3.connect(router.path_for(1))
+    assert bucket_1.execute("SELECT SUM(calories) FROM daily_log WHERE user_id = 1").fetchone()[0] == 240
+    # daily_totals is filled in by the shard's triggers
+    assert bucket_1.execute("SELECT calories, entry_count FROM daily_totals").fetchone() == (240, 2)
+    bucket_1.close()
+    bucket_0 = sqlite3.connect(router.path_for(2))
+    assert bucket_0.execute("SELECT food_name FROM daily_log").fetchall() == [('Soup',)]
+    bucket_0.close()
+
+    # Re-running copies nothing new
+    assert sum(split_into_shards(main, router).values()) == 0
+    # The source database is left as it was
+    assert main.execute("SELECT COUNT(*) FROM daily_log").fetchone()[0] == 3
+    router.close()
+
+def test_split_shards_command_requires_shard_mode(runner, app):
+    """Test that the split-shards command refuses to run when sharding is off."""
+    result = runner.invoke(args=['split-shards'])
+    assert result.exit_code != 0
+    assert 'DB_SHARD_MODE' in result.output
@@ -0,0 +1,94 @@
+import sqlite3
+import sys
+import os
+
+# Add the parent directory to sys.path to import app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import app as app_module
+from recommender import CatalogState, Food, recommend
+from solver_state import SolverStates
+from conftest import AJAX
+
+
+def solver_stats(client):
+    return client.get('/api/recommendation-cache-stats').get_json()['solver_state']
+
+
+def test_states_are_kept_per_user_and_rebuilt_when_stale():
+    """Test that a state is reused for the same catalog and rebuilt when the catalog differs."""
+    states = SolverStates(backend='python', max_users=1)
+    foods = [Food(1, 'Oats', 150, 5), Food(2, 'Shake', 120, 24)]
+    state = states.get(1, foods)
+    assert states.get(1, foods) is state
+    assert states.get(1, foods[:1]) is not state
+    states.get(2, foods)  # evicts user 1
+    assert states.stats()['users'] == 1
+    assert states.stats()['builds'] == 3 and states.stats()['hits'] == 1
+
+def test_removal_rebuilds_in_background():
+    """Test that removing a food is served straight away and the rows drop it after the rebuild."""
+    states = SolverStates(backend='python')
+    foods = [Food(1, 'Oats', 150, 5), Food(2, 'Shake', 120, 24), Food(3, 'Tofu', 90, 10)]
+    state = states.get(1, foods)
+    states.remove_food(1, 2)
+    remaining = [foods[0], foods[2]]
+    assert recommend(remaining, 300, 20, state=states.get(1, remaining)) == recommend(remaining, 300, 20)
+    states.wait()
+    assert state.foods == remaining
+    assert states.get(1, remaining) is state
+    assert states.stats()['background_rebuilds'] == 1
+
+def test_quick_add_updates_state_in_place(client, app, quick_add_foods):
+    """Test that adding a quick add food extends the kept rows instead of rebuilding them."""
+    client.post('/get_recommendations', headers=AJAX)
+    assert solver_stats(client)['builds'] == 1
+
+    client.post('/quick_add_food', data={'name': 'Tofu', 'calories': 90, 'protein': 10}, headers=AJAX)
+    data = client.post('/get_recommendations', headers=AJAX).get_json()
+    stats = solver_stats(client)
+    assert stats['rows_added'] == 1
+    assert (stats['builds'], stats['hits']) == (1, 1)
+    assert 'Tofu' in [food['name'] for food in data['calorie_first']['foods']]
+
+def test_remove_quick_add_food_keeps_state(client, app, quick_add_foods):
+    """Test that removing a quick add food leaves it out without a rebuild on the request path."""
+    client.post('/get_recommendations', headers=AJAX)
+    conn = sqlite3.connect(app_module.DB_PATH)
+    food_id = conn.execute("SELECT id FROM foods WHERE name = 'Chicken Breast'").fetchone()[0]
+    conn.close()
+
+    client.post('/remove_quick_add_food', data={'food_id': food_id}, headers=AJAX)
+    data = client.post('/get_recommendations', headers=AJAX).get_json()
+    app_module.get_solver_states().wait()
+    stats = solver_stats(client)
+    assert stats['removals'] == 1 and stats['builds'] == 1
+    assert 'Chicken Breast' not in [food['name'] for food in data['calorie_first']['foods']]
+
+def test_eaten_foods_served_from_state(client, app, quick_add_foods):
+    """Test that logging food reuses the kept rows and still skips what was eaten."""
+    client.post('/get_recommendations', headers=AJAX)
+    client.post('/log_food', data={'name': 'Rice', 'calories': '200', 'protein': '4', 'servings': '1'},
+                headers=AJAX)
+    data = client.post('/get_recommendations', headers=AJAX).get_json()
+    stats = solver_stats(client)
+    assert (stats['builds'], stats['hits']) == (1, 1)
+    assert 'Rice' not in [food['name'] for food in data['calorie_first']['foods']]
+
+def test_short_list_tables_come_from_state(client, app, auth, monkeypatch):
+    """Test that a list short enough for the subset search still gets its tables from the kept rows."""
+    auth.login()
+    for i in range(25):
+        client.post('/quick_add_food', data={'name': f'Food {i}', 'calories': 60 + 37 * i % 400,
+                                             'protein': 3 + 11 * i % 40}, headers=AJAX)
+    calls = []
+    original = CatalogState.table
+    monkeypatch.setattr(CatalogState, 'table', lambda self, *args, **kwargs: calls.append(args) or
+                        original(self, *args, **kwargs))
+    data = client.post('/get_recommendations', headers=AJAX).get_json()
+    assert calls and data['calorie_first']['foods']
+    # As good as a fresh table's suggestion
+    conn = sqlite3.connect(app_module.DB_PATH)
+    foods = [Food(*row) for row in conn.execute("SELECT id, name, calories, protein FROM foods ORDER BY id")]
+    conn.close()
+    expected = recommend(foods, 2000, 100)['calorie_first']
+    assert data['calorie_first']['total_protein'] == sum(food.protein for food in expected)
@@ -0,0 +1,79 @@
+import pytest
+import sqlite3
+import threading
+import sys
+import os
+
+# Add the parent directory to sys.path to import app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from app import User, get_local_date
+from db import migrate
+from conftest import AJAX
+
+
+def test_migration_removes_duplicate_weight_logs(tmp_path):
+    """Test that migration 3 keeps only the latest weight log per user and day."""
+    conn = sqlite3.connect(str(tmp_path / 'dupes.db'))
+    conn.execute("""CREATE TABLE weight_logs (id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT NOT NULL,
+                    weight REAL NOT NULL, user_id INTEGER NOT NULL)""")
+    # The tables later migrations alter
+    conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT)")
+    conn.execute("CREATE TABLE foods (id INTEGER PRIMARY KEY AUTOINCREMENT)")
+    conn.execute("""CREATE TABLE daily_log (id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT NOT NULL,
+                    calories INTEGER NOT NULL, protein INTEGER NOT NULL, user_id INTEGER NOT NULL)""")
+    conn.execute("""CREATE TABLE daily_totals (user_id INTEGER NOT NULL, date TEXT NOT NULL,
+                    calories INTEGER NOT NULL DEFAULT 0, protein INTEGER NOT NULL DEFAULT 0,
+                    entry_count INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (user_id, date))""")
+    conn.executemany("INSERT INTO weight_logs (date, weight, user_id) VALUES (?, ?, ?)",
+                     [('2024-01-01', 80.0, 1), ('2024-01-01', 79.5, 1), ('2024-01-02', 79.0, 1),
+                      ('2024-01-01', 60.0, 2)])
+    conn.execute("PRAGMA user_version = 2")
+    conn.commit()
+
+    migrate(conn)
+
+    rows = conn.execute("SELECT user_id, date, weight FROM weight_logs ORDER BY user_id, date").fetchall()
+    assert rows == [(1, '2024-01-01', 79.5), (1, '2024-01-02', 79.0), (2, '2024-01-01', 60.0)]
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute("INSERT INTO weight_logs (date, weight, user_id) VALUES (?, ?, ?)", ('2024-01-02', 1.0, 1))
+    conn.close()
+
+def test_concurrent_log_weight_leaves_one_row(app):
+    """Test that many threads logging weight for the same day produce a single row."""
+    user = User(1, 'testuser')
+    errors = []
+
+    def hammer(thread_number):
+        try:
+            for i in range(20):
+                with app.app_context():
+                    user.log_weight(70 + thread_number + i / 100, date='2024-03-01')
+        except Exception as e:  # Collected so the assertion below reports it
+            errors.append(e)
+
+    threads = [threading.Thread(target=hammer, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    c = app.config['DB_CONNECTION'].cursor()
+    c.execute("SELECT COUNT(*) FROM weight_logs WHERE user_id = 1 AND date = '2024-03-01'")
+    assert c.fetchone()[0] == 1
+
+def test_save_summary_twice_updates_in_place(client, auth, app):
+    """Test that saving today's summary again overwrites it instead of failing or duplicating."""
+    auth.login()
+    client.post('/log_food', data={'name': 'Eggs', 'calories': '140', 'protein': '12', 'servings': '1'},
+                headers=AJAX)
+    client.post('/save_summary', headers=AJAX)
+    client.post('/log_food', data={'name': 'Toast', 'calories': '80', 'protein': '3', 'servings': '1'},
+                headers=AJAX)
+    data = client.post('/save_summary', headers=AJAX).get_json()
+    assert data['totals'] == {'calories': 220, 'protein': 15, 'carbs': 0, 'fat': 0}
+
+    c = app.config['DB_CONNECTION'].cursor()
+    c.execute("SELECT COUNT(*), MAX(summary) FROM daily_summary WHERE user_id = 1 AND date = ?",
+              (get_local_date().isoformat(),))
+    assert c.fetchone() == (1, 'Eggs 140 (12), Toast 80 (3)')
@@ -0,0 +1,153 @@
+import pytest
+import sqlite3
+import threading
+import sys
+import os
+
+# Add the parent directory to sys.path to import app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import app as app_module
+from write_queue import GroupCommitWriter
+from conftest import AJAX
+
+INSERT_LOG = "INSERT INTO daily_log (date, food_name, calories, protein, user_id) VALUES (?, ?, ?, ?, ?)"
+
+
+@pytest.fixture
+def writer(app):
+    writer = GroupCommitWriter(app.config['DB_PATH'], max_batch=16, max_delay=0.05).start()
+    yield writer
+    writer.stop()
+
+
+def test_writer_batches_concurrent_writes(app, writer):
+    """Test that concurrent writes are committed together and each gets its own row id."""
+    barrier = threading.Barrier(16)
+    row_ids = []
+
+    def submit(n):
+        barrier.wait()
+        row_ids.append(writer.execute(INSERT_LOG, ('2024-01-01', f'Food {n}', 100, 10, 1), timeout=5))
+
+    threads = [threading.Thread(target=submit, args=(n,)) for n in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(row_ids)) == 16
+    stats = writer.stats()
+    assert stats['rows_committed'] == 16
+    assert stats['batches_committed'] < 16
+    assert stats['max_batch_size'] > 1
+    assert stats['queue_depth'] == 0
+
+    c = app.config['DB_CONNECTION'].cursor()
+    c.execute("SELECT COUNT(*) FROM daily_log WHERE date = '2024-01-01'")
+    assert c.fetchone()[0] == 16
+
+def test_writer_isolates_failing_write(app, writer):
+    """Test that one failing statement doesn't roll back the rest of its batch."""
+    good = writer.submit(INSERT_LOG, ('2024-01-01', 'Good', 100, 10, 1))
+    bad = writer.submit(INSERT_LOG, ('2024-01-01', None, 100, 10, 1))  # food_name is NOT NULL
+    assert good.result(timeout=5) > 0
+    with pytest.raises(sqlite3.IntegrityError):
+        bad.result(timeout=5)
+
+def test_writer_commits_many_rows_whole_or_not_at_all(app, writer):
+    """Test that submit_many's rows land together, and one bad row takes back only its own write."""
+    rows = [('2024-01-02', f'Food {n}', 100, 10, 1) for n in range(3)]
+    good = writer.submit_many(INSERT_LOG, rows)
+    bad = writer.submit_many(INSERT_LOG, rows[:2] + [('2024-01-02', None, 100, 10, 1)])
+    assert len(set(good.result(timeout=5))) == 3
+    with pytest.raises(sqlite3.IntegrityError):
+        bad.result(timeout=5)
+    assert writer.stats()['rows_committed'] == 3
+
+    c = app.config['DB_CONNECTION'].cursor()
+    c.execute("SELECT COUNT(*) FROM daily_log WHERE date = '2024-01-02'")
+    assert c.fetchone()[0] == 3
+
+def test_log_routes_in_write_behind_mode(client, auth, app):
+    """Test that log_food and log_quick_food work through the write-behind writer."""
+    app.config['LOG_WRITE_BEHIND'] = True
+    try:
+        auth.login()
+        response = client.post('/log_food', data={'name': 'Eggs', 'calories': '140', 'protein': '12',
+                                                   'servings': '1'}, headers=AJAX)
+        data = response.get_json()
+        assert data['log_entry']['id'] > 0
+        assert data['totals'] == {'calories': 140, 'protein': 12, 'carbs': 0, 'fat': 0}
+
+        food = client.post('/quick_add_food', data={'name': 'Toast', 'calories': 80, 'protein': 3},
+                           headers=AJAX).get_json()['food']
+        # The test's requests share one app context; hand back the writer quick_add_food
+        # checked out, as the end of a real request would
+        app_module.close_db()
+        response = client.post('/log_quick_food', data={'food_id': food['id']}, headers=AJAX)
+        assert response.get_json()['success'] is True
+
+        stats = client.get('/api/write-queue-stats').get_json()
+        assert stats['enabled'] is True
+        assert stats['rows_committed'] == 2
+    finally:
+        app.config['LOG_WRITE_BEHIND'] = False
+        if app_module._log_writer is not None:
+            app_module._log_writer.stop()
+            app_module._log_writer = None
+
+def test_concurrent_log_routes_share_batches(app):
+    """Test that concurrent log_food requests are committed together, on the app's one writer connection."""
+    app.config.update(LOG_WRITE_BEHIND=True, LOG_BATCH_DELAY_MS=50)
+    clients = [app.test_client() for _ in range(8)]
+    barrier = threading.Barrier(len(clients))
+    errors = []
+
+    def post(client):
+        try:
+            # Each thread's requests get their own app context, as they would in a real server
+            client.post('/login', data={'username': 'testuser', 'password': 'password'}, headers=AJAX)
+            barrier.wait()
+            for _ in range(5):
+                response = client.post('/log_food', data={'name': 'Eggs', 'calories': '140', 'protein': '12',
+                                                          'servings': '1'}, headers=AJAX)
+                assert response.get_json()['success'] is True
+        except Exception as e:  # Collected so the assertion below reports it
+            errors.append(e)
+
+    try:
+        threads = [threading.Thread(target=post, args=(client,)) for client in clients]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert errors == []
+        stats = clients[0].get('/api/write-queue-stats').get_json()
+        assert stats['rows_committed'] == 40
+        assert stats['max_batch_size'] > 1
+        # The writer commits on the pooled writer connection instead of opening its own
+        assert app_module._log_writer.pool is app_module._database.writer
+    finally:
+        app.config.update(LOG_WRITE_BEHIND=False, LOG_BATCH_DELAY_MS=app_module.DEFAULT_MAX_DELAY * 1000)
+        if app_module._log_writer is not None:
+            app_module._log_writer.stop()
+            app_module._log_writer = None
+
+def test_log_meal_plan_is_one_queued_write(client, app, quick_add_foods):
+    """Test that in write-behind mode a planned day is committed as one write, not one per food."""
+    app.config['LOG_WRITE_BEHIND'] = True
+    try:
+        # quick_add_foods left the writer checked out in the test's shared app context
+        app_module.close_db()
+        food_ids = [row[0] for row in app.config['DB_CONNECTION'].execute("SELECT id FROM foods ORDER BY id")]
+        data = client.post('/log_meal_plan', data={'date': '2030-01-02', 'food_id[]': food_ids},
+                           headers=AJAX).get_json()
+        assert data['success'] is True and data['logged'] == len(food_ids)
+        stats = client.get('/api/write-queue-stats').get_json()
+        assert (stats['batches_committed'], stats['max_batch_size']) == (1, 1)
+        assert stats['rows_committed'] == len(food_ids)
+    finally:
+        app.config['LOG_WRITE_BEHIND'] = False
+        if app_module._log_writer is not None:
+            app_module._log_writer.stop()
+            app_module._log_writer = None
@@ -0,0 +1,206 @@
+"""Group-commit writer for food log inserts.
+
+With write-behind enabled, request threads hand their INSERT to a queue and
+block until a single writer thread has committed it. The writer drains the
+queue into batches (up to ``max_batch`` writes, or whatever arrives within
+``max_delay`` seconds of the first write) and commits each batch once, so a
+burst of taps costs one fsync instead of one per request. ``submit_many()``
+queues several rows as one write, which lands whole or not at all.
+
+A write is acknowledged once its batch has committed. How much that commit
+survives is the connection's ``synchronous`` setting: only the ``durable``
+profile (``FULL``) keeps an acknowledged row through a power failure. Under
+``balanced`` (``NORMAL`` in WAL mode) the last commits before a power cut can
+be lost, though not through a crash of the app alone; under ``fast`` (``OFF``)
+even that isn't promised.
+
+Given the app's writer ``ConnectionPool``, the writer checks its one connection
+out for each batch, so queued writes and the routes that write directly still
+share a single writer. Routes must not hold that connection while they wait on
+the queue.
+"""
+import queue
+import sqlite3
+import threading
+import time
+import logging
+from concurrent.futures import Future
+
+from db import apply_pragmas
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BATCH = 64
+DEFAULT_MAX_DELAY = 0.005  # seconds
+
+_STOP = object()
+
+
+class GroupCommitWriter:
+    """A background thread that executes queued writes in batched transactions"""
+
+    def __init__(self, db_path, pragmas=None, max_batch=DEFAULT_MAX_BATCH, max_delay=DEFAULT_MAX_DELAY,
+                 pool=None):
+        self.db_path = db_path
+        self.pragmas = dict(pragmas or {})
+        self.pool = pool
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._rows = 0
+        self._last_batch_size = 0
+        self._max_batch_seen = 0
+        self._commit_ms_total = 0.0
+        self._last_commit_ms = 0.0
+        self._max_commit_ms = 0.0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """Commit everything already queued, then stop the writer thread"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    def submit(self, sql, params=()):
+        """Queue a write; the returned Future resolves to its lastrowid once the batch has committed"""
+        return self._put(sql, [params], many=False)
+
+    def submit_many(self, sql, seq_of_params):
+        """Queue ``sql`` once per params as a single write, all rows committed or none; the Future
+        resolves to their lastrowids"""
+        return self._put(sql, list(seq_of_params), many=True)
+
+    def execute(self, sql, params=(), timeout=None):
+        """Queue a write and wait until its batch has committed; returns its lastrowid"""
+        return self.submit(sql, params).result(timeout)
+
+    def execute_many(self, sql, seq_of_params, timeout=None):
+        """``submit_many()`` and wait until the rows have committed; returns their lastrowids"""
+        return self.submit_many(sql, seq_of_params).result(timeout)
+
+    def _put(self, sql, rows, many):
+        if self._thread is None:
+            raise RuntimeError("Log writer is not running")
+        future = Future()
+        self._queue.put((sql, rows, many, future))
+        return future
+
+    def stats(self):
+        """Queue depth, batch sizes and commit latency for the metrics endpoint"""
+        with self._lock:
+            batches = self._batches
+            return {
+                'queue_depth': self._queue.qsize(),
+                'batches_committed': batches,
+                'rows_committed': self._rows,
+                'last_batch_size': self._last_batch_size,
+                'max_batch_size': self._max_batch_seen,
+                'avg_batch_size': round(self._rows / batches, 2) if batches else 0,
+                'last_commit_ms': round(self._last_commit_ms, 3),
+                'avg_commit_ms': round(self._commit_ms_total / batches, 3) if batches else 0,
+                'max_commit_ms': round(self._max_commit_ms, 3),
+            }
+
+    def _collect_batch(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            if item is _STOP:
+                break
+        return batch
+
+    def _run(self):
+        conn = None
+        if self.pool is None:
+            conn = sqlite3.connect(self.db_path)
+            apply_pragmas(conn, self.pragmas)
+        stopping = False
+        try:
+            while not stopping:
+                batch = self._collect_batch(self._queue.get())
+                if batch[-1] is _STOP:
+                    batch.pop()
+                    stopping = True
+                if not batch:
+                    continue
+                if conn is not None:
+                    self._commit_batch(conn, batch)
+                else:
+                    self._commit_pooled(batch)
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def _commit_pooled(self, batch):
+        """Commit a batch on a connection checked out of the pool for just this batch"""
+        try:
+            conn = self.pool.acquire()
+        except Exception as e:
+            logger.exception("Log writer could not check out a connection for %d rows", len(batch))
+            for *_, future in batch:
+                future.set_exception(e)
+            return
+        try:
+            self._commit_batch(conn, batch)
+        finally:
+            self.pool.release(conn)
+
+    def _commit_batch(self, conn, batch):
+        start = time.perf_counter()
+        results = []
+        try:
+            conn.execute("BEGIN")
+            for sql, rows, many, future in batch:
+                # A savepoint per write keeps one bad write from failing the rest of the batch,
+                # and takes all of a write's rows back together
+                conn.execute("SAVEPOINT queued_write")
+                try:
+                    row_ids = [conn.execute(sql, params).lastrowid for params in rows]
+                    conn.execute("RELEASE queued_write")
+                    results.append((future, row_ids if many else row_ids[0], len(rows), None))
+                except sqlite3.Error as e:
+                    conn.execute("ROLLBACK TO queued_write")
+                    conn.execute("RELEASE queued_write")
+                    results.append((future, None, 0, e))
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.exception("Log writer failed to commit a batch of %d writes", len(batch))
+            if conn.in_transaction:
+                conn.rollback()
+            for *_, future in batch:
+                future.set_exception(e)
+            return
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self._batches += 1
+            self._rows += sum(rows for _, _, rows, _ in results)
+            self._last_batch_size = len(batch)
+            self._max_batch_seen = max(self._max_batch_seen, len(batch))
+            self._commit_ms_total += elapsed_ms
+            self._last_commit_ms = elapsed_ms
+            self._max_commit_ms = max(self._max_commit_ms, elapsed_ms)
+
+        # Acknowledge only after the commit, so a request never reports a row that could be rolled back
+        for future, result, _, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)